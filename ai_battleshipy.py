@@ -0,0 +1,193 @@
+import random
+from board_battleshipy import BOARD_SIZE, cell_bit, mask_cells
+from fleet_battleshipy import fleet_sampler
+from rules_battleshipy import DEFAULT_RULESET
+
+# Níveis de dificuldade: quanto da frota restante entra na busca
+#   easy   - caça aleatória e tiros nos vizinhos de um acerto
+#   medium - densidade de probabilidade só do maior navio restante
+#   hard   - densidade de todos os navios restantes
+DIFFICULTIES = ('easy', 'medium', 'hard')
+DEFAULT_DIFFICULTY = 'hard'
+
+
+def _neighbor_mask(index, board_size):
+    x, y = divmod(index, board_size)
+    mask = 0
+    for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+        if 0 <= nx < board_size and 0 <= ny < board_size:
+            mask |= cell_bit(nx, ny, board_size)
+    return mask
+
+
+_NEIGHBORS = {}
+
+
+def neighbor_masks(board_size=BOARD_SIZE):
+    """Vizinhos ortogonais de cada célula, calculados uma vez por tamanho"""
+    table = _NEIGHBORS.get(board_size)
+    if table is None:
+        table = _NEIGHBORS[board_size] = [_neighbor_mask(i, board_size)
+                                          for i in range(board_size * board_size)]
+    return table
+
+NEIGHBORS = neighbor_masks()
+
+
+def counter_add(planes, mask, weight=1):
+    """Soma `weight` às células de `mask` em contadores fatiados por bit.
+
+    planes[k] guarda o bit k do contador de todas as 100 células, então
+    uma soma é um ripple-carry de poucas operações em inteiros, não 100.
+    """
+    shift = 0
+    while weight:
+        if weight & 1:
+            while len(planes) < shift:
+                planes.append(0)
+            carry = mask
+            k = shift
+            while carry:
+                if k == len(planes):
+                    planes.append(carry)
+                    break
+                plane = planes[k]
+                planes[k] = plane ^ carry
+                carry &= plane
+                k += 1
+        weight >>= 1
+        shift += 1
+
+
+def counter_argmax(planes, candidates):
+    """Células de `candidates` com o maior contador, do bit mais alto ao mais baixo"""
+    for plane in reversed(planes):
+        if candidates & plane:
+            candidates &= plane
+    return candidates
+
+
+class AIPlayer:
+    """Escolhe tiros a partir do que take_shot revelou: águas, acertos e afundados"""
+    __slots__ = ('difficulty', 'random', 'ruleset', 'all_cells', 'neighbors', 'placements',
+                 'shot_mask', 'hit_mask', 'sunk_mask', 'remaining', 'candidates')
+
+    def __init__(self, difficulty=DEFAULT_DIFFICULTY, seed=None, ruleset=DEFAULT_RULESET):
+        if difficulty not in DIFFICULTIES:
+            raise ValueError(f"dificuldade desconhecida: {difficulty}")
+        if ruleset.sparse:
+            raise ValueError("a IA só joga em tabuleiros densos")
+        self.difficulty = difficulty
+        self.random = random.Random(seed)
+        self.ruleset = ruleset
+        size = ruleset.board_size
+        self.all_cells = (1 << size * size) - 1
+        self.neighbors = neighbor_masks(size)
+        self.placements = fleet_sampler(ruleset).placements
+        self.reset()
+
+    def reset(self):
+        self.shot_mask = 0
+        self.hit_mask = 0   # Acertos em navios ainda não afundados
+        self.sunk_mask = 0
+        self.remaining = list(self.ruleset.ship_sizes)
+        # Posicionamentos de cada tamanho ainda consistentes com as águas e afundados
+        self.candidates = dict(self.placements)
+
+    def observe(self, x, y, result, ship_size=None):
+        """Registra o resultado de um tiro nosso"""
+        bit = cell_bit(x, y, self.ruleset.board_size)
+        self.shot_mask |= bit
+        if result == 'erro':
+            self._exclude(bit)
+        elif result == 'acerto':
+            self.hit_mask |= bit
+        elif result == 'afundado':
+            self.hit_mask |= bit
+            self._sink(bit, ship_size)
+
+    def load(self, misses, hits, sunk):
+        """Memória refeita de uma vez a partir do tabuleiro do oponente.
+
+        Usado ao restaurar um snapshot: águas e acertos como máscaras e os
+        navios afundados como (máscara, tamanho); um único _exclude no lugar
+        de um por tiro.
+        """
+        self.reset()
+        self.hit_mask = hits
+        for mask, size in sunk:
+            self.sunk_mask |= mask
+            if size in self.remaining:
+                self.remaining.remove(size)
+        self.shot_mask = misses | hits | self.sunk_mask
+        self._exclude(misses | self.sunk_mask)
+
+    def _sink(self, bit, size):
+        # O navio afundado é um posicionamento do tamanho dele que passa pelo
+        # último tiro e só cobre acertos; qualquer um serve quando há empate
+        cells = bit
+        for mask in self.candidates.get(size, ()):
+            if mask & bit and not mask & ~self.hit_mask:
+                cells = mask
+                break
+        self.hit_mask &= ~cells
+        self.sunk_mask |= cells
+        if size in self.remaining:
+            self.remaining.remove(size)
+        self._exclude(cells)
+
+    def _exclude(self, blocked):
+        self.candidates = {size: [m for m in masks if not m & blocked]
+                           for size, masks in self.candidates.items()}
+
+    def next_shot(self):
+        """Próximo tiro (x, y)"""
+        open_cells = self.all_cells & ~self.shot_mask
+        if self.difficulty == 'easy':
+            best = self._hunt_target(open_cells)
+        else:
+            sizes = self.remaining
+            if self.difficulty == 'medium' and sizes:
+                sizes = [max(sizes)]
+            best = self._density(sizes, open_cells)
+        return self._pick(best or open_cells)
+
+    def _hunt_target(self, open_cells):
+        targets = 0
+        hits = self.hit_mask
+        while hits:
+            low = hits & -hits
+            targets |= self.neighbors[low.bit_length() - 1]
+            hits ^= low
+        return targets & open_cells
+
+    def _density(self, sizes, open_cells):
+        """Conta, por célula, os posicionamentos legais dos navios restantes"""
+        planes = []
+        hits = self.hit_mask
+        for size in set(sizes):
+            copies = sizes.count(size)
+            for mask in self.candidates[size]:
+                if hits:
+                    # Modo alvo: só posicionamentos que explicam os acertos
+                    overlap = mask & hits
+                    if not overlap:
+                        continue
+                    counter_add(planes, mask, copies * bin(overlap).count('1'))
+                else:
+                    counter_add(planes, mask, copies)
+        return counter_argmax(planes, open_cells)
+
+    def _pick(self, cells):
+        size = self.ruleset.board_size
+        if bin(cells).count('1') * 2 >= size * size:
+            # Caça com metade ou mais do tabuleiro livre: sortear células até
+            # cair numa candidata custa menos de dois sorteios, listar todas
+            # custa um laço por célula
+            randrange = self.random.randrange
+            while True:
+                index = randrange(size * size)
+                if cells >> index & 1:
+                    return divmod(index, size)
+        options = mask_cells(cells, size)
+        return tuple(self.random.choice(options))
@@ -0,0 +1,838 @@
+import subprocess
+import argparse
+import time
+import sys
+import os
+import timeit
+import random
+import tracemalloc
+import selectors
+import multiprocessing
+import tempfile
+import glob
+import logging
+from protocol_battleshipy import PROTOCOL_JSON, PROTOCOL_BINARY, SUPPORTED_PROTOCOLS, decode, encode
+from bot_battleshipy import (
+    FLEET, BotClient, run_load, run_load_parallel, percentile, raise_fd_limit,
+)
+from ai_battleshipy import AIPlayer, DIFFICULTIES
+from fleet_battleshipy import random_fleet, fleet_positions, sample_fleets, random_fleet_positions
+from rules_battleshipy import RULESETS
+from server_battleshipy import Player, Match, BattleShipServer, make_player
+from snapshot_battleshipy import Snapshotter
+from journal_battleshipy import JournalReader
+from replay_battleshipy import Replay, state_at
+from matchmaking_battleshipy import Matchmaker
+from metrics_battleshipy import query_stats
+from log_battleshipy import log, parse_sample
+
+def spawn_server(port, extra_args):
+    """Sobe o servidor em outro processo para não disputar o GIL com a carga"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.join(here, 'server_battleshipy.py'),
+               '--port', str(port), '--log-level', 'WARNING'] + list(extra_args)
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.5)
+    return process
+
+
+def print_report(label, report):
+    print(f"{label:>12}: {report['msgs_per_sec']:9.0f} msg/s  "
+          f"p50 {report['p50_ms']:6.2f} ms  p99 {report['p99_ms']:6.2f} ms  "
+          f"{report['games_per_sec']:6.1f} jogos/s  perdidas {report['dropped']}  "
+          f"atrasadas {report['late']}")
+
+
+def bench_modes(args):
+    """Compara o _listen com threads contra o modo asyncio"""
+    for mode in args.modes:
+        process = spawn_server(args.port, ['--mode', mode])
+        try:
+            report = run_load(('127.0.0.1', args.port), args.matches, args.duration,
+                              protocol=args.protocol)
+        finally:
+            process.terminate()
+            process.wait()
+        print_report(mode, report)
+
+
+def spawn_proxy(listen_port, server_port, loss):
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.join(here, 'reliable_battleshipy.py'),
+               '--listen-port', str(listen_port), '--server-port', str(server_port),
+               '--loss', str(loss), '--seed', '1']
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.3)
+    return process
+
+
+def bench_reliability(args):
+    """Partidas através do proxy com perdas, com e sem a camada confiável"""
+    for reliable in (False, True):
+        # Servidor e proxy novos a cada rodada: portas efêmeras podem ser reusadas
+        server = spawn_server(args.port, ['--mode', 'async'])
+        proxy = spawn_proxy(args.port + 100, args.port, args.loss)
+        try:
+            report = run_load(('127.0.0.1', args.port + 100), args.matches, args.duration,
+                              timeout=args.timeout, reliable=reliable)
+        finally:
+            proxy.terminate()
+            server.terminate()
+            proxy.wait()
+            server.wait()
+        print_report('confiável' if reliable else 'sem camada', report)
+
+
+def bench_shards(args):
+    """Vazão do servidor com 1..N processos na mesma porta"""
+    for processes in args.processes:
+        process = spawn_server(args.port, ['--mode', args.mode,
+                                           '--processes', str(processes)])
+        try:
+            report = run_load_parallel(('127.0.0.1', args.port), args.matches,
+                                       args.duration, args.clients,
+                                       protocol=args.protocol)
+        finally:
+            process.terminate()
+            process.wait()
+        print_report(f"{processes} proc", report)
+
+
+def watch_matches(server_addr, watchers, matches, duration):
+    """`watchers` espectadores divididos entre as partidas; devolve datagramas recebidos"""
+    raise_fd_limit(watchers + 64)
+    time.sleep(0.5)  # Os bots entram nas partidas 1..matches antes de começar
+    selector = selectors.DefaultSelector()
+    clients = []
+    for i in range(watchers):
+        client = BotClient(server_addr)
+        client.spectate(i % matches + 1)
+        challenge = client.wait_for(('spectate_success',))
+        client.spectate(i % matches + 1, nonce=challenge.get('nonce'))
+        selector.register(client.sock, selectors.EVENT_READ, client)
+        clients.append(client)
+    received = 0
+    deadline = time.perf_counter() + duration - 0.5
+    while time.perf_counter() < deadline:
+        for key, _ in selector.select(timeout=0.05):
+            while True:
+                try:
+                    key.data.sock.recv(65535)
+                except BlockingIOError:
+                    break
+                received += 1
+    for client in clients:
+        selector.unregister(client.sock)
+        client.close()
+    selector.close()
+    return received
+
+
+def bench_spectators(args):
+    """Latência dos jogadores com e sem milhares de espectadores nas partidas"""
+    server_addr = ('127.0.0.1', args.port)
+    for watchers in (0, args.spectators):
+        server = spawn_server(args.port, ['--mode', 'async'])
+        pool = multiprocessing.Pool(1)
+        try:
+            load = pool.apply_async(run_load, (server_addr, args.matches, args.duration))
+            received = watch_matches(server_addr, watchers, args.matches, args.duration)
+            report = load.get()
+        finally:
+            pool.close()
+            server.terminate()
+            server.wait()
+        print_report(f"{watchers} espect.", report)
+        if watchers:
+            print(f"{'':>12}  {received / args.duration:9.0f} datagramas/s para os espectadores")
+
+
+def bench_journal(args):
+    """Custo do diário no servidor e tempo de seek vs replay desde o início"""
+    server_addr = ('127.0.0.1', args.port)
+    with tempfile.TemporaryDirectory() as directory:
+        for label, extra in (('sem diário', []), ('com diário', ['--journal', directory])):
+            server = spawn_server(args.port, ['--mode', 'async'] + extra)
+            try:
+                report = run_load(server_addr, args.matches, args.duration)
+            finally:
+                server.terminate()
+                server.wait()
+            print_report(label, report)
+
+        path = max(glob.glob(os.path.join(directory, '*.bsj')), key=os.path.getsize)
+        with JournalReader(path) as reader:
+            rng = random.Random(1)
+            targets = [rng.randrange(len(reader) + 1) for _ in range(args.seeks)]
+            started = time.perf_counter()
+            for index in targets:
+                state_at(reader, index)
+            seek = (time.perf_counter() - started) / len(targets)
+            started = time.perf_counter()
+            for index in targets:
+                replay = Replay(reader.ruleset)
+                for event in reader.events(0, index):
+                    replay.apply(*event)
+            full = (time.perf_counter() - started) / len(targets)
+            print(f"📼 {len(reader)} eventos, {len(reader.checkpoints)} checkpoints: "
+                  f"seek {seek * 1000:.2f} ms, replay do início {full * 1000:.2f} ms")
+
+
+def flood(server_addr, rate, duration, sources):
+    """Lixo (tiros de quem não está em partida) a `rate` datagramas/s de `sources` portas"""
+    import socket
+    socks = []
+    for _ in range(sources):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        socks.append(sock)
+    junk = encode({'type': 'shoot', 'x': 1, 'y': 1})
+    started = time.perf_counter()
+    sent = 0
+    while True:
+        elapsed = time.perf_counter() - started
+        if elapsed >= duration:
+            break
+        # Ritmo em lotes de 1 ms: o que faltou até agora
+        for _ in range(int(elapsed * rate) - sent):
+            try:
+                socks[sent % sources].sendto(junk, server_addr)
+            except OSError:
+                pass
+            sent += 1
+        time.sleep(0.001)
+    for sock in socks:
+        sock.close()
+
+
+def bench_overload(args):
+    """Latência das partidas normais sob uma enxurrada de N vezes o tráfego delas"""
+    server_addr = ('127.0.0.1', args.port)
+    server = spawn_server(args.port, [])
+    try:
+        baseline = run_load(server_addr, args.matches, args.duration)
+    finally:
+        server.terminate()
+        server.wait()
+    print_report('normal', baseline)
+    rate = baseline['msgs_per_sec'] * args.factor
+    print(f"🌊 Enxurrada de {rate:.0f} datagramas/s ({args.factor:g}x)")
+
+    scenarios = [('1 origem', 1, []), (f"{args.sources} origens", args.sources, []),
+                 ('sem limite', 1, ['--rate-scale', '0'])]
+    for label, sources, extra in scenarios:
+        server = spawn_server(args.port, extra)
+        flooder = multiprocessing.Process(target=flood, daemon=True,
+                                          args=(server_addr, rate, args.duration + 1.0, sources))
+        try:
+            flooder.start()
+            time.sleep(0.5)
+            report = run_load(server_addr, args.matches, args.duration)
+        finally:
+            flooder.terminate()
+            flooder.join()
+            server.terminate()
+            server.wait()
+        print_report(label, report)
+
+
+def synthetic_matches(server, count, ai_share, rng):
+    """Partidas em andamento com frotas e tiros aleatórios, sem rede"""
+    for match_id in range(1, count + 1):
+        match = Match(match_id)
+        ai = rng.random() < ai_share
+        for player_id in (1, 2):
+            if ai and player_id == 2:
+                match.ai = AIPlayer(ruleset=match.ruleset)
+                match.ai_addr = addr = ('ai', match_id)
+            else:
+                addr = ('127.0.0.1', 20000 + 2 * match_id + player_id)
+            player = make_player(addr, player_id, f"{match_id}-{player_id}", match.ruleset)
+            player.place_ships(random_fleet_positions(match.ruleset, rng))
+            for index in rng.sample(range(100), rng.randrange(60)):
+                player.take_shot(*divmod(index, 10))
+            match.players[addr] = player
+            if addr != match.ai_addr:
+                server.addr_matches[addr] = match
+        match.game_state = 'playing'
+        server.matches[match_id] = match
+    server.next_match_id = count + 1
+
+
+def bench_snapshot(args):
+    """Snapshot de N partidas: passada completa, passada incremental e carga"""
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'matches.bss')
+        server = BattleShipServer(port=0)
+        synthetic_matches(server, args.matches, args.ai, rng)
+        snapshotter = Snapshotter(server, path)
+        started = time.perf_counter()
+        snapshotter.snapshot()
+        full = time.perf_counter() - started
+        changed = rng.sample(list(server.matches.values()), max(1, args.matches // 100))
+        for match in changed:
+            match.current_turn = 3 - match.current_turn
+            match.version += 1
+        started = time.perf_counter()
+        encoded = snapshotter.snapshot()
+        incremental = time.perf_counter() - started
+        print(f"💾 {args.matches} partidas, {os.path.getsize(path) / 1024:.0f} KiB: "
+              f"completo {full * 1000:.0f} ms, incremental ({encoded} alteradas) "
+              f"{incremental * 1000:.0f} ms")
+
+        times = []
+        for _ in range(args.repeat):
+            restored = BattleShipServer(port=0)
+            started = time.perf_counter()
+            restored.restore_snapshot(path)
+            times.append(time.perf_counter() - started)
+            restored.sock.close()
+        server.sock.close()
+        print(f"🔁 Carga: {min(times) * 1000:.0f} ms (melhor de {args.repeat}), "
+              f"{len(restored.matches)} partidas e {len(restored.addr_matches)} jogadores")
+
+
+def bench_matchmaking(args):
+    """Fila ranqueada: custo por operação com N na fila e espera até o pareamento"""
+    rng = random.Random(1)
+    print(f"{'na fila':>8} {'entrada':>9} {'par':>9} {'pares':>7} {'espera p50':>11} "
+          f"{'p99':>7} {'diferença':>10}")
+    for size in args.players:
+        # Janela nula no início: todos ficam na fila e os pares só se formam
+        # conforme as janelas crescem, em relógio simulado
+        matchmaker = Matchmaker(window_base=0.0, window_growth=args.growth, ttl=1e9)
+        ratings = [rng.gauss(1500, 350) for _ in range(size)]
+        started = time.perf_counter()
+        for i, rating in enumerate(ratings):
+            matchmaker.enqueue(i, f"p{i}", rating, 'classic', None, 0.0)
+        enqueue = (time.perf_counter() - started) / size
+        queued = len(matchmaker)
+        gaps = []
+        waits = []
+        now = 0.0
+        started = time.perf_counter()
+        while len(matchmaker) > 1 and now < args.horizon:
+            now += args.tick
+            pairs, _ = matchmaker.due(now)
+            for first, second in pairs:
+                gaps.append(abs(first.rating - second.rating))
+                waits.append(now)
+        elapsed = time.perf_counter() - started
+        per_pair = elapsed / max(1, len(gaps))
+        print(f"{queued:>8} {enqueue * 1e6:7.1f}µs {per_pair * 1e6:7.1f}µs {len(gaps):>7} "
+              f"{percentile(waits, 50):10.1f}s {percentile(waits, 99):6.1f}s "
+              f"{sum(gaps) / max(1, len(gaps)):10.1f}")
+    
+    # Chegadas contínuas com a janela padrão: espera real até o pareamento
+    matchmaker = Matchmaker()
+    now = 0.0
+    step = 1.0 / args.rate
+    peak = 0
+    started = time.perf_counter()
+    for i in range(args.rate * 10):
+        now += step
+        matchmaker.enqueue(i, f"p{i}", rng.gauss(1500, 350), 'classic', None, now)
+        matchmaker.due(now)
+        peak = max(peak, len(matchmaker))
+    elapsed = time.perf_counter() - started
+    wait = matchmaker.waits.summary()
+    print(f"⏱️ {args.rate} chegadas/s por 10s: {elapsed / (args.rate * 10) * 1e6:.1f} µs por "
+          f"chegada, pico de {peak} na fila, espera p50 {wait['p50'] / 1000:.0f} ms, "
+          f"p99 {wait['p99'] / 1000:.0f} ms, máx {wait['max'] / 1000:.0f} ms")
+
+
+# Mensagens representativas de cada direção do protocolo
+SAMPLE_MESSAGES = [
+    {'type': 'shoot', 'x': 3, 'y': 7, 'match_id': 1234},
+    {'type': 'place_ships', 'ships': FLEET, 'match_id': 1234},
+    {'type': 'shot_result', 'x': 3, 'y': 7, 'result': 'afundado', 'ship_id': 2,
+     'ship_name': 'Cruzador', 'ship_size': 3, 'shooter': 1, 'current_turn': 1},
+    {'type': 'game_begin', 'turn': 1},
+    {'type': 'error', 'code': 5},
+]
+
+
+def bench_protocol(args):
+    """Bytes por datagrama e custo de codificar/decodificar: JSON vs binário"""
+    print(f"{'mensagem':>12} {'protocolo':>9} {'bytes':>6} {'encode µs':>10} {'decode µs':>10}")
+    for message in SAMPLE_MESSAGES:
+        for protocol in (PROTOCOL_JSON, PROTOCOL_BINARY):
+            data = encode(message, protocol)
+            encode_us = min(timeit.repeat(lambda: encode(message, protocol),
+                                          number=args.number, repeat=3)) / args.number * 1e6
+            decode_us = min(timeit.repeat(lambda: decode(data),
+                                          number=args.number, repeat=3)) / args.number * 1e6
+            print(f"{message['type']:>12} {protocol:>9} {len(data):>6} "
+                  f"{encode_us:>10.2f} {decode_us:>10.2f}")
+
+
+def bench_ai(args):
+    """Custo por jogada e tiros por partida de cada nível da IA"""
+    print(f"{'nível':>8} {'tiros/jogo':>10} {'µs/jogada':>10} {'p99 µs':>8}")
+    for difficulty in args.difficulties:
+        ai = AIPlayer(difficulty, seed=1)
+        rng = random.Random(2)
+        timings = []
+        shots = 0
+        for _ in range(args.games):
+            target = Player(None, 1)
+            target.place_ships(fleet_positions(random_fleet(rng)))
+            ai.reset()
+            while not target.has_lost():
+                started = time.perf_counter()
+                x, y = ai.next_shot()
+                result, ship = target.take_shot(x, y)
+                ai.observe(x, y, result, ship.size if ship else None)
+                timings.append(time.perf_counter() - started)
+                shots += 1
+        print(f"{difficulty:>8} {shots / args.games:>10.1f} "
+              f"{sum(timings) / len(timings) * 1e6:>10.1f} {percentile(timings, 99) * 1e6:>8.1f}")
+
+
+def bench_fleets(args):
+    """Frotas uniformes por segundo: uma a uma e em lote"""
+    rng = random.Random(1)
+    started = time.perf_counter()
+    for _ in range(args.count // 10):
+        random_fleet(rng)
+    single = args.count // 10 / (time.perf_counter() - started)
+    started = time.perf_counter()
+    sample_fleets(args.count, rng)
+    bulk = args.count / (time.perf_counter() - started)
+    print(f"random_fleet: {single:10.0f} frotas/s")
+    print(f"sample_fleets: {bulk:9.0f} frotas/s")
+
+
+def bench_rules(args):
+    """Memória do tabuleiro e custo por tiro de cada ruleset"""
+    print(f"{'regras':>8} {'tabuleiro':>11} {'navios':>6} {'KiB':>8} {'posicionar ms':>13} "
+          f"{'µs/tiro':>8}")
+    rng = random.Random(1)
+    for name in args.rules:
+        ruleset = RULESETS[name]
+        fleet = random_fleet_positions(ruleset, rng)
+        tracemalloc.start()
+        started = time.perf_counter()
+        target = make_player(None, 1, ruleset=ruleset)
+        target.place_ships(fleet)
+        placed = time.perf_counter() - started
+        n = ruleset.board_size
+        shots = min(args.shots, n * n)
+        cells = set()
+        while len(cells) < shots:
+            cells.add((rng.randrange(n), rng.randrange(n)))
+        started = time.perf_counter()
+        for x, y in cells:
+            target.take_shot(x, y)
+        per_shot = (time.perf_counter() - started) / shots
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:>8} {f'{n}x{n}':>11} {len(ruleset.ship_sizes):>6} {peak / 1024:>8.0f} "
+              f"{placed * 1000:>13.2f} {per_shot * 1e6:>8.2f}")
+
+
+def bench_render(args):
+    """Tempo de quadro do BoardRenderer ao longo de partidas simuladas"""
+    import tkinter as tk
+    from client_battleshipy import COLORS, BoardRenderer
+    from core_battleshipy import FrameTimer
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"❌ Sem display para o tkinter: {e}")
+        return
+    canvas = tk.Canvas(root, width=350, height=350, bg=COLORS['bg'])
+    canvas.pack()
+    rng = random.Random(1)
+    for label, full in (('incremental', False), ('repintando tudo', True)):
+        renderer = BoardRenderer(canvas, COLORS, show_ships=True)
+        timer = FrameTimer()
+        for _ in range(args.games):
+            target = Player(None, 1)
+            target.place_ships(fleet_positions(random_fleet(rng)))
+            for x, y in rng.sample([(x, y) for x in range(10) for y in range(10)], 100):
+                target.take_shot(x, y)
+                started = time.perf_counter()
+                if full:
+                    renderer.invalidate()
+                changed = renderer.update(target.board)
+                root.update_idletasks()
+                timer.record(time.perf_counter() - started, changed)
+        print(f"{label:>16}: {timer.summary()}")
+    root.destroy()
+
+
+def bench_ui(args):
+    """Cliente tkinter sob rajadas de shot_result: quadros e espera até a tela"""
+    import threading
+    import tkinter as tk
+    from client_battleshipy import PixelArtBattleship
+    try:
+        # Ninguém escuta na porta: o join se perde e as mensagens vêm do bench
+        game = PixelArtBattleship(('127.0.0.1', args.port), frame_stats=True)
+    except tk.TclError as e:
+        print(f"❌ Sem display para o tkinter: {e}")
+        return
+    game.player_id = 1
+    game.game_state = "playing"
+    cells = [(x, y) for x in range(10) for y in range(10)]
+
+    def feed():
+        started = time.perf_counter()
+        for i in range(args.messages):
+            x, y = cells[i % len(cells)]
+            lap = i // len(cells)
+            game.deliver({'type': 'shot_result', 'x': x, 'y': y,
+                          'result': 'acerto' if lap % 2 else 'erro', 'ship_name': 'Cruzador',
+                          'shooter': 1 + lap // 2 % 2, 'current_turn': 1})
+            if i % args.burst == args.burst - 1:
+                time.sleep(args.gap)
+        elapsed = time.perf_counter() - started
+        print(f"📨 {args.messages} mensagens em rajadas de {args.burst}: "
+              f"{args.messages / elapsed:.0f}/s")
+        game.root.after(500, game.root.quit)
+
+    threading.Thread(target=feed, daemon=True).start()
+    game.root.mainloop()
+    print(game.frame_timer.summary())
+    game.root.destroy()
+
+
+def play_ai_games(server_addr, games, difficulty):
+    """Partidas de um bot contra a IA do servidor.
+
+    Devolve os segundos de cada tiro até a vez voltar e os datagramas e
+    mensagens recebidos pelo bot.
+    """
+    rng = random.Random(1)
+    ruleset = RULESETS['classic']
+    shots = []
+    datagrams = messages = 0
+    for _ in range(games):
+        bot = BotClient(server_addr)
+        try:
+            bot.join(ai=difficulty)
+            bot.wait_for(('join_success',))
+            bot.place_ships(random_fleet_positions(ruleset, rng))
+            turn = bot.wait_for(('game_begin',))['turn']
+            cells = iter(rng.sample([(x, y) for x in range(10) for y in range(10)], 100))
+            while True:
+                if turn == bot.player_id:
+                    sent_at = time.perf_counter()
+                    bot.shoot(*next(cells))
+                message = bot.wait_for(('shot_result',))
+                if message.get('type') == 'error':
+                    raise RuntimeError(f"tiro recusado: {message}")
+                if message.get('game_over'):
+                    break
+                turn = message['current_turn']
+                if turn == bot.player_id:
+                    # A vez voltou: o resultado e a rodada inteira da IA já chegaram
+                    shots.append(time.perf_counter() - sent_at)
+        finally:
+            datagrams += bot.datagrams
+            messages += bot.messages
+            bot.close()
+    return shots, datagrams, messages
+
+
+def bench_batching(args):
+    """Lotes de saída: datagramas enviados por mensagem e latência, por janela"""
+    server_addr = ('127.0.0.1', args.port)
+    for window in args.windows:
+        extra = [] if window == 'off' else ['--batch-window', window]
+        label = 'sem lotes' if window == 'off' else f"janela {window} ms"
+        server = spawn_server(args.port, extra)
+        try:
+            report = run_load(server_addr, args.matches, args.duration)
+            shots, datagrams, messages = play_ai_games(server_addr, args.ai_games, args.ai)
+            counters = query_stats(server_addr)['counters']
+        finally:
+            server.terminate()
+            server.wait()
+        sent = counters['datagrams_sent']
+        frames = sent - counters['batches_sent'] + counters['messages_batched']
+        print_report(label, report)
+        print(f"{'':>12}  {sent} datagramas para {frames} mensagens "
+              f"({frames / max(1, sent):.2f} por datagrama), {counters['batches_sent']} lotes")
+        print(f"{'contra a IA':>12}: {messages / max(1, datagrams):.2f} mensagens por datagrama  "
+              f"p50 {percentile(shots, 50) * 1000:.2f} ms  "
+              f"p99 {percentile(shots, 99) * 1000:.2f} ms do tiro até a vez voltar")
+
+
+def import_time(module):
+    """µs para importar o módulo (com dependências) num interpretador novo"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=here)
+    return int(result.stderr.strip().splitlines()[-1].split('|')[1])
+
+
+def terminal_join(port, timeout=5.0):
+    """ms do início do processo do cliente de terminal (num pty) até o quadro
+    que mostra a partida contra a IA começando; None se não chegou"""
+    import pty
+    import select
+    here = os.path.dirname(os.path.abspath(__file__))
+    master, slave = pty.openpty()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(here, 'term_battleshipy.py'),
+                                '--port', str(port), '--ai', 'easy'],
+                               stdin=slave, stdout=slave, stderr=slave)
+    os.close(slave)
+    screen = b''
+    elapsed = None
+    deadline = started + timeout
+    try:
+        while time.perf_counter() < deadline:
+            if select.select([master], [], [], 0.05)[0]:
+                screen += os.read(master, 65536)
+                if 'POSICIONE'.encode() in screen:
+                    elapsed = (time.perf_counter() - started) * 1000
+                    break
+        os.write(master, b'q')
+        process.wait(timeout)
+    finally:
+        if process.poll() is None:
+            process.kill()
+        os.close(master)
+    return elapsed
+
+
+def bench_startup(args):
+    """Cliente de terminal: importação e tempo até entrar numa partida"""
+    for module in ('term_battleshipy', 'client_battleshipy'):
+        times = sorted(import_time(module) / 1000 for _ in range(args.runs))
+        print(f"{module:>18}: importação p50 {percentile(times, 50):6.1f} ms  "
+              f"mín {times[0]:6.1f} ms")
+    bare = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'])
+        bare.append((time.perf_counter() - started) * 1000)
+    server = spawn_server(args.port, [])
+    try:
+        joins = [terminal_join(args.port) for _ in range(args.runs)]
+    finally:
+        server.terminate()
+        server.wait()
+    failed = joins.count(None)
+    joins = sorted(t for t in joins if t is not None)
+    print(f"{'python -c pass':>18}: p50 {percentile(sorted(bare), 50):6.1f} ms")
+    if joins:
+        print(f"{'term_battleshipy':>18}: do processo ao quadro da partida p50 "
+              f"{percentile(joins, 50):6.1f} ms  mín {joins[0]:6.1f} ms  máx {joins[-1]:6.1f} ms"
+              + (f"  ({failed} sem resposta)" if failed else ""))
+
+
+class StalledFileHandler(logging.FileHandler):
+    """Arquivo de log que trava `stall` segundos a cada `every` registros"""
+
+    def __init__(self, path, stall, every):
+        super().__init__(path)
+        self.stall = stall
+        self.every = every
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+        if self.stall and self.count % self.every == 0:
+            time.sleep(self.stall)  # Terminal lento, disco ocupado
+        super().emit(record)
+
+
+def drive_shots(server, count, rng):
+    """Tiros pelo _handle_message numa partida de dois endereços falsos; ns de cada um"""
+    addrs = [('127.0.0.1', 20001), ('127.0.0.1', 20002)]
+    server._handle_message(encode({'type': 'join', 'private': True}), addrs[0])
+    match = server.addr_matches[addrs[0]]
+    server._handle_message(encode({'type': 'join', 'match_id': match.id}), addrs[1])
+    ruleset = match.ruleset
+    cells = {}
+    times = []
+    while len(times) < count:
+        if match.game_state != 'playing':
+            if match.game_state == 'finished':
+                server._handle_message(encode({'type': 'restart', 'match_id': match.id}), addrs[0])
+            for addr in addrs:
+                fleet = random_fleet_positions(ruleset, rng)
+                server._handle_message(encode({'type': 'place_ships', 'ships': fleet,
+                                               'match_id': match.id}), addr)
+            cells = {pid: iter(rng.sample(range(100), 100)) for pid in (1, 2)}
+        x, y = divmod(next(cells[match.current_turn]), 10)
+        data = encode({'type': 'shoot', 'x': x, 'y': y, 'match_id': match.id})
+        started = time.perf_counter_ns()
+        server._handle_message(data, addrs[match.current_turn - 1])
+        times.append(time.perf_counter_ns() - started)
+    return times
+
+
+def bench_logging(args):
+    """Custo do log por mensagem tratada: desligado, síncrono e pela fila"""
+    rng = random.Random(1)
+    root = logging.getLogger()
+    saved = root.handlers, root.level
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'server.log')
+        for mode in args.modes:
+            handler = StalledFileHandler(path, args.stall_ms / 1000, args.stall_every)
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+            root.handlers = [handler]
+            root.setLevel(logging.WARNING if mode == 'off' else logging.INFO)
+            log.configure(args.queue, parse_sample(args.sample), args.format)
+            log.dropped = log.sampled_out = 0
+            server = BattleShipServer(port=0)
+            if mode == 'async':
+                log.start()
+            try:
+                times = drive_shots(server, args.messages, rng)
+            finally:
+                log.stop()
+                server.sock.close()
+                handler.close()
+            us = [t / 1000 for t in times]
+            print(f"{mode:>6}: {sum(us) / len(us):7.1f} µs/msg  p50 {percentile(us, 50):6.1f}  "
+                  f"p99 {percentile(us, 99):8.1f}  máx {max(us):8.1f} µs  "
+                  f"{handler.count} linhas, {log.dropped} descartadas, "
+                  f"{log.sampled_out} fora da amostra")
+    root.handlers, root.level = saved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do BATTLESHI.PY")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    modes = sub.add_parser('modes', help="threaded vs asyncio: msg/s e latência p99")
+    modes.add_argument('--modes', nargs='+', default=['threaded', 'async'])
+    modes.add_argument('--matches', type=int, default=50)
+    modes.add_argument('--duration', type=float, default=5.0)
+    modes.add_argument('--port', type=int, default=23456)
+    modes.add_argument('--protocol', choices=SUPPORTED_PROTOCOLS, default=PROTOCOL_JSON)
+    modes.set_defaults(func=bench_modes)
+
+    shards = sub.add_parser('shards', help="escala do servidor com --processes")
+    shards.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    shards.add_argument('--mode', choices=['threaded', 'async'], default='async')
+    shards.add_argument('--clients', type=int, default=os.cpu_count() or 1,
+                        help="processos geradores de carga")
+    shards.add_argument('--matches', type=int, default=200)
+    shards.add_argument('--duration', type=float, default=5.0)
+    shards.add_argument('--port', type=int, default=23456)
+    shards.add_argument('--protocol', choices=SUPPORTED_PROTOCOLS, default=PROTOCOL_JSON)
+    shards.set_defaults(func=bench_shards)
+
+    reliability = sub.add_parser('reliability',
+                                 help="partidas travadas e latência sob perda de pacotes")
+    reliability.add_argument('--loss', type=float, default=0.05)
+    reliability.add_argument('--matches', type=int, default=20)
+    reliability.add_argument('--duration', type=float, default=5.0)
+    reliability.add_argument('--timeout', type=float, default=1.0,
+                             help="sem resposta após este tempo a partida conta como travada")
+    reliability.add_argument('--port', type=int, default=23456)
+    reliability.set_defaults(func=bench_reliability)
+
+    protocol = sub.add_parser('protocol', help="JSON vs binário: bytes e CPU por mensagem")
+    protocol.add_argument('--number', type=int, default=20000)
+    protocol.set_defaults(func=bench_protocol)
+
+    ai = sub.add_parser('ai', help="IA do servidor: µs por jogada e tiros por partida")
+    ai.add_argument('--difficulties', nargs='+', choices=DIFFICULTIES, default=list(DIFFICULTIES))
+    ai.add_argument('--games', type=int, default=200)
+    ai.set_defaults(func=bench_ai)
+
+    fleets = sub.add_parser('fleets', help="gerador de frotas: frotas por segundo")
+    fleets.add_argument('--count', type=int, default=1000000)
+    fleets.set_defaults(func=bench_fleets)
+
+    rules = sub.add_parser('rules', help="rulesets: memória do tabuleiro e µs por tiro")
+    rules.add_argument('--rules', nargs='+', choices=list(RULESETS), default=list(RULESETS))
+    rules.add_argument('--shots', type=int, default=10000)
+    rules.set_defaults(func=bench_rules)
+
+    spectators = sub.add_parser('spectators',
+                                help="espectadores: impacto na latência dos jogadores")
+    spectators.add_argument('--spectators', type=int, default=2000)
+    spectators.add_argument('--matches', type=int, default=20)
+    spectators.add_argument('--duration', type=float, default=5.0)
+    spectators.add_argument('--port', type=int, default=23556)
+    spectators.set_defaults(func=bench_spectators)
+
+    journal = sub.add_parser('journal', help="diário: custo no servidor e tempo de seek")
+    journal.add_argument('--matches', type=int, default=20)
+    journal.add_argument('--duration', type=float, default=5.0)
+    journal.add_argument('--seeks', type=int, default=50)
+    journal.add_argument('--port', type=int, default=23656)
+    journal.set_defaults(func=bench_journal)
+
+    overload = sub.add_parser('overload',
+                              help="limites por endereço e fila de entrada sob enxurrada")
+    overload.add_argument('--matches', type=int, default=4)
+    overload.add_argument('--duration', type=float, default=5.0)
+    overload.add_argument('--factor', type=float, default=10.0,
+                          help="enxurrada como múltiplo do tráfego das partidas")
+    overload.add_argument('--sources', type=int, default=256)
+    overload.add_argument('--port', type=int, default=23756)
+    overload.set_defaults(func=bench_overload)
+
+    snapshot = sub.add_parser('snapshot', help="snapshot: gravação e carga de N partidas")
+    snapshot.add_argument('--matches', type=int, default=10000)
+    snapshot.add_argument('--ai', type=float, default=0.3, help="fração de partidas contra a IA")
+    snapshot.add_argument('--repeat', type=int, default=3)
+    snapshot.set_defaults(func=bench_snapshot)
+
+    matchmaking = sub.add_parser('matchmaking',
+                                 help="fila ranqueada: µs por operação e espera até o pareamento")
+    matchmaking.add_argument('--players', type=int, nargs='+', default=[1000, 10000, 50000])
+    matchmaking.add_argument('--growth', type=float, default=10.0,
+                             help="pontos de janela por segundo na fila cheia")
+    matchmaking.add_argument('--tick', type=float, default=0.1)
+    matchmaking.add_argument('--horizon', type=float, default=120.0)
+    matchmaking.add_argument('--rate', type=int, default=2000, help="chegadas por segundo")
+    matchmaking.set_defaults(func=bench_matchmaking)
+
+    render = sub.add_parser('render', help="cliente tkinter: tempo de quadro dos tabuleiros")
+    render.add_argument('--games', type=int, default=20)
+    render.set_defaults(func=bench_render)
+
+    ui = sub.add_parser('ui', help="cliente tkinter sob rajadas: quadros e espera até a tela")
+    ui.add_argument('--messages', type=int, default=20000)
+    ui.add_argument('--burst', type=int, default=200)
+    ui.add_argument('--gap', type=float, default=0.005, help="pausa entre rajadas, em segundos")
+    ui.add_argument('--port', type=int, default=23999)
+    ui.set_defaults(func=bench_ui)
+
+    batching = sub.add_parser('batching',
+                              help="lotes de saída: datagramas por mensagem e latência")
+    batching.add_argument('--windows', nargs='+', default=['off', '0', '2', '10'],
+                          help="janelas em ms ('off' desliga os lotes)")
+    batching.add_argument('--matches', type=int, default=50)
+    batching.add_argument('--duration', type=float, default=5.0)
+    batching.add_argument('--ai-games', type=int, default=20)
+    batching.add_argument('--ai', choices=DIFFICULTIES, default='hard')
+    batching.add_argument('--port', type=int, default=23812)
+    batching.set_defaults(func=bench_batching)
+
+    logs = sub.add_parser('logging', help="log do servidor: µs por mensagem tratada, síncrono ou pela fila")
+    logs.add_argument('--modes', nargs='+', choices=['off', 'sync', 'async'],
+                      default=['off', 'sync', 'async'])
+    logs.add_argument('--messages', type=int, default=50000)
+    logs.add_argument('--stall-ms', type=float, default=5.0,
+                      help="trava da escrita simulada (terminal ou disco lento)")
+    logs.add_argument('--stall-every', type=int, default=1000, help="registros entre travas")
+    logs.add_argument('--sample', action='append', metavar='EVENTO=N')
+    logs.add_argument('--format', choices=['text', 'json'], default='text')
+    logs.add_argument('--queue', type=int, default=65536)
+    logs.set_defaults(func=bench_logging)
+
+    startup = sub.add_parser('startup', help="cliente de terminal: importação e tempo até o join")
+    startup.add_argument('--runs', type=int, default=10)
+    startup.add_argument('--port', type=int, default=23813)
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+BOARD_SIZE = 10
+SHIP_SIZES = [5, 4, 3, 3, 2]
+ALL_CELLS = (1 << BOARD_SIZE * BOARD_SIZE) - 1
+
+def cell_bit(x, y, board_size=BOARD_SIZE):
+    """Bit da célula (x, y) no bitboard"""
+    return 1 << (x * board_size + y)
+
+def mask_cells(mask, board_size=BOARD_SIZE):
+    """Lista de [x, y] das células marcadas em uma máscara"""
+    cells = []
+    while mask:
+        low = mask & -mask
+        index = low.bit_length() - 1
+        cells.append([index // board_size, index % board_size])
+        mask ^= low
+    return cells
+
+def placement_masks(size, board_size=BOARD_SIZE):
+    """Todas as máscaras de navios retos de um tamanho dentro do tabuleiro"""
+    line = (1 << size) - 1
+    column = sum(cell_bit(i, 0, board_size) for i in range(size))
+    masks = set()
+    for x in range(board_size):
+        for y in range(board_size - size + 1):
+            masks.add(line << (x * board_size + y))   # horizontal
+            masks.add(column << (y * board_size + x))  # vertical
+    return frozenset(masks)
+
+# Posicionamentos legais por tamanho: validar um navio é um lookup
+PLACEMENT_MASKS = {size: placement_masks(size) for size in set(SHIP_SIZES)}
@@ -0,0 +1,480 @@
+import socket
+import selectors
+import argparse
+import random
+import time
+import os
+import multiprocessing
+from collections import deque
+from protocol_battleshipy import (
+    PROTOCOL_JSON, SUPPORTED_PROTOCOLS, decode, encode, is_envelope, unpack_batch,
+)
+from reliable_battleshipy import ReliableEndpoint
+from fleet_battleshipy import random_fleet_positions
+from rules_battleshipy import RULESETS, parse_rules
+
+# Frota fixa usada pelos jogadores simulados
+FLEET = [
+    {'positions': [[0, 0], [0, 1], [0, 2], [0, 3], [0, 4]]},
+    {'positions': [[2, 0], [2, 1], [2, 2], [2, 3]]},
+    {'positions': [[4, 0], [4, 1], [4, 2]]},
+    {'positions': [[6, 0], [6, 1], [6, 2]]},
+    {'positions': [[8, 0], [8, 1]]},
+]
+SHUFFLE_LIMIT = 4096  # Acima disso os tiros são sorteados sob demanda
+
+
+def shot_sequence(board_size, rng=random):
+    """Tiros em ordem aleatória, sem repetir, sem materializar tabuleiros grandes"""
+    if board_size * board_size <= SHUFFLE_LIMIT:
+        cells = [(x, y) for x in range(board_size) for y in range(board_size)]
+        rng.shuffle(cells)
+        yield from cells
+        return
+    seen = set()
+    while len(seen) < board_size * board_size:
+        cell = (rng.randrange(board_size), rng.randrange(board_size))
+        if cell not in seen:
+            seen.add(cell)
+            yield cell
+
+
+def percentile(values, pct):
+    """Percentil por ordenação (suficiente para benchmarks)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class BotClient:
+    """Jogador sem interface: o mesmo protocolo do PixelArtBattleship, sem tkinter"""
+
+    def __init__(self, server_addr, protocol=PROTOCOL_JSON, reliable=False, timeout=1.0):
+        self.server_addr = server_addr
+        self.requested_protocol = protocol
+        self.protocol = PROTOCOL_JSON
+        self.endpoint = ReliableEndpoint() if reliable else None
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.setblocking(False)
+        self.player_id = None
+        self.match_id = None
+        self.token = None
+        self.inbox = deque()  # Mensagens já lidas que wait_for ainda não entregou
+        self.datagrams = 0    # Datagramas recebidos (um lote conta uma vez)
+        self.messages = 0     # Mensagens recebidas, de lotes ou avulsas
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, message):
+        if self.match_id is not None:
+            message['match_id'] = self.match_id
+        data = encode(message, self.protocol)
+        if self.endpoint is not None:
+            data = self.endpoint.wrap(self.server_addr, data, self.match_id)
+        self.sock.sendto(data, self.server_addr)
+
+    def join(self, match_id=None, private=False, ai=None, rules=None):
+        message = {'type': 'join', 'protocol': self.requested_protocol, 'batch': True}
+        if rules is not None:
+            message['rules'] = rules
+        if match_id is not None:
+            message['match_id'] = match_id
+        elif private:
+            message['private'] = True
+        if ai is not None:
+            message.update(mode='ai', difficulty=ai)
+        # O join vai sempre em JSON e fora da camada confiável: o protocolo
+        # ainda não foi negociado e o servidor não conhece este par
+        self.sock.sendto(encode(message), self.server_addr)
+
+    def place_ships(self, ships=FLEET):
+        self.send({'type': 'place_ships', 'ships': ships})
+
+    def shoot(self, x, y):
+        self.send({'type': 'shoot', 'x': x, 'y': y})
+
+    def restart(self):
+        self.send({'type': 'restart'})
+
+    def spectate(self, match_id, delay=0.0, nonce=None):
+        """Sem nonce o servidor só responde o desafio; com ele, transmite"""
+        message = {'type': 'spectate', 'match_id': match_id, 'delay': delay}
+        if nonce is not None:
+            message['nonce'] = nonce
+        self.sock.sendto(encode(message), self.server_addr)
+
+    def resume(self):
+        self.sock.sendto(encode({'type': 'resume', 'token': self.token,
+                                 'protocol': self.requested_protocol, 'batch': True}),
+                         self.server_addr)
+
+    def receive(self):
+        """Drena o socket sem bloquear; devolve as mensagens decodificadas"""
+        messages = []
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(65535)
+            except BlockingIOError:
+                return messages
+            self.datagrams += 1
+            for payload in self._unwrap(data):
+                for frame in unpack_batch(payload):
+                    message = decode(frame)
+                    self.messages += 1
+                    self._track(message)
+                    messages.append(message)
+
+    def wait_for(self, types, timeout=None):
+        """Bloqueia até chegar uma mensagem de um dos tipos (ou erro)"""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        try:
+            while True:
+                while self.inbox:
+                    message = self.inbox.popleft()
+                    if message.get('type') in types or message.get('type') == 'error':
+                        return message
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout(f"sem resposta para {types}")
+                selector.select(min(remaining, 0.005) if self.endpoint else remaining)
+                self.poll()
+                self.inbox.extend(self.receive())
+        finally:
+            selector.close()
+
+    def poll(self, now=None):
+        """Retransmite o que venceu na camada confiável"""
+        if self.endpoint is None:
+            return
+        for addr, packet in self.endpoint.poll(now):
+            self.sock.sendto(packet, addr)
+
+    def _unwrap(self, data):
+        if self.endpoint is None or not is_envelope(data):
+            return [data]
+        payloads = self.endpoint.receive(self.server_addr, data)
+        ack = self.endpoint.take_ack(self.server_addr)
+        if ack is not None:
+            self.sock.sendto(ack, self.server_addr)
+        return payloads
+
+    def _track(self, message):
+        if message.get('type') in ('join_success', 'game_state', 'snapshot'):
+            self.player_id = message.get('player_id', self.player_id)
+            self.match_id = message.get('match_id', self.match_id)
+            self.protocol = message.get('protocol', self.protocol)
+            self.token = message.get('token', self.token)
+
+    def close(self):
+        self.sock.close()
+
+
+class BotMatch:
+    """Dois bots jogando partidas roteirizadas, uma requisição pendente por vez"""
+
+    def __init__(self, server_addr, timeout=1.0, protocol=PROTOCOL_JSON, reliable=False,
+                 seed=None, rules=None):
+        self.bots = [BotClient(server_addr, protocol, reliable, timeout) for _ in range(2)]
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.rules = rules
+        self.ruleset = parse_rules(rules)
+        self.shots = {}
+        self.pending = None  # (índice do bot, tipo esperado, tipo enviado, instante, tiro)
+        self.overdue = None  # Requisição pendente que estourou o timeout
+        self.games = 0
+
+    @property
+    def player_ids(self):
+        return [bot.player_id for bot in self.bots]
+
+    def join(self):
+        """Entra na partida de forma síncrona (fora da janela medida)"""
+        for index, bot in enumerate(self.bots):
+            attempts = 0
+            retried = False
+            while True:
+                if index == 0:
+                    bot.join(private=True, rules=self.rules)
+                else:
+                    bot.join(match_id=self.bots[0].match_id)
+                try:
+                    reply = bot.wait_for(('join_success', 'game_state'))
+                except socket.timeout:
+                    retried = True
+                    continue
+                if reply.get('type') == 'join_success':
+                    break
+                if (retried and reply.get('type') == 'game_state'
+                        and (index == 0 or reply.get('match_id') == self.bots[0].match_id)):
+                    # O join_success se perdeu e o reenvio achou este socket já na partida
+                    break
+                # game_state ou erro: a porta efêmera é de um bot antigo que
+                # o servidor ainda lembra, então tentar de novo com outro socket
+                attempts += 1
+                if attempts >= 3:
+                    raise RuntimeError(f"join recusado: {reply}")
+                bot.close()
+                bot = self.bots[index] = BotClient(bot.server_addr, bot.requested_protocol,
+                                                   bot.endpoint is not None, bot.timeout)
+        # Descartar game_start e outras mensagens da fase de conexão
+        time.sleep(0.001)
+        for bot in self.bots:
+            bot.inbox.clear()
+            bot.receive()
+
+    def expect(self, index, reply_type, sent_type, stats, shot=None):
+        self.pending = (index, reply_type, sent_type, time.perf_counter(), shot)
+        stats.sent(sent_type)
+
+    def start(self, stats):
+        board_size = self.ruleset.board_size
+        self.shots = {pid: shot_sequence(board_size, self.random) for pid in self.player_ids}
+        self.bots[0].place_ships(random_fleet_positions(self.ruleset, self.random))
+        self.expect(0, 'placement_success', 'place_ships', stats)
+
+    def on_message(self, index, message, stats):
+        msg_type = message.get('type')
+        if self.pending is None or not self._answers(index, message):
+            if self.overdue is not None and self._answers(index, message, self.overdue):
+                stats.late += 1  # Resposta que chegou depois de desistirmos dela
+                self.overdue = None
+            return
+        _, _, sent_type, sent_at, _ = self.pending
+        stats.record(sent_type, time.perf_counter() - sent_at)
+        self.pending = None
+
+        if msg_type == 'error':
+            self.restart(stats)
+        elif msg_type == 'placement_success' and index == 0:
+            self.bots[1].place_ships(random_fleet_positions(self.ruleset, self.random))
+            self.expect(1, 'placement_success', 'place_ships', stats)
+        elif msg_type == 'placement_success':
+            self.pending = (1, 'game_begin', None, sent_at, None)
+        elif msg_type == 'game_begin':
+            self.shoot(message['turn'], stats)
+        elif msg_type == 'shot_result':
+            if message.get('game_over'):
+                self.games += 1
+                stats.games += 1
+                self.restart(stats)
+            else:
+                self.shoot(message['current_turn'], stats)
+        elif msg_type == 'game_restart':
+            self.start(stats)
+
+    def _answers(self, index, message, request=None):
+        want_index, want_type, _, _, shot = request or self.pending
+        msg_type = message.get('type')
+        if index != want_index or msg_type not in (want_type, 'error'):
+            return False
+        if msg_type != 'shot_result':
+            return True
+        # A cópia do tiro do oponente não é a nossa resposta
+        return (message.get('shooter') == self.player_ids[index]
+                and (message.get('x'), message.get('y')) == shot)
+
+    def shoot(self, turn, stats):
+        index = self.player_ids.index(turn)
+        x, y = next(self.shots[turn])
+        self.bots[index].shoot(x, y)
+        self.expect(index, 'shot_result', 'shoot', stats, (x, y))
+
+    def restart(self, stats):
+        self.bots[0].restart()
+        self.expect(0, 'game_restart', 'restart', stats)
+
+    def check_timeout(self, now, stats):
+        if self.pending is not None and now - self.pending[3] > self.timeout:
+            stats.dropped += 1
+            self.overdue = self.pending
+            self.restart(stats)
+
+    def close(self):
+        for bot in self.bots:
+            bot.close()
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = {}
+        self.counts = {}
+        self.received = 0
+        self.games = 0
+        self.dropped = 0
+        self.late = 0
+
+    def sent(self, msg_type):
+        if msg_type is not None:
+            self.counts[msg_type] = self.counts.get(msg_type, 0) + 1
+
+    def record(self, msg_type, elapsed):
+        if msg_type is not None:
+            self.latencies.setdefault(msg_type, []).append(elapsed)
+
+    def merge(self, other):
+        for msg_type, values in other.latencies.items():
+            self.latencies.setdefault(msg_type, []).extend(values)
+        for msg_type, count in other.counts.items():
+            self.counts[msg_type] = self.counts.get(msg_type, 0) + count
+        self.received += other.received
+        self.games += other.games
+        self.dropped += other.dropped
+        self.late += other.late
+
+    def report(self, duration):
+        completed = sum(len(v) for v in self.latencies.values())
+        everything = [x for v in self.latencies.values() for x in v]
+        return {
+            'msgs_per_sec': completed / duration,
+            'received_per_sec': self.received / duration,
+            'p50_ms': percentile(everything, 50) * 1000,
+            'p99_ms': percentile(everything, 99) * 1000,
+            'games_per_sec': self.games / duration,
+            'dropped': self.dropped,
+            'late': self.late,
+            'per_type': {
+                t: {'count': len(v),
+                    'p50_ms': percentile(v, 50) * 1000,
+                    'p90_ms': percentile(v, 90) * 1000,
+                    'p99_ms': percentile(v, 99) * 1000,
+                    'max_ms': max(v) * 1000}
+                for t, v in self.latencies.items()
+            },
+        }
+
+
+def run_load(server_addr, matches, duration, timeout=1.0, protocol=PROTOCOL_JSON,
+             reliable=False, rules=None):
+    """Dirige `matches` partidas simultâneas por `duration` segundos"""
+    stats, elapsed = drive_matches(server_addr, matches, duration, timeout, protocol, reliable,
+                                   rules)
+    return stats.report(elapsed)
+
+
+def _drive_worker(args):
+    return drive_matches(*args)
+
+
+def run_load_parallel(server_addr, matches, duration, clients, timeout=1.0,
+                      protocol=PROTOCOL_JSON, reliable=False, rules=None):
+    """Como run_load, mas dividindo as partidas entre `clients` processos"""
+    if clients <= 1:
+        return run_load(server_addr, matches, duration, timeout, protocol, reliable, rules)
+    per_client = max(1, matches // clients)
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(_drive_worker, [(server_addr, per_client, duration, timeout,
+                                            protocol, reliable, rules)] * clients)
+    stats = LoadStats()
+    for partial, _ in results:
+        stats.merge(partial)
+    return stats.report(max(elapsed for _, elapsed in results))
+
+
+def raise_fd_limit(needed):
+    """Cada bot usa um socket: sobe o limite de descritores até o necessário"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def drive_matches(server_addr, matches, duration, timeout=1.0, protocol=PROTOCOL_JSON,
+                  reliable=False, rules=None):
+    """Laço de carga; devolve (LoadStats, segundos medidos)"""
+    raise_fd_limit(2 * matches + 64)
+    drivers = []
+    selector = selectors.DefaultSelector()
+    stats = LoadStats()
+    for _ in range(matches):
+        driver = BotMatch(server_addr, timeout, protocol, reliable, rules=rules)
+        driver.join()
+        drivers.append(driver)
+        for index, bot in enumerate(driver.bots):
+            selector.register(bot.sock, selectors.EVENT_READ, (driver, index))
+
+    started = time.perf_counter()
+    for driver in drivers:
+        driver.start(stats)
+
+    deadline = started + duration
+    last_check = started
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        for key, _ in selector.select(timeout=0.001 if reliable else 0.05):
+            driver, index = key.data
+            for message in driver.bots[index].receive():
+                stats.received += 1
+                driver.on_message(index, message, stats)
+        if reliable:
+            monotonic = time.monotonic()
+            for driver in drivers:
+                for bot in driver.bots:
+                    bot.poll(monotonic)
+        if now - last_check > 0.1:
+            last_check = now
+            for driver in drivers:
+                driver.check_timeout(now, stats)
+
+    elapsed = time.perf_counter() - started
+    for driver in drivers:
+        for bot in driver.bots:
+            selector.unregister(bot.sock)
+        driver.close()
+    selector.close()
+    return stats, elapsed
+
+
+def print_report(report):
+    print(f"📨 {report['msgs_per_sec']:.0f} req/s respondidas, "
+          f"{report['received_per_sec']:.0f} msg/s recebidas")
+    print(f"🎮 {report['games_per_sec']:.1f} jogos/s concluídos")
+    print(f"⌛ Respostas perdidas: {report['dropped']}, atrasadas: {report['late']}")
+    print(f"{'mensagem':>12} {'n':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for msg_type, row in sorted(report['per_type'].items()):
+        print(f"{msg_type:>12} {row['count']:>8} {row['p50_ms']:>8.2f} {row['p90_ms']:>8.2f} "
+              f"{row['p99_ms']:>8.2f} {row['max_ms']:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gerador de carga com bots do BATTLESHI.PY")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--players', type=int, default=1000,
+                        help="jogadores simulados (pareados em partidas)")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help="processos geradores de carga")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--timeout', type=float, default=1.0,
+                        help="sem resposta após este tempo a requisição conta como perdida")
+    parser.add_argument('--protocol', choices=SUPPORTED_PROTOCOLS, default=PROTOCOL_JSON)
+    parser.add_argument('--reliable', action='store_true',
+                        help="usar a camada de entrega confiável")
+    parser.add_argument('--rules', choices=list(RULESETS), default=None,
+                        help="regras das partidas (huge: tabuleiro 1000x1000 esparso)")
+    args = parser.parse_args(argv)
+
+    matches = max(1, args.players // 2)
+    processes = max(1, min(args.processes, matches))
+    print(f"🤖 {2 * matches} bots em {matches} partidas, {processes} processo(s), "
+          f"{args.duration:.0f}s contra {args.host}:{args.port}")
+    report = run_load_parallel((args.host, args.port), matches, args.duration, processes,
+                               args.timeout, args.protocol, args.reliable, args.rules)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
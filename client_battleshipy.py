@@ -1,35 +1,152 @@
-import socket
-import json
+import time
 import threading
 import tkinter as tk
-from tkinter import messagebox
-import random
-import math
+import argparse
+from collections import deque
+from protocol_battleshipy import PROTOCOL_JSON, SUPPORTED_PROTOCOLS
+from rules_battleshipy import RULESETS, DEFAULT_RULESET
+from core_battleshipy import ClientCore, NOTIFY_MS
 
-class PixelArtBattleship:
-    def __init__(self):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server_addr = ('127.0.0.1', 12345)
-        self.player_id = None
-        self.game_state = "waiting"
-        self.current_turn = None
-        self.my_board = [[' ' for _ in range(10)] for _ in range(10)]
-        self.opponent_board = [[' ' for _ in range(10)] for _ in range(10)]
-        self.ships_placed = False
-        
-        # Cores 
-        self.colors = {
-            'bg': '#0a0a12',
-            'panel': '#1a1a2e',
-            'accent': '#00ffff',
-            'accent2': '#ff00ff',
-            'text': '#e0e0ff',
-            'grid': '#2a2a4a',
-            'ship': '#00ff88',
-            'hit': '#ff4444',
-            'miss': '#4444ff',
-            'sunk': '#ffaa00'
-        }
+MAX_BATCH = 256          # Mensagens por passada antes de devolver o loop ao Tk
+
+# Cores 
+COLORS = {
+    'bg': '#0a0a12',
+    'panel': '#1a1a2e',
+    'accent': '#00ffff',
+    'accent2': '#ff00ff',
+    'text': '#e0e0ff',
+    'grid': '#2a2a4a',
+    'ship': '#00ff88',
+    'hit': '#ff4444',
+    'miss': '#4444ff',
+    'sunk': '#ffaa00'
+}
+
+class BoardRenderer:
+    """Tabuleiro num canvas: grade e coordenadas desenhadas uma vez e um
+    item persistente por célula, reconfigurado só quando o conteúdo muda"""
+    
+    GRID_SIZE = 300  # Lado da grade em pixels, qualquer que seja o tabuleiro
+    ORIGIN = 40
+    PIXEL = 4  # Espessura da borda pixelada dos navios
+    FILLS = {'X': 'hit', 'O': 'miss', 'D': 'sunk'}
+    
+    def __init__(self, canvas, colors, show_ships, board_size=DEFAULT_RULESET.board_size):
+        self.canvas = canvas
+        self.colors = colors
+        self.show_ships = show_ships  # Navios intactos só no próprio tabuleiro
+        self.board_size = board_size
+        self.cell_size = self.GRID_SIZE // board_size
+        self.items = []
+        self.drawn = []
+        self.draw_static()
+    
+    def draw_static(self):
+        """Grade, coordenadas e um item por célula (ocultos)"""
+        canvas = self.canvas
+        canvas.delete("all")
+        n = self.board_size
+        cell_size = self.cell_size
+        origin = self.ORIGIN
+        grid_color = self.colors['grid']
+        
+        for i in range(n + 1):
+            # Linhas horizontais
+            canvas.create_line(origin, origin + i * cell_size,
+                               origin + n * cell_size, origin + i * cell_size,
+                               width=2, fill=grid_color)
+            # Linhas verticais
+            canvas.create_line(origin + i * cell_size, origin,
+                               origin + i * cell_size, origin + n * cell_size,
+                               width=2, fill=grid_color)
+        
+        # Coordenadas (letras só enquanto o alfabeto basta)
+        font = ('Courier New', 10 if n <= 10 else 7, 'bold')
+        for i in range(n):
+            label = chr(ord('A') + i) if n <= 26 else str(i + 1)
+            canvas.create_text(origin - 15, origin + i * cell_size + cell_size // 2,
+                               text=label, font=font, fill=self.colors['text'])
+            canvas.create_text(origin + i * cell_size + cell_size // 2, origin - 15,
+                               text=str(i + 1), font=font, fill=self.colors['text'])
+        
+        self.items = [[canvas.create_rectangle(*self._box(i, j), state='hidden')
+                       for j in range(n)] for i in range(n)]
+        self.drawn = [[' '] * n for _ in range(n)]
+    
+    def invalidate(self):
+        """Esquece o que foi desenhado: o próximo update repinta todas as células"""
+        self.drawn = [[None] * self.board_size for _ in range(self.board_size)]
+    
+    def _box(self, i, j):
+        x = self.ORIGIN + j * self.cell_size + 2
+        y = self.ORIGIN + i * self.cell_size + 2
+        size = self.cell_size - 4
+        return x, y, x + size, y + size
+    
+    def cell_at(self, px, py):
+        """Célula (linha, coluna) sob um ponto do canvas, ou None"""
+        x = px - self.ORIGIN
+        y = py - self.ORIGIN
+        if x < 0 or y < 0:
+            return None
+        row, col = y // self.cell_size, x // self.cell_size
+        if row < self.board_size and col < self.board_size:
+            return row, col
+        return None
+    
+    def update(self, board):
+        """Reconfigura as células que mudaram; devolve quantas foram"""
+        changed = 0
+        for i in range(self.board_size):
+            row = board[i]
+            drawn = self.drawn[i]
+            for j in range(self.board_size):
+                content = row[j]
+                if content == 'S' and not self.show_ships:
+                    content = ' '
+                if content != drawn[j]:
+                    drawn[j] = content
+                    self._paint(self.items[i][j], i, j, content)
+                    changed += 1
+        return changed
+    
+    def _paint(self, item, i, j, content):
+        canvas = self.canvas
+        x, y, right, bottom = self._box(i, j)
+        if content == 'S':
+            # Quadrado vazado com borda de um "pixel", num único item
+            half = self.PIXEL // 2
+            inner = (self.cell_size - 4) // self.PIXEL * self.PIXEL
+            canvas.coords(item, x + half, y + half, x + inner - half, y + inner - half)
+            canvas.itemconfig(item, state='normal', fill='',
+                              outline=self.colors['ship'], width=self.PIXEL)
+        elif content in self.FILLS:
+            color = self.colors[self.FILLS[content]]
+            canvas.coords(item, x, y, right, bottom)
+            canvas.itemconfig(item, state='normal', fill=color, outline=color, width=1)
+        else:
+            canvas.itemconfig(item, state='hidden')
+
+
+class PixelArtBattleship(ClientCore):
+    """Interface tkinter sobre o ClientCore"""
+    
+    def __init__(self, server_addr=('127.0.0.1', 12345), protocol=PROTOCOL_JSON,
+                 reliable=False, resume_token=None, ai_difficulty=None, frame_stats=False,
+                 rules=None, spectate=None, delay=0.0, ranked=None):
+        super().__init__(server_addr, protocol, reliable, resume_token, ai_difficulty,
+                         frame_stats, rules, spectate, delay, ranked)
+        
+        # Mensagens da thread de rede esperando a próxima passada no Tk
+        self.inbox = deque()
+        self.inbox_lock = threading.Lock()
+        self.pump_scheduled = False
+        self.toast_timer = None
+        self.toast_text = None
+        self.toast_count = 0
+        
+        self.colors = dict(COLORS)
         
         self.setup_gui()
         self.connect_to_server()
@@ -73,16 +190,23 @@ class PixelArtBattleship:
                                     bg=self.colors['panel'])
         self.status_label.pack(pady=8)
         
+        # Avisos não modais por cima da janela (erros, fim de jogo)
+        self.toast = tk.Label(self.root, font=('Courier New', 11, 'bold'),
+                              bg=self.colors['panel'], relief='raised', bd=2, padx=12, pady=4)
+        
         # Frame dos tabuleiros
         boards_frame = tk.Frame(main_frame, bg=self.colors['bg'])
         boards_frame.pack(fill='both', expand=True)
         
-        # Tabuleiro do jogador
-        player_frame = self.create_board_frame(boards_frame, "MEU TABULEIRO", True)
+        # Tabuleiro do jogador (ou do jogador 1, para espectadores)
+        watching = self.spectate_match is not None
+        player_frame = self.create_board_frame(
+            boards_frame, "JOGADOR 1" if watching else "MEU TABULEIRO", True)
         player_frame.pack(side='left', fill='both', expand=True, padx=(0, 5))
         
         # Tabuleiro do oponente
-        opponent_frame = self.create_board_frame(boards_frame, "RADAR INIMIGO", False)
+        opponent_frame = self.create_board_frame(
+            boards_frame, "JOGADOR 2" if watching else "RADAR INIMIGO", False)
         opponent_frame.pack(side='right', fill='both', expand=True, padx=(5, 0))
         
         # Painel de controle
@@ -91,7 +215,10 @@ class PixelArtBattleship:
         # Legenda pixelart
         self.setup_legend(main_frame)
         
-        # Desenhar tabuleiros
+        # Grade desenhada uma vez; depois só as células que mudam
+        size = self.ruleset.board_size
+        self.player_renderer = BoardRenderer(self.player_canvas, self.colors, True, size)
+        self.opponent_renderer = BoardRenderer(self.opponent_canvas, self.colors, False, size)
         self.draw_boards()
     
     def create_board_frame(self, parent, title, is_player):
@@ -176,280 +303,132 @@ class PixelArtBattleship:
                                 fg=self.colors['text'], bg=self.colors['bg'])
             text_label.pack(side='left', padx=(5, 0))
     
-    def draw_pixel_rect(self, canvas, x, y, size, color, pixel_size=4):
-        """Desenha um retângulo"""
-        for i in range(size):
-            for j in range(size):
-                if i == 0 or i == size-1 or j == 0 or j == size-1:
-                    canvas.create_rectangle(
-                        x + j * pixel_size,
-                        y + i * pixel_size,
-                        x + (j + 1) * pixel_size,
-                        y + (i + 1) * pixel_size,
-                        fill=color, outline=color
-                    )
+    def schedule(self, ms, callback):
+        return self.root.after(ms, callback)
     
-    def draw_boards(self):
-        """Desenha os tabuleiros"""
-        for canvas, is_player in [(self.player_canvas, True), (self.opponent_canvas, False)]:
-            canvas.delete("all")
-            
-            # Desenhar grade
-            cell_size = 30
-            grid_color = self.colors['grid']
-            
-            for i in range(11):
-                # Linhas horizontais
-                canvas.create_line(40, 40 + i * cell_size, 
-                                 40 + 10 * cell_size, 40 + i * cell_size,
-                                 width=2, fill=grid_color)
-                # Linhas verticais
-                canvas.create_line(40 + i * cell_size, 40,
-                                 40 + i * cell_size, 40 + 10 * cell_size,
-                                 width=2, fill=grid_color)
-            
-            # Coordenadas
-            letters = 'ABCDEFGHIJ'
-            for i, letter in enumerate(letters):
-                # Letras
-                canvas.create_text(25, 40 + i * cell_size + cell_size//2,
-                                 text=letter, font=('Courier New', 10, 'bold'),
-                                 fill=self.colors['text'])
-                # Números
-                canvas.create_text(40 + i * cell_size + cell_size//2, 25,
-                                 text=str(i+1), font=('Courier New', 10, 'bold'),
-                                 fill=self.colors['text'])
-            
-            # Desenhar conteúdo das células
-            board = self.my_board if is_player else self.opponent_board
-            for i in range(10):
-                for j in range(10):
-                    x = 40 + j * cell_size + 2
-                    y = 40 + i * cell_size + 2
-                    size = cell_size - 4
-                    
-                    cell_content = board[i][j]
-                    if cell_content == 'S' and is_player:  # Navio (só mostra no próprio tabuleiro)
-                        self.draw_pixel_rect(canvas, x, y, size//4, self.colors['ship'])
-                    elif cell_content == 'X':  # Acerto
-                        canvas.create_rectangle(x, y, x + size, y + size,
-                                              fill=self.colors['hit'], outline=self.colors['hit'])
-                    elif cell_content == 'O':  # Água
-                        canvas.create_rectangle(x, y, x + size, y + size,
-                                              fill=self.colors['miss'], outline=self.colors['miss'])
-                    elif cell_content == 'D':  # Afundado
-                        canvas.create_rectangle(x, y, x + size, y + size,
-                                              fill=self.colors['sunk'], outline=self.colors['sunk'])
+    def draw_status(self, text):
+        self.status_label.config(text=text)
     
-    def connect_to_server(self):
-        """Conecta ao servidor"""
-        try:
-            message = {'type': 'join'}
-            self.sock.sendto(json.dumps(message).encode(), self.server_addr)
-            threading.Thread(target=self.listen_for_messages, daemon=True).start()
-        except Exception as e:
-            self.show_error(f"Erro de conexão: {e}")
+    def draw_boards(self, waited=None):
+        """Atualiza só as células que mudaram desde o último quadro"""
+        started = time.perf_counter()
+        changed = (self.player_renderer.update(self.my_board) +
+                   self.opponent_renderer.update(self.opponent_board))
+        if self.frame_timer is not None:
+            # Forçar o redesenho do Tk para que ele entre na medida
+            self.root.update_idletasks()
+            self.frame_timer.record(time.perf_counter() - started, changed, waited)
     
-    def listen_for_messages(self):
-        """Escuta mensagens do servidor"""
-        while True:
-            try:
-                data, _ = self.sock.recvfrom(1024)
-                message = json.loads(data.decode())
-                self.root.after(0, self.handle_server_message, message)
-            except Exception as e:
-                print(f"Erro: {e}")
+    def boards_resized(self):
+        size = self.ruleset.board_size
+        self.player_renderer = BoardRenderer(self.player_canvas, self.colors, True, size)
+        self.opponent_renderer = BoardRenderer(self.opponent_canvas, self.colors, False, size)
     
-    def handle_server_message(self, message):
-        """Processa mensagens do servidor"""
-        msg_type = message.get('type')
-        
-        if msg_type == 'join_success':
-            self.player_id = message['player_id']
-            self.update_status(f"🎮 JOGADOR {self.player_id} CONECTADO")
-            
-        elif msg_type == 'game_start':
-            self.game_state = "placing"
-            self.update_status("🚀 POSICIONE SEUS NAVIOS!")
-            self.random_btn.config(state='normal')
-            
-        elif msg_type == 'placement_success':
-            self.ships_placed = True
-            self.update_status("⏳ AGUARDANDO OPONENTE...")
-            self.random_btn.config(state='disabled')
-            
-        elif msg_type == 'game_begin':
-            self.game_state = "playing"
-            self.current_turn = message['turn']
-            turn_text = "SUA VEZ! ⚡" if self.current_turn == self.player_id else "VEZ DO OPONENTE"
-            self.update_status(f"⚔️ {turn_text}")
-            self.restart_btn.config(state='normal')
-            
-        elif msg_type == 'shot_result':
-            self.handle_shot_result(message)
-            
-        elif msg_type == 'error':
-            self.show_error(message['message'])
-            
-        elif msg_type == 'game_restart':
-            self.handle_game_restart()
+    def set_controls(self, place=None, restart=None):
+        if place is not None:
+            self.random_btn.config(state='normal' if place else 'disabled')
+        if restart is not None:
+            self.restart_btn.config(state='normal' if restart else 'disabled')
     
-    def handle_shot_result(self, message):
-        """Processa resultado de tiro"""
-        x, y = message['x'], message['y']
-        result = message['result']
-        shooter = message['shooter']
-        self.current_turn = message['current_turn']
-        
-        # Atualizar tabuleiro apropriado
-        if shooter == self.player_id:  # Nosso tiro
-            if result == "acerto":
-                self.opponent_board[x][y] = 'X'
-                status = f"💥 ACERTOU! {message['ship_name']} ATINGIDO!"
-            elif result == "afundado":
-                self.opponent_board[x][y] = 'D'
-                status = f"💀 {message['ship_name']} AFUNDADO!"
-            else:  # erro
-                self.opponent_board[x][y] = 'O'
-                status = "🌊 ÁGUA! VEZ DO OPONENTE"
-        else:  # Tiro do oponente
-            if result == "acerto":
-                self.my_board[x][y] = 'X'
-                status = f"💥 OPONENTE ACERTOU SEU {message['ship_name']}!"
-            elif result == "afundado":
-                self.my_board[x][y] = 'D'
-                status = f"💀 SEU {message['ship_name']} FOI AFUNDADO!"
-            else:
-                self.my_board[x][y] = 'O'
-                status = "🌊 OPONENTE ERROU! SUA VEZ! ⚡"
-        
-        if message.get('game_over'):
-            winner = message['winner']
-            if winner == self.player_id:
-                status = "🎉 VITÓRIA! VOCÊ VENCEU! 🎉"
-            else:
-                status = "💀 DERROTA! OPONENTE VENCEU! 💀"
-            self.show_info("FIM DE JOGO", status)
-        
-        self.update_status(status)
-        self.draw_boards()
-    
-    def handle_game_restart(self):
-        """Reinicia o jogo no cliente"""
-        self.my_board = [[' ' for _ in range(10)] for _ in range(10)]
-        self.opponent_board = [[' ' for _ in range(10)] for _ in range(10)]
-        self.ships_placed = False
-        self.game_state = "placing"
-        self.update_status("🔄 JOGO REINICIADO! POSICIONE NAVIOS.")
-        self.random_btn.config(state='normal')
-        self.draw_boards()
+    def deliver(self, message):
+        """Passa uma mensagem da thread de rede para a interface.
+
+        As mensagens vão para uma fila; só a primeira de uma rajada agenda
+        uma passada no Tk, que aplica todas as pendentes de uma vez. Uma
+        rajada de tiros vira uma passada e um quadro, não um evento do Tk
+        e um redesenho por datagrama.
+        """
+        self.inbox.append((time.perf_counter(), message))
+        with self.inbox_lock:
+            if self.pump_scheduled:
+                return
+            self.pump_scheduled = True
+        self.root.after(0, self.pump)
     
-    def place_random_ships(self):
-        """Posiciona navios aleatoriamente"""
-        if self.game_state != "placing" or self.ships_placed:
-            return
-        
-        ships_data = []
-        ship_sizes = [5, 4, 3, 3, 2]
-        temp_board = [[' ' for _ in range(10)] for _ in range(10)]
-        
-        for size in ship_sizes:
-            placed = False
-            attempts = 0
-            
-            while not placed and attempts < 100:
-                attempts += 1
-                horizontal = random.choice([True, False])
-                
-                if horizontal:
-                    x = random.randint(0, 9)
-                    y = random.randint(0, 10 - size)
-                else:
-                    x = random.randint(0, 10 - size)
-                    y = random.randint(0, 9)
-                
-                # Verificar posição
-                can_place = True
-                positions = []
-                
-                for i in range(size):
-                    if horizontal:
-                        pos_x, pos_y = x, y + i
-                    else:
-                        pos_x, pos_y = x + i, y
-                    
-                    if not (0 <= pos_x < 10 and 0 <= pos_y < 10) or temp_board[pos_x][pos_y] != ' ':
-                        can_place = False
-                        break
-                    positions.append([pos_x, pos_y])
-                
-                if can_place:
-                    # Colocar navio
-                    for pos_x, pos_y in positions:
-                        temp_board[pos_x][pos_y] = 'S'
-                    
-                    ships_data.append({
-                        'positions': positions,
-                        'orientation': 'horizontal' if horizontal else 'vertical'
-                    })
-                    placed = True
-        
-        # Enviar para servidor
-        message = {'type': 'place_ships', 'ships': ships_data}
-        self.sock.sendto(json.dumps(message).encode(), self.server_addr)
-        
-        # Atualizar tabuleiro local
-        self.my_board = temp_board
-        self.draw_boards()
+    def pump(self):
+        """Aplica as mensagens pendentes (thread do Tk)"""
+        with self.inbox_lock:
+            self.pump_scheduled = False
+        inbox = self.inbox
+        for _ in range(min(len(inbox), MAX_BATCH)):
+            arrived, message = inbox.popleft()
+            if self.oldest is None:
+                self.oldest = arrived
+            self.handle_server_message(message)
+        if inbox:
+            # Sobrou: continuar depois dos eventos de tela e de mouse já na fila
+            with self.inbox_lock:
+                if self.pump_scheduled:
+                    return
+                self.pump_scheduled = True
+            self.root.after(1, self.pump)
     
     def on_opponent_click(self, event):
         """Clique no tabuleiro inimigo"""
-        if self.game_state != "playing" or self.current_turn != self.player_id:
-            return
-        
-        cell_size = 30
-        x = event.x - 40
-        y = event.y - 40
-        
-        if x < 0 or y < 0:
-            return
-        
-        col = x // cell_size
-        row = y // cell_size
-        
-        if 0 <= row < 10 and 0 <= col < 10:
-            if self.opponent_board[row][col] not in [' ', 'S']:
-                self.show_warning("🎯 Já atirou aqui!")
-                return
-            
-            message = {'type': 'shoot', 'x': row, 'y': col}
-            self.sock.sendto(json.dumps(message).encode(), self.server_addr)
+        cell = self.opponent_renderer.cell_at(event.x, event.y)
+        if cell is not None:
+            self.fire(*cell)
     
-    def restart_game(self):
-        """Solicita reinício"""
-        message = {'type': 'restart'}
-        self.sock.sendto(json.dumps(message).encode(), self.server_addr)
-    
-    def update_status(self, text):
-        """Atualiza texto de status"""
-        self.status_label.config(text=text)
-    
-    def show_error(self, message):
-        """Mostra erro"""
-        messagebox.showerror("ERRO", message)
-    
-    def show_warning(self, message):
-        """Mostra aviso"""
-        messagebox.showwarning("AVISO", message)
+    def notify(self, text, color):
+        """Aviso por cima da janela que some sozinho, sem travar o loop do Tk.
+
+        Avisos repetidos em sequência viram um só, com a contagem.
+        """
+        if text == self.toast_text:
+            self.toast_count += 1
+        else:
+            self.toast_text = text
+            self.toast_count = 1
+        label = text if self.toast_count == 1 else f"{text} (x{self.toast_count})"
+        self.toast.config(text=label, fg=self.colors[color])
+        self.toast.place(relx=0.5, y=8, anchor='n')
+        self.toast.lift()
+        if self.toast_timer is not None:
+            self.root.after_cancel(self.toast_timer)
+        self.toast_timer = self.root.after(NOTIFY_MS, self.hide_toast)
     
-    def show_info(self, title, message):
-        """Mostra informação"""
-        messagebox.showinfo(title, message)
+    def hide_toast(self):
+        self.toast.place_forget()
+        self.toast_timer = None
+        self.toast_text = None
     
     def run(self):
         """Inicia aplicação"""
         self.root.mainloop()
+        if self.frame_timer is not None:
+            print(self.frame_timer.summary())
 
 if __name__ == "__main__":
-    game = PixelArtBattleship()
+    parser = argparse.ArgumentParser(description="Cliente BATTLESHI.PY")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--protocol', choices=SUPPORTED_PROTOCOLS, default=PROTOCOL_JSON,
+                        help="bin1: frames binários compactos negociados no join")
+    parser.add_argument('--reliable', action='store_true',
+                        help="entrega confiável (seq, acks e retransmissão) sobre UDP")
+    parser.add_argument('--resume', metavar='TOKEN',
+                        help="volta a uma partida em andamento com o token da sessão")
+    parser.add_argument('--ai', metavar='DIFICULDADE',
+                        help="joga sozinho contra a IA do servidor (easy, medium, hard)")
+    parser.add_argument('--frame-stats', action='store_true',
+                        help="mede o tempo de cada quadro dos tabuleiros e mostra ao sair")
+    # A interface só desenha tabuleiros densos; os esparsos ficam para os bots
+    parser.add_argument('--rules', choices=[name for name, rs in RULESETS.items() if not rs.sparse],
+                        help="regras da partida (tamanho do tabuleiro e frota)")
+    parser.add_argument('--spectate', type=int, metavar='MATCH_ID',
+                        help="assiste a uma partida em andamento, sem navios intactos")
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help="atraso da transmissão para espectadores, em segundos")
+    parser.add_argument('--ranked', metavar='NOME',
+                        help="entra na fila ranqueada e é pareado com alguém de nota próxima")
+    args = parser.parse_args()
+    if args.ai is not None:
+        # A IA (e as tabelas de frotas que ela usa) só é importada se for pedida
+        from ai_battleshipy import DIFFICULTIES
+        if args.ai not in DIFFICULTIES:
+            parser.error(f"--ai: escolha entre {', '.join(DIFFICULTIES)}")
+    
+    game = PixelArtBattleship((args.host, args.port), args.protocol, args.reliable, args.resume,
+                              args.ai, args.frame_stats, args.rules, args.spectate, args.delay,
+                              args.ranked)
     game.run()
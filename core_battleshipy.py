@@ -0,0 +1,571 @@
+import time
+import socket
+import threading
+from protocol_battleshipy import (
+    PROTOCOL_JSON, ERR_PLAYER_NOT_FOUND, ERR_NOT_PLAYING, ERR_NOT_YOUR_TURN,
+    decode, encode, is_envelope, unpack_batch,
+)
+from rules_battleshipy import DEFAULT_RULESET, parse_rules
+from sync_battleshipy import ShotTracker
+
+FRAME_INTERVAL = 1 / 60  # No máximo um redesenho por quadro (~60 Hz)
+NOTIFY_MS = 3000         # Tempo na tela de um aviso
+SYNC_PROBE_MS = 1000     # Vez do oponente sem notícias: conferir se algum tiro se perdeu
+SYNC_RETRY = 0.5         # Segundos antes de repetir o mesmo pedido de sync
+MARKS = {'acerto': 'X', 'afundado': 'D'}  # Resultado do tiro -> célula ('O' para erro)
+
+
+class FrameTimer:
+    """Tempos de quadro do desenho dos tabuleiros (--frame-stats)"""
+
+    def __init__(self):
+        self.samples = []
+        self.waits = []  # Da chegada da mensagem mais antiga ao quadro que a mostrou
+        self.cells = 0
+
+    def record(self, elapsed, changed, waited=None):
+        self.samples.append(elapsed)
+        self.cells += changed
+        if waited is not None:
+            self.waits.append(waited)
+
+    def summary(self):
+        if not self.samples:
+            return "🖼️ Nenhum quadro desenhado"
+        ordered = sorted(self.samples)
+        p50 = ordered[len(ordered) // 2] * 1000
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+        summary = (f"🖼️ {len(ordered)} quadros: p50 {p50:.2f} ms, p99 {p99:.2f} ms, "
+                   f"máx {ordered[-1] * 1000:.2f} ms, "
+                   f"{self.cells / len(ordered):.1f} células por quadro")
+        if self.waits:
+            waits = sorted(self.waits)
+            summary += (f", espera até o quadro p50 {waits[len(waits) // 2] * 1000:.1f} ms "
+                        f"p99 {waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000:.1f} ms")
+        return summary
+
+
+class ClientCore:
+    """Protocolo e estado de um cliente, sem interface.
+
+    Join, resume, fila ranqueada, espectador, tiros conferidos por seq e
+    hash e quadros acumulados ficam aqui; a interface (tkinter no
+    client_battleshipy, terminal no term_battleshipy) herda e implementa
+    schedule, draw_status, draw_boards e notify. A camada confiável, as
+    tabelas de frotas e a fila ranqueada só são importadas quando usadas.
+    """
+
+    def __init__(self, server_addr=('127.0.0.1', 12345), protocol=PROTOCOL_JSON,
+                 reliable=False, resume_token=None, ai_difficulty=None, frame_stats=False,
+                 rules=None, spectate=None, delay=0.0, ranked=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server_addr = server_addr
+        self.reliable = None
+        if reliable:
+            from reliable_battleshipy import ReliableEndpoint
+            self.reliable = ReliableEndpoint()
+        self.requested_protocol = protocol
+        self.protocol = PROTOCOL_JSON  # Até o servidor aceitar no join_success
+        self.ai_difficulty = ai_difficulty  # Jogar sozinho contra a IA do servidor
+        self.requested_rules = rules  # Nome do preset pedido no join
+        self.ruleset = DEFAULT_RULESET  # Até o servidor confirmar no join_success
+        self.spectate_match = spectate  # Assistir a uma partida em vez de jogar
+        self.spectate_delay = delay
+        self.spectate_nonce = None  # Devolvido ao servidor para a transmissão começar
+        self.ranked_name = ranked  # Nome na fila ranqueada
+        self.queued = False
+        self.frame_timer = FrameTimer() if frame_stats else None
+        self.player_id = None
+        self.match_id = None
+        self.token = resume_token
+        self.game_state = "waiting"
+        self.current_turn = None
+        self.my_board = self.empty_board()
+        self.opponent_board = self.empty_board()
+        self.ships_placed = False
+        # Conferência dos tiros: seq e hash Zobrist de cada shot_result
+        self.shots = ShotTracker()
+        self.sync_requested = None  # (since, instante) do último pedido de sync
+        self.snapshot_key = None    # (seq, hash) do snapshot em partes sendo montado
+        self.snapshot_parts = {}
+        self.last_event = time.monotonic()
+
+        # Redesenho acumulado: boards e status vão para a tela uma vez por quadro
+        self.oldest = None  # Chegada da mensagem mais antiga ainda não desenhada
+        self.dirty = False
+        self.frame_pending = False
+        self.last_frame = 0.0
+        self.pending_status = None
+
+    # Ganchos da interface
+
+    def schedule(self, ms, callback):
+        """Chama callback no loop da interface daqui a ms milissegundos"""
+        raise NotImplementedError
+
+    def draw_status(self, text):
+        """Mostra o texto de status"""
+
+    def draw_boards(self, waited=None):
+        """Leva os tabuleiros à tela; waited é a espera da mensagem mais antiga"""
+
+    def boards_resized(self):
+        """Os tabuleiros mudaram de tamanho (regras da partida)"""
+
+    def set_controls(self, place=None, restart=None):
+        """Habilita ou desabilita as ações (None: sem mudança)"""
+
+    def notify(self, text, color):
+        """Aviso passageiro; color é uma chave de COLORS"""
+        print(text)
+
+    def show_session(self, token):
+        print(f"🔑 Sessão: {token} (use --resume para voltar à partida)")
+
+    def deliver(self, message):
+        """Mensagem vinda da thread de rede; a interface a passa para o seu loop"""
+        self.schedule(0, lambda: self.handle_server_message(message))
+
+    # Quadros
+
+    def request_redraw(self):
+        """Marca os tabuleiros como alterados; o desenho fica para o próximo quadro"""
+        self.dirty = True
+        self.request_frame()
+
+    def request_frame(self):
+        """Agenda um quadro, no máximo um pendente e um a cada FRAME_INTERVAL"""
+        if self.frame_pending:
+            return
+        self.frame_pending = True
+        delay = self.last_frame + FRAME_INTERVAL - time.perf_counter()
+        self.schedule(max(0, int(delay * 1000)), self.render_frame)
+
+    def render_frame(self):
+        """Leva à tela tudo o que mudou desde o quadro anterior"""
+        self.frame_pending = False
+        self.last_frame = now = time.perf_counter()
+        waited = None if self.oldest is None else now - self.oldest
+        self.oldest = None
+        if self.pending_status is not None:
+            self.draw_status(self.pending_status)
+            self.pending_status = None
+        if self.dirty:
+            self.dirty = False
+            self.draw_boards(waited)
+
+    def update_status(self, text):
+        """Atualiza texto de status (no próximo quadro; vale o último)"""
+        self.pending_status = text
+        self.request_frame()
+
+    def show_error(self, message):
+        """Mostra erro"""
+        self.notify(message, 'hit')
+
+    def show_warning(self, message):
+        """Mostra aviso"""
+        self.notify(message, 'sunk')
+
+    def show_info(self, title, message):
+        """Mostra informação"""
+        self.notify(f"{title}: {message}", 'accent')
+
+    # Rede
+
+    def connect_to_server(self):
+        """Conecta ao servidor"""
+        try:
+            if self.reliable is not None:
+                from reliable_battleshipy import start_retransmit_timer
+                start_retransmit_timer(self.reliable, self.sock.sendto)
+            if self.spectate_match is not None:
+                self.spectate()
+            elif self.token:
+                self.resume_session()
+            else:
+                self.send_join()
+            if self.spectate_match is None:
+                self.schedule(SYNC_PROBE_MS, self.probe_sync)
+            self.start_listener()
+        except Exception as e:
+            self.show_error(f"Erro de conexão: {e}")
+
+    def start_listener(self):
+        """Recebe numa thread; interfaces com loop próprio de select não precisam"""
+        threading.Thread(target=self.listen_for_messages, daemon=True).start()
+
+    def listen_for_messages(self):
+        """Escuta mensagens do servidor"""
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(65535)
+                for message in self.receive(data):
+                    self.deliver(message)
+            except Exception as e:
+                print(f"Erro: {e}")
+
+    def receive(self, data):
+        """Mensagens de um datagrama: envelope confiável (com ack) e lote desfeitos"""
+        if self.reliable is not None and is_envelope(data):
+            payloads = self.reliable.receive(self.server_addr, data)
+            ack = self.reliable.take_ack(self.server_addr)
+            if ack is not None:
+                self.sock.sendto(ack, self.server_addr)
+        else:
+            payloads = [data]
+        return [decode(frame) for payload in payloads for frame in unpack_batch(payload)]
+
+    def send_message(self, message):
+        """Envia mensagem ao servidor, identificando a partida"""
+        if self.match_id is not None:
+            message['match_id'] = self.match_id
+        data = encode(message, self.protocol)
+        if self.reliable is not None:
+            data = self.reliable.wrap(self.server_addr, data, self.match_id)
+        self.sock.sendto(data, self.server_addr)
+
+    def send_join(self):
+        message = {'type': 'join', 'protocol': self.requested_protocol, 'batch': True}
+        if self.ai_difficulty:
+            message.update(mode='ai', difficulty=self.ai_difficulty)
+        elif self.ranked_name:
+            message.update(mode='ranked', name=self.ranked_name)
+        if self.requested_rules:
+            message['rules'] = self.requested_rules
+        self.send_message(message)
+
+    def refresh_queue(self):
+        """Renova o lugar na fila ranqueada até ser pareado"""
+        from matchmaking_battleshipy import QUEUE_TTL
+        if self.player_id is None:
+            self.send_join()
+            self.schedule(int(QUEUE_TTL * 1000 / 3), self.refresh_queue)
+
+    def resume_session(self):
+        """Reassocia a sessão a este endereço; a resposta traz o estado completo"""
+        self.match_id = int(self.token.split('-', 1)[0])
+        self.send_message({'type': 'resume', 'token': self.token,
+                           'protocol': self.requested_protocol, 'batch': True})
+
+    def spectate(self):
+        """Assina (ou renova) a transmissão da partida; o servidor esquece quem não renova"""
+        self.send_spectate()
+        self.schedule(10000, self.spectate)
+
+    def send_spectate(self):
+        message = {'type': 'spectate', 'match_id': self.spectate_match,
+                   'delay': self.spectate_delay}
+        if self.spectate_nonce is not None:
+            message['nonce'] = self.spectate_nonce
+        self.send_message(message)
+
+    # Mensagens do servidor
+
+    def handle_server_message(self, message):
+        """Processa mensagens do servidor"""
+        msg_type = message.get('type')
+        if self.spectate_match is not None:
+            self.handle_spectator_message(message)
+            return
+
+        if msg_type == 'join_success':
+            self.player_id = message['player_id']
+            self.match_id = message.get('match_id')
+            self.protocol = message.get('protocol', PROTOCOL_JSON)
+            self.token = message.get('token')
+            self.apply_rules(message.get('rules'))
+            self.shots.reset()
+            if self.token:
+                self.show_session(self.token)
+            self.update_status(f"🎮 JOGADOR {self.player_id} CONECTADO")
+
+        elif msg_type == 'queued':
+            self.update_status(f"⏳ NA FILA RANQUEADA (nota {message['rating']} ± {message['rd']})")
+            if not self.queued:
+                from matchmaking_battleshipy import QUEUE_TTL
+                self.queued = True
+                self.schedule(int(QUEUE_TTL * 1000 / 3), self.refresh_queue)
+
+        elif msg_type == 'queue_expired':
+            self.send_join()
+
+        elif msg_type == 'snapshot':
+            self.handle_snapshot(message)
+
+        elif msg_type == 'game_start':
+            self.game_state = "placing"
+            self.update_status("🚀 POSICIONE SEUS NAVIOS!")
+            self.set_controls(place=True)
+
+        elif msg_type == 'placement_success':
+            self.ships_placed = True
+            self.update_status("⏳ AGUARDANDO OPONENTE...")
+            self.set_controls(place=False)
+
+        elif msg_type == 'game_begin':
+            self.game_state = "playing"
+            self.current_turn = message['turn']
+            turn_text = "SUA VEZ! ⚡" if self.current_turn == self.player_id else "VEZ DO OPONENTE"
+            self.update_status(f"⚔️ {turn_text}")
+            self.set_controls(restart=True)
+
+        elif msg_type == 'shot_result':
+            self.handle_shot_result(message)
+
+        elif msg_type == 'sync':
+            self.handle_sync(message)
+
+        elif msg_type == 'error':
+            if message.get('code') == ERR_PLAYER_NOT_FOUND and self.token:
+                # Nosso endereço mudou (NAT, reinício): retomar a sessão
+                self.resume_session()
+                return
+            if message.get('code') in (ERR_NOT_YOUR_TURN, ERR_NOT_PLAYING):
+                # Vez ou fim de jogo que não chegaram até aqui
+                self.request_sync()
+            self.show_error(message['message'])
+
+        elif msg_type == 'game_restart':
+            self.handle_game_restart()
+
+    def handle_shot_result(self, message):
+        """Processa resultado de tiro"""
+        verdict = self.shots.check(message)
+        if verdict == 'old':
+            return  # Duplicado, ou já veio num sync
+        if verdict == 'gap':
+            # Faltam tiros antes deste: eles e este chegam no sync
+            self.request_sync()
+            return
+        self.last_event = time.monotonic()
+        x, y = message['x'], message['y']
+        result = message['result']
+        shooter = message['shooter']
+        self.current_turn = message['current_turn']
+
+        # Atualizar tabuleiro apropriado
+        if shooter == self.player_id:  # Nosso tiro
+            self.opponent_board[x][y] = MARKS.get(result, 'O')
+            if result == "acerto":
+                status = f"💥 ACERTOU! {message['ship_name']} ATINGIDO!"
+            elif result == "afundado":
+                status = f"💀 {message['ship_name']} AFUNDADO!"
+            else:  # erro
+                status = "🌊 ÁGUA! VEZ DO OPONENTE"
+        else:  # Tiro do oponente
+            self.my_board[x][y] = MARKS.get(result, 'O')
+            if result == "acerto":
+                status = f"💥 OPONENTE ACERTOU SEU {message['ship_name']}!"
+            elif result == "afundado":
+                status = f"💀 SEU {message['ship_name']} FOI AFUNDADO!"
+            else:
+                status = "🌊 OPONENTE ERROU! SUA VEZ! ⚡"
+
+        if message.get('game_over'):
+            winner = message['winner']
+            if winner == self.player_id:
+                status = "🎉 VITÓRIA! VOCÊ VENCEU! 🎉"
+            else:
+                status = "💀 DERROTA! OPONENTE VENCEU! 💀"
+            self.show_info("FIM DE JOGO", status)
+
+        self.update_status(status)
+        self.request_redraw()
+        if verdict == 'desync':
+            self.request_sync(full=True)
+
+    def request_sync(self, full=False):
+        """Pede os tiros depois do último conferido (full: o estado completo)"""
+        since = None if full else self.shots.seq
+        now = time.monotonic()
+        if self.sync_requested is not None:
+            last_since, requested_at = self.sync_requested
+            if last_since == since and now - requested_at < SYNC_RETRY:
+                return
+        self.sync_requested = (since, now)
+        message = {'type': 'sync'}
+        if full:
+            message['full'] = True
+        else:
+            message['since'] = since
+        self.send_message(message)
+
+    def handle_sync(self, message):
+        """Aplica os tiros que faltavam e confere o hash do servidor"""
+        for event in message['events']:
+            self.handle_shot_result(event)
+        if self.shots.seq < message['seq']:
+            self.sync_requested = None
+            self.request_sync()  # O resto vem no próximo pedido
+        elif self.shots.matches(message['seq'], message['hash']):
+            self.sync_requested = None
+        else:
+            # Divergiu: estado completo, sem furar o intervalo entre pedidos
+            self.request_sync(full=True)
+
+    def probe_sync(self):
+        """Na vez do oponente, sem tiros há algum tempo, confere se algum se perdeu"""
+        if (self.game_state == "playing" and self.current_turn != self.player_id
+                and time.monotonic() - self.last_event >= SYNC_PROBE_MS / 1000):
+            self.request_sync()
+        self.schedule(SYNC_PROBE_MS, self.probe_sync)
+
+    def handle_spectator_message(self, message):
+        """Espectador: os dois tabuleiros vistos de fora, sem navios intactos"""
+        msg_type = message.get('type')
+        if msg_type == 'spectate_success':
+            self.spectate_nonce = message.get('nonce', self.spectate_nonce)
+            if message.get('streaming') is False:
+                # Desafio: devolver o nonce prova o endereço e inicia a transmissão
+                self.send_spectate()
+                return
+            self.apply_rules(message.get('rules'))
+            self.update_status(f"👀 ASSISTINDO À PARTIDA {message['match_id']}")
+        elif msg_type == 'spectate_state':
+            self.apply_rules(message.get('rules'))
+            self.game_state = message['game_state']
+            self.current_turn = message['current_turn']
+            boards = {entry['player_id']: entry['radar'] for entry in message['boards']}
+            self.my_board = self.board_from_view(boards.get(1))
+            self.opponent_board = self.board_from_view(boards.get(2))
+            self.request_redraw()
+        elif msg_type == 'shot_result':
+            # O tiro do jogador 1 cai no tabuleiro do jogador 2 e vice-versa
+            board = self.opponent_board if message['shooter'] == 1 else self.my_board
+            board[message['x']][message['y']] = MARKS.get(message['result'], 'O')
+            self.current_turn = message['current_turn']
+            if message.get('game_over'):
+                self.update_status(f"🎉 JOGADOR {message['winner']} VENCEU!")
+            else:
+                self.update_status(f"👀 VEZ DO JOGADOR {self.current_turn}")
+            self.request_redraw()
+        elif msg_type == 'game_restart':
+            self.my_board = self.empty_board()
+            self.opponent_board = self.empty_board()
+            self.update_status("🔄 PARTIDA REINICIADA")
+            self.request_redraw()
+        elif msg_type == 'error':
+            self.show_error(message['message'])
+        elif message.get('message'):
+            self.update_status(message['message'])
+
+    def handle_snapshot(self, message):
+        """Redesenha tudo a partir do estado completo enviado no resume"""
+        if message.get('parts') is not None:
+            message = self.collect_snapshot(message)
+            if message is None:
+                return
+        self.player_id = message['player_id']
+        self.match_id = message['match_id']
+        self.protocol = message.get('protocol', PROTOCOL_JSON)
+        self.apply_rules(message.get('rules'))
+        self.game_state = message['game_state']
+        self.current_turn = message['current_turn']
+        self.ships_placed = message['ready']
+        self.my_board = self.board_from_view(message['board'])
+        self.opponent_board = self.board_from_view(message['radar'])
+        self.shots.reset(message.get('seq', 0), message.get('hash', 0))
+        self.sync_requested = None
+        self.last_event = time.monotonic()
+
+        self.set_controls(place=self.game_state == "placing" and not self.ships_placed,
+                          restart=self.game_state in ("playing", "finished"))
+
+        if self.game_state == "playing":
+            turn_text = "SUA VEZ! ⚡" if self.current_turn == self.player_id else "VEZ DO OPONENTE"
+            self.update_status(f"🔁 RECONECTADO — {turn_text}")
+        else:
+            self.update_status(f"🔁 JOGADOR {self.player_id} RECONECTADO")
+        self.request_redraw()
+
+    def collect_snapshot(self, message):
+        """Junta as partes de um snapshot grande; devolve-o inteiro quando completo"""
+        key = (message['seq'], message['hash'])
+        if self.snapshot_key != key:
+            self.snapshot_key = key
+            self.snapshot_parts = {}
+            self.schedule(int(SYNC_RETRY * 1000), lambda: self.check_snapshot(key))
+        self.snapshot_parts[message['part']] = message
+        if len(self.snapshot_parts) < message['parts']:
+            return None
+        snapshot = self.snapshot_parts[0]
+        for index in range(1, message['parts']):
+            for side in ('board', 'radar'):
+                for name, cells in (self.snapshot_parts[index][side] or {}).items():
+                    snapshot[side][name].extend(cells)
+        self.snapshot_key = None
+        self.snapshot_parts = {}
+        return snapshot
+
+    def check_snapshot(self, key):
+        """Alguma parte do snapshot se perdeu: pedir o estado completo de novo"""
+        if self.snapshot_key == key:
+            self.snapshot_key = None
+            self.snapshot_parts = {}
+            self.request_sync(full=True)
+
+    def handle_game_restart(self):
+        """Reinicia o jogo no cliente"""
+        self.my_board = self.empty_board()
+        self.opponent_board = self.empty_board()
+        self.shots.reset()
+        self.ships_placed = False
+        self.game_state = "placing"
+        self.update_status("🔄 JOGO REINICIADO! POSICIONE NAVIOS.")
+        self.set_controls(place=True)
+        self.request_redraw()
+
+    # Tabuleiros e ações do jogador
+
+    def empty_board(self):
+        size = self.ruleset.board_size
+        return [[' '] * size for _ in range(size)]
+
+    def apply_rules(self, rules):
+        """Adota as regras da partida e refaz os tabuleiros se o tamanho mudou"""
+        ruleset = parse_rules(rules) if rules else DEFAULT_RULESET
+        if ruleset.key == self.ruleset.key:
+            return
+        self.ruleset = ruleset
+        self.my_board = self.empty_board()
+        self.opponent_board = self.empty_board()
+        self.boards_resized()
+
+    def board_from_view(self, view):
+        """Monta um tabuleiro local a partir das listas de células do snapshot"""
+        board = self.empty_board()
+        for key, mark in (('ships', 'S'), ('hits', 'X'), ('misses', 'O'), ('sunk', 'D')):
+            for x, y in (view or {}).get(key, []):
+                board[x][y] = mark
+        return board
+
+    def place_random_ships(self):
+        """Posiciona navios aleatoriamente"""
+        if self.game_state != "placing" or self.ships_placed:
+            return
+
+        # Frota completa e uniforme, sorteada das tabelas de posicionamentos
+        from fleet_battleshipy import random_fleet_positions
+        ships_data = random_fleet_positions(self.ruleset)
+
+        # Enviar para servidor
+        self.send_message({'type': 'place_ships', 'ships': ships_data})
+
+        # Atualizar tabuleiro local
+        self.my_board = self.board_from_view(
+            {'ships': [cell for ship in ships_data for cell in ship['positions']]})
+        self.request_redraw()
+
+    def fire(self, row, col):
+        """Atira na célula do tabuleiro inimigo, se for a nossa vez"""
+        if self.game_state != "playing" or self.current_turn != self.player_id:
+            return
+        if self.opponent_board[row][col] not in [' ', 'S']:
+            self.show_warning("🎯 Já atirou aqui!")
+            return
+        self.send_message({'type': 'shoot', 'x': row, 'y': col})
+
+    def restart_game(self):
+        """Solicita reinício"""
+        self.send_message({'type': 'restart'})
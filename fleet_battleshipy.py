@@ -0,0 +1,189 @@
+import random
+from board_battleshipy import BOARD_SIZE, SHIP_SIZES, PLACEMENT_MASKS, mask_cells
+from rules_battleshipy import DEFAULT_RULESET
+
+MAX_ATTEMPTS = 64  # Com ~50% de aceitação, falhar todas tem chance ~2**-64
+PAIR_TABLE_LIMIT = 50000  # Acima disso o par vira dois grupos avulsos
+
+
+def fleet_positions(fleet, board_size=BOARD_SIZE):
+    """Máscaras da frota no formato de place_ships"""
+    return [{'positions': mask_cells(mask, board_size)} for mask in fleet]
+
+
+def fleet_mask(fleet):
+    """Todas as células ocupadas pela frota"""
+    occupied = 0
+    for mask in fleet:
+        occupied |= mask
+    return occupied
+
+
+class FleetSampler:
+    """Sorteia frotas completas, sem sobreposição e uniformes entre todas as legais.
+
+    Os navios são agrupados em pares consecutivos e, para cada par, a tabela
+    guarda só as combinações que não se sobrepõem: (união, máscara, máscara).
+    Sortear uma frota é escolher uma entrada por grupo e rejeitar se os grupos
+    se cruzam. Como a rejeição é da frota inteira, o resultado é uniforme.
+    """
+
+    def __init__(self, ship_sizes=SHIP_SIZES, placement_masks=PLACEMENT_MASKS):
+        self.ship_sizes = list(ship_sizes)
+        # Posicionamentos legais por tamanho, indexáveis para sorteio
+        self.placements = {size: tuple(sorted(placement_masks[size]))
+                           for size in set(self.ship_sizes)}
+        self.groups = []
+        for i in range(0, len(self.ship_sizes), 2):
+            self.groups += self._group_tables(self.ship_sizes[i:i + 2])
+
+    def _group_tables(self, sizes):
+        if len(sizes) == 2:
+            first, second = sizes
+            if len(self.placements[first]) * len(self.placements[second]) <= PAIR_TABLE_LIMIT:
+                return [tuple((a | b, a, b)
+                              for a in self.placements[first]
+                              for b in self.placements[second] if not a & b)]
+        # Navio avulso (ou par grande demais para tabelar)
+        return [tuple((mask, mask) for mask in self.placements[size]) for size in sizes]
+
+    def _accept(self, entries):
+        """Máscaras da frota se os grupos não se cruzam, senão None"""
+        occupied = 0
+        fleet = []
+        for entry in entries:
+            if entry[0] & occupied:
+                return None
+            occupied |= entry[0]
+            fleet += entry[1:]
+        return tuple(fleet)
+
+    def random_fleet(self, rng=random):
+        """Uma frota: tupla de máscaras na ordem de ship_sizes"""
+        for _ in range(MAX_ATTEMPTS):
+            fleet = self._accept([rng.choice(group) for group in self.groups])
+            if fleet is not None:
+                return fleet
+        return self._sequential_fleet(rng)
+
+    def _sequential_fleet(self, rng):
+        # Fallback de tempo limitado (não uniforme): navio a navio entre as
+        # posições livres, do maior para o menor
+        while True:
+            fleet = {}
+            occupied = 0
+            for index in sorted(range(len(self.ship_sizes)), key=lambda i: -self.ship_sizes[i]):
+                options = [m for m in self.placements[self.ship_sizes[index]] if not m & occupied]
+                if not options:
+                    break
+                fleet[index] = rng.choice(options)
+                occupied |= fleet[index]
+            else:
+                return tuple(fleet[i] for i in range(len(self.ship_sizes)))
+
+    def sample_fleets(self, count, rng=random):
+        """`count` frotas de uma vez, sorteando os grupos em lote com choices"""
+        fleets = []
+        append = fleets.append
+        accept = self._accept
+        # Frota padrão (dois pares e um navio avulso): laço desenrolado
+        standard = [len(group[0]) for group in self.groups] == [3, 3, 2]
+        while len(fleets) < count:
+            batch = 2 * (count - len(fleets)) + 16
+            columns = [rng.choices(group, k=batch) for group in self.groups]
+            if standard:
+                for (u1, a, b), (u2, c, d), (u3, e) in zip(*columns):
+                    if not u1 & u2 and not (u1 | u2) & u3:
+                        append((a, b, c, d, e))
+                continue
+            for entries in zip(*columns):
+                fleet = accept(entries)
+                if fleet is not None:
+                    append(fleet)
+        del fleets[count:]
+        return fleets
+
+
+class SparseFleetSampler:
+    """Sorteia frotas de tabuleiros grandes sem enumerar posicionamentos.
+
+    Cada navio escolhe orientação e posição uniformes (há tantos
+    posicionamentos horizontais quanto verticais) e a frota inteira é
+    rejeitada se dois navios se cruzam, o que mantém a uniformidade. Frotas
+    são listas de células, nunca grades ou máscaras da área toda.
+    """
+
+    def __init__(self, ship_sizes, board_size):
+        self.ship_sizes = list(ship_sizes)
+        self.board_size = board_size
+
+    def _place(self, size, rng):
+        n = self.board_size
+        if rng.random() < 0.5:
+            x, y = rng.randrange(n), rng.randrange(n - size + 1)
+            return [(x, y + i) for i in range(size)]
+        x, y = rng.randrange(n - size + 1), rng.randrange(n)
+        return [(x + i, y) for i in range(size)]
+
+    def random_fleet(self, rng=random):
+        """Uma frota: lista de células por navio, na ordem de ship_sizes"""
+        for _ in range(MAX_ATTEMPTS):
+            occupied = set()
+            fleet = []
+            for size in self.ship_sizes:
+                cells = self._place(size, rng)
+                if not occupied.isdisjoint(cells):
+                    break
+                occupied.update(cells)
+                fleet.append(cells)
+            else:
+                return fleet
+        return self._sequential_fleet(rng)
+
+    def _sequential_fleet(self, rng):
+        # Fallback (não uniforme): sorteia de novo só o navio que cruzou
+        occupied = set()
+        fleet = []
+        for size in self.ship_sizes:
+            cells = self._place(size, rng)
+            while not occupied.isdisjoint(cells):
+                cells = self._place(size, rng)
+            occupied.update(cells)
+            fleet.append(cells)
+        return fleet
+
+
+DEFAULT_SAMPLER = FleetSampler()
+PLACEMENTS = DEFAULT_SAMPLER.placements
+_SAMPLERS = {DEFAULT_RULESET.key: DEFAULT_SAMPLER}
+
+
+def fleet_sampler(ruleset):
+    """Gerador de frotas das regras, criado uma vez por ruleset"""
+    sampler = _SAMPLERS.get(ruleset.key)
+    if sampler is None:
+        if ruleset.sparse:
+            sampler = SparseFleetSampler(ruleset.ship_sizes, ruleset.board_size)
+        else:
+            sampler = FleetSampler(ruleset.ship_sizes,
+                                   {size: ruleset.placements(size) for size in set(ruleset.ship_sizes)})
+        _SAMPLERS[ruleset.key] = sampler
+    return sampler
+
+
+def random_fleet(rng=random):
+    """Frota completa e uniforme com as regras padrão"""
+    return DEFAULT_SAMPLER.random_fleet(rng)
+
+
+def sample_fleets(count, rng=random):
+    """Lote de frotas uniformes com as regras padrão"""
+    return DEFAULT_SAMPLER.sample_fleets(count, rng)
+
+
+def random_fleet_positions(ruleset=DEFAULT_RULESET, rng=random):
+    """Frota aleatória de qualquer ruleset, no formato de place_ships"""
+    fleet = fleet_sampler(ruleset).random_fleet(rng)
+    if ruleset.sparse:
+        return [{'positions': [list(cell) for cell in cells]} for cells in fleet]
+    return fleet_positions(fleet, ruleset.board_size)
@@ -0,0 +1,134 @@
+import threading
+from collections import deque
+
+# Taxa (mensagens/s) e rajada de cada classe de mensagem, por endereço. Um
+# jogador humano manda poucas mensagens por segundo; os bots de carga, mais de
+# mil numa máquina rápida. Join e afins pegam o lock do registro de partidas e
+# custam mais.
+DEFAULT_RATES = {
+    'game': (2000.0, 4000.0),   # place_ships, shoot, restart e envelopes
+    'session': (20.0, 40.0),    # join, resume, spectate
+    'admin': (5.0, 10.0),       # stats, profile
+    'other': (100.0, 200.0),    # tipos desconhecidos e lixo
+    'stranger': (10.0, 20.0),   # mensagens de jogo de quem não está em partida
+}
+# Orçamento somado de todos os endereços fora de partidas: uma enxurrada de
+# muitas origens, cada uma abaixo do seu limite, não passa daqui
+STRANGERS_RATE = (2000.0, 4000.0)
+MESSAGE_CLASSES = {
+    'place_ships': 'game', 'shoot': 'game', 'restart': 'game',
+    'join': 'session', 'resume': 'session', 'spectate': 'session', 'unspectate': 'session',
+    'unqueue': 'session', 'sync': 'session',
+    'stats': 'admin', 'profile': 'admin',
+}
+MAX_BUCKETS = 65536
+INGRESS_LIMIT = 4096
+SHED_POLICIES = ('oldest', 'busy')
+
+
+class RateLimiter:
+    """Token buckets por (endereço, classe de mensagem).
+
+    Chamado só pela thread que lê o socket (ou pelo event loop), então não
+    usa lock. Um bucket cheio é igual a um bucket inexistente, e é isso que
+    a limpeza descarta quando há endereços demais.
+    """
+
+    def __init__(self, rates=DEFAULT_RATES, scale=1.0, max_buckets=MAX_BUCKETS):
+        self.rates = {cls: (rate * scale, burst * scale) for cls, (rate, burst) in rates.items()}
+        self.strangers_rate = (STRANGERS_RATE[0] * scale, STRANGERS_RATE[1] * scale)
+        self.strangers = [self.strangers_rate[1], 0.0]
+        self.enabled = scale > 0
+        self.max_buckets = max_buckets
+        self.buckets = {}  # (addr, classe) -> [tokens, última atualização]
+
+    def allow(self, addr, msg_type, now, known=True):
+        """True se o datagrama cabe nos limites; `known` diz se addr está numa partida"""
+        if not self.enabled:
+            return True
+        cls = MESSAGE_CLASSES.get(msg_type, 'other')
+        if not known:
+            if not self._take(self.strangers, self.strangers_rate, now):
+                return False
+            if cls == 'game':
+                cls = 'stranger'
+        rate = self.rates[cls]
+        key = (addr, cls)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_buckets and not self._sweep(now):
+                # Endereços ativos demais (origem forjada): quem já tem bucket
+                # continua atendido, endereços novos esperam a limpeza
+                return False
+            bucket = self.buckets[key] = [rate[1], now]
+        return self._take(bucket, rate, now)
+
+    @staticmethod
+    def _take(bucket, rate, now):
+        rate, burst = rate
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1.0
+        return True
+
+    def _sweep(self, now):
+        """Descarta os buckets que já voltaram a encher; True se abriu espaço"""
+        rates = self.rates
+        full = [key for key, (tokens, last) in self.buckets.items()
+                if tokens + (now - last) * rates[key[1]][0] >= rates[key[1]][1]]
+        for key in full:
+            del self.buckets[key]
+        return len(self.buckets) < self.max_buckets
+
+
+class IngressQueue:
+    """Fila limitada entre a leitura do socket e os handlers.
+
+    Duas prioridades: datagramas de quem já está numa partida passam na
+    frente de joins e de endereços desconhecidos, então uma enxurrada de
+    pares novos não atrasa os jogos em andamento. Cheia, a fila descarta o
+    item mais antigo daquela prioridade ('oldest') ou recusa o novo ('busy').
+    """
+
+    def __init__(self, limit=INGRESS_LIMIT, policy='oldest'):
+        if policy not in SHED_POLICIES:
+            raise ValueError(f"política de descarte desconhecida: {policy}")
+        self.limit = limit
+        self.policy = policy
+        self.queues = (deque(), deque())  # 0: pares em partida, 1: o resto
+        self.cond = threading.Condition()
+        self.closed = False
+
+    def __len__(self):
+        return len(self.queues[0]) + len(self.queues[1])
+
+    def put(self, item, priority):
+        """Enfileira; devolve o item descartado (o mais antigo ou o próprio), ou None"""
+        with self.cond:
+            queue = self.queues[priority]
+            shed = None
+            if len(queue) >= self.limit:
+                if self.policy == 'busy':
+                    return item
+                shed = queue.popleft()
+            queue.append(item)
+            self.cond.notify()
+            return shed
+
+    def get(self):
+        """Próximo item, esperando se preciso; None depois de close()"""
+        with self.cond:
+            urgent, normal = self.queues
+            while not urgent and not normal:
+                if self.closed:
+                    return None
+                self.cond.wait()
+            return urgent.popleft() if urgent else normal.popleft()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
@@ -0,0 +1,272 @@
+import os
+import mmap
+import struct
+import bisect
+import threading
+from array import array
+from rules_battleshipy import parse_rules
+
+# Diário de uma partida: cabeçalho com as regras e registros só anexados.
+#   cabeçalho: marca, match_id, tamanho do tabuleiro, número de navios e os tamanhos
+#   registro:  tipo, jogador, tamanho do conteúdo e o conteúdo
+JOURNAL_MAGIC = b'BSJ1'
+FILE_HEADER = struct.Struct('!4sIHH')
+SHIP_SIZE = struct.Struct('!H')
+RECORD = struct.Struct('!BBI')
+SHIP = struct.Struct('!HHB')          # origem e orientação (1 = vertical)
+SHOT = struct.Struct('!HHBH')         # x, y, resultado e ship_id (NO_SHIP = água)
+CELL = struct.Struct('!HH')
+CHECKPOINT = struct.Struct('!IBBB')   # eventos anteriores, estado, vez e jogadores
+CHECKPOINT_PLAYER = struct.Struct('!BBHI')  # id, pronto, navios e tiros recebidos
+
+REC_PLACE = 1
+REC_SHOT = 2
+REC_RESTART = 3
+REC_CHECKPOINT = 4
+EVENT_KINDS = (REC_PLACE, REC_SHOT, REC_RESTART)
+
+RESULT_CODES = {'erro': 0, 'acerto': 1, 'afundado': 2}
+RESULTS = {code: result for result, code in RESULT_CODES.items()}
+STATE_CODES = {'waiting': 0, 'placing': 1, 'playing': 2, 'finished': 3}
+STATES = {code: state for state, code in STATE_CODES.items()}
+NO_SHIP = 0xFFFF
+
+# Um checkpoint sai quando os eventos desde o último somam metade do estado
+# salvo: o diário cresce no máximo ~1,7x e chegar a qualquer lance reaplica
+# no máximo max(64, metade dos tiros) eventos
+CHECKPOINT_INTERVAL = 64
+# Diários com o arquivo aberto ao mesmo tempo; os menos usados fecham e
+# reabrem em modo append no próximo registro
+MAX_OPEN_JOURNALS = 256
+
+
+class JournalError(ValueError):
+    """Arquivo que não é um diário válido"""
+
+
+def encode_fleet(ships):
+    """Navios como origem e orientação; o tamanho vem das regras"""
+    parts = []
+    for positions in ships:
+        (x, y), vertical = positions[0], len(positions) > 1 and positions[1][0] != positions[0][0]
+        parts.append(SHIP.pack(x, y, vertical))
+    return b''.join(parts)
+
+
+def decode_fleet(data, ship_sizes, offset=0):
+    """Inverso de encode_fleet, no formato de place_ships"""
+    fleet = []
+    for size in ship_sizes:
+        x, y, vertical = SHIP.unpack_from(data, offset)
+        offset += SHIP.size
+        if vertical:
+            fleet.append({'positions': [[x + i, y] for i in range(size)]})
+        else:
+            fleet.append({'positions': [[x, y + i] for i in range(size)]})
+    return fleet, offset
+
+
+class MatchJournal:
+    """Escreve o diário de uma partida: lances aceitos e checkpoints periódicos.
+
+    Chamado sempre com o lock da partida. Cada registro é um write só no fim
+    do arquivo, então um crash perde no máximo o último registro, que o
+    leitor ignora se estiver truncado. suspend() fecha o arquivo de fora da
+    partida (limite de arquivos abertos); o próximo registro o reabre.
+    """
+
+    def __init__(self, path, match_id, ruleset):
+        self.path = path
+        self.ruleset = ruleset
+        self.lock = threading.Lock()  # Arquivo: registros da partida contra suspend()
+        self.file = open(path, 'ab')
+        self.events = 0
+        self.since_checkpoint = 0
+        self.shots = 0  # Tiros desde o último reinício: o tamanho de um checkpoint
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(JOURNAL_MAGIC, match_id, ruleset.board_size,
+                                             len(ruleset.ship_sizes)))
+            self.file.write(b''.join(SHIP_SIZE.pack(size) for size in ruleset.ship_sizes))
+            self.file.flush()
+        else:
+            # Reaberto depois de uma partida encerrada: continuar a contagem e
+            # descartar um registro final truncado
+            with JournalReader(path) as reader:
+                self.events = len(reader)
+                end = reader.end
+            if end < self.file.tell():
+                self.file.truncate(end)
+
+    def _append(self, kind, player_id, payload=b''):
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'ab')
+            self.file.write(RECORD.pack(kind, player_id, len(payload)) + payload)
+            self.file.flush()
+
+    def _event(self, kind, player_id, payload=b''):
+        self._append(kind, player_id, payload)
+        self.events += 1
+        self.since_checkpoint += 1
+
+    def place(self, player):
+        self._event(REC_PLACE, player.id, encode_fleet([ship.positions for ship in player.ships]))
+
+    def shot(self, shooter_id, x, y, result, ship):
+        self._event(REC_SHOT, shooter_id,
+                    SHOT.pack(x, y, RESULT_CODES[result], ship.id if ship else NO_SHIP))
+        self.shots += 1
+
+    def restart(self):
+        # O reinício zera o estado: é um checkpoint por si só
+        self._event(REC_RESTART, 0)
+        self.since_checkpoint = 0
+        self.shots = 0
+
+    def checkpoint_due(self):
+        state_size = self.shots + len(self.ruleset.ship_sizes)
+        return self.since_checkpoint >= max(CHECKPOINT_INTERVAL, state_size // 2)
+
+    def checkpoint(self, game_state, current_turn, players):
+        """Estado completo depois de `events` eventos"""
+        players = sorted(players, key=lambda p: p.id)
+        parts = [CHECKPOINT.pack(self.events, STATE_CODES[game_state], current_turn,
+                                 len(players))]
+        for player in players:
+            shots = player.shot_cells()
+            parts.append(CHECKPOINT_PLAYER.pack(player.id, player.ready,
+                                                len(player.ships), len(shots)))
+            parts.append(encode_fleet([ship.positions for ship in player.ships]))
+            parts.append(b''.join(CELL.pack(x, y) for x, y in shots))
+        self._append(REC_CHECKPOINT, 0, b''.join(parts))
+        self.since_checkpoint = 0
+
+    def suspend(self):
+        """Fecha o arquivo até o próximo registro"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def close(self):
+        self.suspend()
+
+
+class Checkpoint:
+    """Estado salvo num checkpoint: por jogador, frota (ou None) e tiros recebidos"""
+    __slots__ = ('events', 'game_state', 'current_turn', 'players')
+
+    def __init__(self, events, game_state, current_turn, players):
+        self.events = events
+        self.game_state = game_state
+        self.current_turn = current_turn
+        self.players = players  # player_id -> (frota ou None, [(x, y), ...])
+
+
+class JournalReader:
+    """Lê um diário por mmap, sem carregá-lo na memória.
+
+    Uma varredura só dos cabeçalhos indexa onde começa cada evento e cada
+    checkpoint; para chegar ao lance N basta decodificar o último checkpoint
+    antes dele e os poucos eventos seguintes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < FILE_HEADER.size:
+            self.file.close()
+            raise JournalError(f"diário vazio ou truncado: {path}")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.match_id, board_size, count = FILE_HEADER.unpack_from(self.data)
+        if magic != JOURNAL_MAGIC:
+            self.close()
+            raise JournalError(f"não é um diário: {path}")
+        offset = FILE_HEADER.size
+        sizes = [SHIP_SIZE.unpack_from(self.data, offset + i * SHIP_SIZE.size)[0]
+                 for i in range(count)]
+        self.ruleset = parse_rules({'board_size': board_size, 'ships': sizes})
+        self.start = offset + count * SHIP_SIZE.size
+        self.offsets = array('Q')      # Início de cada evento
+        self.checkpoints = array('Q')  # Eventos anteriores a cada checkpoint
+        self.checkpoint_offsets = array('Q')
+        self.end = self.start  # Fim do último registro completo
+        self._scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _scan(self):
+        data = self.data
+        end = len(data)
+        offset = self.start
+        unpack = RECORD.unpack_from
+        while offset + RECORD.size <= end:
+            kind, _, length = unpack(data, offset)
+            if offset + RECORD.size + length > end:
+                break  # Último registro truncado por um crash
+            if kind == REC_CHECKPOINT:
+                self.checkpoints.append(CHECKPOINT.unpack_from(data, offset + RECORD.size)[0])
+                self.checkpoint_offsets.append(offset)
+            elif kind in EVENT_KINDS:
+                if kind == REC_RESTART:
+                    # Estado vazio depois do reinício: checkpoint implícito
+                    self.checkpoints.append(len(self.offsets) + 1)
+                    self.checkpoint_offsets.append(offset)
+                self.offsets.append(offset)
+            offset += RECORD.size + length
+        self.end = offset
+
+    def event(self, index):
+        """(tipo, jogador, dados) do evento `index`"""
+        offset = self.offsets[index]
+        kind, player_id, _ = RECORD.unpack_from(self.data, offset)
+        body = offset + RECORD.size
+        if kind == REC_SHOT:
+            x, y, result, ship_id = SHOT.unpack_from(self.data, body)
+            return kind, player_id, (x, y, RESULTS[result], None if ship_id == NO_SHIP else ship_id)
+        if kind == REC_PLACE:
+            return kind, player_id, decode_fleet(self.data, self.ruleset.ship_sizes, body)[0]
+        return kind, player_id, None
+
+    def events(self, start=0, stop=None):
+        for index in range(start, len(self) if stop is None else min(stop, len(self))):
+            yield self.event(index)
+
+    def checkpoint_before(self, index):
+        """Último checkpoint com no máximo `index` eventos antes dele, ou None"""
+        position = bisect.bisect_right(self.checkpoints, index) - 1
+        if position < 0:
+            return None
+        offset = self.checkpoint_offsets[position]
+        kind = self.data[offset]
+        if kind == REC_RESTART:
+            return Checkpoint(self.checkpoints[position], 'placing', 1, {})
+        return self._decode_checkpoint(offset + RECORD.size)
+
+    def _decode_checkpoint(self, offset):
+        data = self.data
+        events, state, turn, count = CHECKPOINT.unpack_from(data, offset)
+        offset += CHECKPOINT.size
+        players = {}
+        for _ in range(count):
+            player_id, ready, ships, shots = CHECKPOINT_PLAYER.unpack_from(data, offset)
+            offset += CHECKPOINT_PLAYER.size
+            fleet = None
+            if ships:
+                fleet, offset = decode_fleet(data, self.ruleset.ship_sizes, offset)
+            cells = [CELL.unpack_from(data, offset + i * CELL.size) for i in range(shots)]
+            offset += shots * CELL.size
+            players[player_id] = (fleet if ready else None, cells)
+        return Checkpoint(events, STATES[state], turn, players)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
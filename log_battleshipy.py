@@ -0,0 +1,163 @@
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+
+LOG_CAPACITY = 65536       # Registros na fila antes de começar a descartar
+LOG_FLUSH_INTERVAL = 0.05  # A thread de escrita esvazia a fila a cada 50 ms
+LOG_FORMATS = ('text', 'json')
+
+
+def parse_sample(specs):
+    """['shot=100', 'DEBUG=10'] -> {'shot': 100, logging.DEBUG: 10}: manter 1 a cada N"""
+    sample = {}
+    for spec in specs or ():
+        key, _, every = spec.partition('=')
+        level = logging.getLevelName(key.upper())
+        sample[level if isinstance(level, int) else key] = max(1, int(every))
+    return sample
+
+
+class EventLog:
+    """Registro estruturado com a formatação e a E/S numa thread própria.
+
+    Cada evento é um nome, um template e campos. No caminho da requisição só
+    se testam o nível, a amostragem e o limite da fila, e uma tupla vai para
+    a fila; a thread de escrita monta o texto do template (ou uma linha JSON
+    com os campos) e o entrega aos handlers que estavam no logger raiz.
+    Mensagens do módulo logging passam pela mesma fila. Sem start(), emite
+    na hora, na thread de quem chamou.
+    """
+
+    def __init__(self, capacity=LOG_CAPACITY, sample=None, fmt='text', context=None):
+        self.logger = logging.getLogger('battleshipy')
+        self.records = deque()
+        self.handlers = []   # Handlers do logger raiz, usados só pela thread de escrita
+        self.thread = None
+        self.stopping = threading.Event()
+        self.seen = {}       # evento ou nível -> eventos vistos (amostragem)
+        # Contadores sem lock: sob disputa, um incremento raro pode se perder
+        self.dropped = 0
+        self.sampled_out = 0
+        self.configure(capacity, sample, fmt, context)
+
+    def __len__(self):
+        return len(self.records)
+
+    def configure(self, capacity=LOG_CAPACITY, sample=None, fmt='text', context=None):
+        if fmt not in LOG_FORMATS:
+            raise ValueError(f"formato de log desconhecido: {fmt}")
+        self.capacity = capacity
+        self.sample = dict(sample or {})  # evento ou nível -> manter 1 a cada N
+        self.format = fmt
+        self.context = dict(context or {})  # Campos de toda linha JSON (ex.: worker)
+
+    def debug(self, event, template, **fields):
+        self.log(logging.DEBUG, event, template, fields)
+
+    def info(self, event, template, **fields):
+        self.log(logging.INFO, event, template, fields)
+
+    def warning(self, event, template, **fields):
+        self.log(logging.WARNING, event, template, fields)
+
+    def log(self, level, event, template, fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        key = event if event in self.sample else level
+        every = self.sample.get(key)
+        if every is not None:
+            seen = self.seen[key] = self.seen.get(key, 0) + 1
+            if seen % every:
+                self.sampled_out += 1
+                return
+        if self.thread is None:
+            self.logger.handle(self._record(time.time(), level, event, template, fields))
+            return
+        if len(self.records) >= self.capacity:
+            self.dropped += 1
+            return
+        self.records.append((time.time(), level, event, template, fields))
+
+    def enqueue(self, record):
+        """Registro do módulo logging (já criado, ainda não formatado)"""
+        if len(self.records) >= self.capacity:
+            self.dropped += 1
+            return
+        self.records.append(record)
+
+    def start(self):
+        """Passa os handlers do logger raiz para a thread de escrita"""
+        if self.thread is not None:
+            return
+        root = logging.getLogger()
+        self.handlers = list(root.handlers)
+        root.handlers = [_QueueHandler(self)]
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True, name='battleshipy-log')
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Esvazia a fila e devolve os handlers ao logger raiz"""
+        thread = self.thread
+        if thread is None:
+            return
+        self.thread = None
+        self.stopping.set()
+        thread.join(timeout=1.0)
+        self.drain()
+        logging.getLogger().handlers = self.handlers
+
+    def _run(self):
+        while not self.stopping.wait(LOG_FLUSH_INTERVAL):
+            self.drain()
+
+    def drain(self):
+        """Formata e escreve tudo o que está na fila"""
+        records = self.records
+        while records:
+            item = records.popleft()
+            if isinstance(item, logging.LogRecord):
+                record = item
+                if self.format == 'json':
+                    record.msg = json.dumps({'ts': round(record.created, 6),
+                                             'level': record.levelname, 'event': 'log',
+                                             **self.context, 'message': record.getMessage()},
+                                            ensure_ascii=False)
+                    record.args = None
+            else:
+                record = self._record(*item)
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def _record(self, ts, level, event, template, fields):
+        if self.format == 'json':
+            message = json.dumps({'ts': round(ts, 6), 'level': logging.getLevelName(level),
+                                  'event': event, **self.context, **fields},
+                                 default=str, ensure_ascii=False)
+        else:
+            message = template.format(**fields)
+        record = self.logger.makeRecord(self.logger.name, level, event, 0, message, None, None)
+        record.created = ts
+        record.msecs = (ts - int(ts)) * 1000
+        return record
+
+
+class _QueueHandler(logging.Handler):
+    """No logger raiz: põe os registros na fila do EventLog, sem formatar nem travar"""
+
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def handle(self, record):
+        self.events.enqueue(record)
+        return True
+
+
+# Um registro por processo, como o próprio módulo logging
+log = EventLog()
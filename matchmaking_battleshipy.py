@@ -0,0 +1,314 @@
+import os
+import json
+import math
+import heapq
+import itertools
+import threading
+from metrics_battleshipy import Histogram
+
+# Glicko-1: cada jogador tem uma nota e um desvio (RD), a incerteza sobre ela.
+# O desvio cai a cada partida e volta a crescer com o tempo sem jogar.
+INITIAL_RATING = 1500.0
+INITIAL_RD = 350.0
+MIN_RD = 30.0
+RD_GROWTH = 35.0 ** 2  # Variância somada por dia sem jogar (~100 dias até 350)
+GLICKO_Q = math.log(10) / 400
+
+# Janela de pareamento: começa estreita e se alarga com a espera
+WINDOW_BASE = 50.0
+WINDOW_GROWTH = 25.0  # pontos por segundo na fila
+WINDOW_MAX = 1000.0
+QUEUE_TTL = 30.0      # Sem renovar o join nesse tempo, o jogador sai da fila
+RATING_SLOTS = 4096   # Notas arredondadas e limitadas a [0, RATING_SLOTS)
+MAX_NAME = 32
+EPSILON = 1e-6
+
+
+def _g(rd):
+    return 1 / math.sqrt(1 + 3 * (GLICKO_Q * rd) ** 2 / math.pi ** 2)
+
+
+def glicko_update(rating, rd, opponent, opponent_rd, score):
+    """Nova (nota, desvio) depois de uma partida com resultado score (1, 0,5 ou 0)"""
+    g = _g(opponent_rd)
+    expected = 1 / (1 + 10 ** (-g * (rating - opponent) / 400))
+    d2 = 1 / (GLICKO_Q ** 2 * g ** 2 * expected * (1 - expected))
+    precision = 1 / rd ** 2 + 1 / d2
+    rating += GLICKO_Q / precision * g * (score - expected)
+    return rating, max(MIN_RD, math.sqrt(1 / precision))
+
+
+class RatingBook:
+    """Notas por nome de jogador, opcionalmente persistidas num arquivo JSON.
+
+    O arquivo é regravado inteiro (temporário + rename) por save(), chamado
+    periodicamente pelo servidor e ao parar; sem caminho, fica só em memória.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.ratings = {}  # nome -> [nota, desvio, partidas, último jogo (epoch)]
+        self.dirty = False
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.ratings = json.load(f)
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def get(self, name, now):
+        """(nota, desvio) atuais, com o desvio inflado pelo tempo sem jogar"""
+        with self.lock:
+            entry = self.ratings.get(name)
+        if entry is None:
+            return INITIAL_RATING, INITIAL_RD
+        rating, rd, _, last = entry
+        days = max(0.0, now - last) / 86400
+        return rating, min(INITIAL_RD, math.sqrt(rd ** 2 + RD_GROWTH * days))
+
+    def record(self, winner, loser, now):
+        """Atualiza os dois lados de uma vitória; devolve as novas notas"""
+        (rw, dw), (rl, dl) = self.get(winner, now), self.get(loser, now)
+        new_winner = glicko_update(rw, dw, rl, dl, 1.0)
+        new_loser = glicko_update(rl, dl, rw, dw, 0.0)
+        with self.lock:
+            for name, (rating, rd) in ((winner, new_winner), (loser, new_loser)):
+                games = self.ratings.get(name, (0, 0, 0))[2]
+                self.ratings[name] = [rating, rd, games + 1, now]
+            self.dirty = True
+        return new_winner, new_loser
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        with self.lock:
+            data = json.dumps(self.ratings)
+            self.dirty = False
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+class Ticket:
+    """Um jogador na fila"""
+    __slots__ = ('addr', 'name', 'rating', 'slot', 'key', 'message',
+                 'enqueued', 'expires', 'retry_at', 'queued')
+
+    def __init__(self, addr, name, rating, key, message, now, ttl):
+        self.addr = addr
+        self.name = name
+        self.rating = rating
+        self.slot = min(RATING_SLOTS - 1, max(0, int(round(rating))))
+        self.key = key          # Regras: só se pareia quem pediu as mesmas
+        self.message = message  # O join original, reaproveitado ao parear
+        self.enqueued = now
+        self.expires = now + ttl
+        self.retry_at = None
+        self.queued = True
+
+
+class RatingIndex:
+    """Jogadores na fila ordenados por nota.
+
+    Uma árvore de Fenwick conta os jogadores de cada nota inteira; o vizinho
+    mais próximo abaixo e acima de uma nota sai em O(log RATING_SLOTS) com
+    duas buscas por posição. Cada nota guarda seus jogadores em ordem de
+    chegada (um dict), então o mais antigo é atendido primeiro.
+    """
+
+    def __init__(self, slots=RATING_SLOTS):
+        self.slots = slots
+        self.tree = [0] * (slots + 1)
+        self.buckets = {}  # nota -> {ticket: None}
+        self.size = 0
+        self.top = 1 << (slots.bit_length() - 1)
+
+    def __len__(self):
+        return self.size
+
+    def _update(self, slot, delta):
+        i = slot + 1
+        tree = self.tree
+        while i <= self.slots:
+            tree[i] += delta
+            i += i & -i
+        self.size += delta
+
+    def _prefix(self, slot):
+        """Jogadores com nota <= slot"""
+        i = slot + 1
+        total = 0
+        tree = self.tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _find(self, k):
+        """Menor nota com pelo menos k jogadores até ela (1 <= k <= size)"""
+        pos = 0
+        tree = self.tree
+        step = self.top
+        while step:
+            nxt = pos + step
+            if nxt <= self.slots and tree[nxt] < k:
+                pos = nxt
+                k -= tree[nxt]
+            step >>= 1
+        return pos  # índice 0-based da nota
+
+    def add(self, ticket):
+        self.buckets.setdefault(ticket.slot, {})[ticket] = None
+        self._update(ticket.slot, 1)
+
+    def remove(self, ticket):
+        bucket = self.buckets[ticket.slot]
+        del bucket[ticket]
+        if not bucket:
+            del self.buckets[ticket.slot]
+        self._update(ticket.slot, -1)
+
+    def neighbors(self, slot):
+        """O jogador mais antigo da nota mais próxima abaixo (inclusive) e acima"""
+        found = []
+        below = self._prefix(slot)
+        if below:
+            found.append(next(iter(self.buckets[self._find(below)])))
+        if below < self.size:
+            above = self._find(below + 1)
+            found.append(next(iter(self.buckets[above])))
+        return found
+
+
+class Matchmaker:
+    """Fila de partidas ranqueadas com pareamento por nota.
+
+    Dois jogadores se pareiam quando a diferença de notas cabe na janela de
+    ambos; a janela cresce com a espera. Cada tentativa olha só os vizinhos
+    de nota (O(log n)) e, sem par aceitável, agenda a próxima num heap para o
+    instante exato em que as janelas alcançarão o vizinho mais próximo; não
+    há varredura periódica da fila. A espera até o pareamento vai para um
+    histograma.
+    """
+
+    def __init__(self, window_base=WINDOW_BASE, window_growth=WINDOW_GROWTH,
+                 window_max=WINDOW_MAX, ttl=QUEUE_TTL):
+        self.window_base = window_base
+        self.window_growth = window_growth
+        self.window_max = window_max
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.indexes = {}   # chave das regras -> RatingIndex
+        self.tickets = {}   # addr -> Ticket
+        self.retries = []   # heap de (instante, seq, ticket)
+        self.seq = itertools.count()
+        self.waits = Histogram()  # µs da entrada na fila ao pareamento
+        self.paired = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def window(self, ticket, now):
+        return min(self.window_max,
+                   self.window_base + self.window_growth * (now - ticket.enqueued))
+
+    def _reaches(self, ticket, gap):
+        """Instante em que a janela do ticket alcança gap (inf se nunca)"""
+        if gap <= self.window_base:
+            return ticket.enqueued
+        if gap > self.window_max:
+            return math.inf
+        return ticket.enqueued + (gap - self.window_base) / self.window_growth
+
+    def enqueue(self, addr, name, rating, key, message, now):
+        """Põe na fila (ou renova); devolve (pares formados, jogadores na fila)"""
+        with self.lock:
+            ticket = self.tickets.get(addr)
+            if ticket is not None:
+                # join repetido: renova o prazo sem perder o lugar
+                ticket.expires = now + self.ttl
+                return [], len(self.tickets)
+            ticket = Ticket(addr, name, rating, key, message, now, self.ttl)
+            self.tickets[addr] = ticket
+            index = self.indexes.get(key)
+            if index is None:
+                index = self.indexes[key] = RatingIndex()
+            index.add(ticket)
+            pair = self._attempt(ticket, now)
+            return ([pair] if pair else []), len(self.tickets)
+
+    def cancel(self, addr):
+        """Tira um jogador da fila; True se ele estava nela"""
+        with self.lock:
+            ticket = self.tickets.get(addr)
+            if ticket is None:
+                return False
+            self._drop(ticket)
+            return True
+
+    def due(self, now):
+        """Refaz as tentativas vencidas; devolve (pares, tickets expirados)"""
+        pairs = []
+        expired = []
+        with self.lock:
+            retries = self.retries
+            while retries and retries[0][0] <= now:
+                at, _, ticket = heapq.heappop(retries)
+                if not ticket.queued or ticket.retry_at != at:
+                    continue  # Pareado, cancelado ou reagendado depois
+                if now >= ticket.expires:
+                    self._drop(ticket)
+                    self.expired += 1
+                    expired.append(ticket)
+                    continue
+                pair = self._attempt(ticket, now)
+                if pair:
+                    pairs.append(pair)
+        return pairs, expired
+
+    def _drop(self, ticket):
+        ticket.queued = False
+        del self.tickets[ticket.addr]
+        self.indexes[ticket.key].remove(ticket)
+
+    def _attempt(self, ticket, now):
+        """Pareia com o melhor vizinho aceitável ou agenda a próxima tentativa"""
+        index = self.indexes[ticket.key]
+        index.remove(ticket)
+        best = None
+        retry = math.inf
+        window = self.window(ticket, now)
+        for other in index.neighbors(ticket.slot):
+            gap = abs(other.rating - ticket.rating)
+            if gap <= window + EPSILON and gap <= self.window(other, now) + EPSILON:
+                if best is None or gap < best[0]:
+                    best = (gap, other)
+            else:
+                retry = min(retry, max(self._reaches(ticket, gap), self._reaches(other, gap)))
+        index.add(ticket)
+        if best is not None:
+            other = best[1]
+            self._drop(ticket)
+            self._drop(other)
+            for paired in (ticket, other):
+                self.waits.record(int((now - paired.enqueued) * 1e6))
+            self.paired += 2
+            # Quem está na fila há mais tempo é o jogador 1
+            return (other, ticket) if other.enqueued <= ticket.enqueued else (ticket, other)
+        # Sem vizinho alcançável, só uma chegada nova ou o prazo mudam algo
+        ticket.retry_at = min(retry, ticket.expires)
+        heapq.heappush(self.retries, (ticket.retry_at, next(self.seq), ticket))
+        return None
+
+    def report(self):
+        return {'queued': len(self.tickets), 'paired': self.paired,
+                'expired': self.expired, 'wait_us': self.waits.summary()}
+
+
+def valid_name(name):
+    return isinstance(name, str) and 0 < len(name.strip()) <= MAX_NAME
@@ -0,0 +1,247 @@
+import time
+import json
+import socket
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from protocol_battleshipy import encode, decode
+
+# Histogramas log-lineares no estilo HDR: cada potência de dois é dividida em
+# 2**SUB_BUCKET_BITS faixas iguais, então qualquer valor cai num bucket com
+# erro relativo de no máximo 1/8, com o mesmo custo para 1 µs ou 10 s
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_EXPONENT = 40  # ~12 dias em µs; acima disso tudo cai no último bucket
+BUCKETS = SUB_BUCKETS * (MAX_EXPONENT - SUB_BUCKET_BITS + 1)
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def bucket_index(value):
+    """Bucket de um valor inteiro não negativo"""
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return min(BUCKETS - 1, SUB_BUCKETS * (shift + 1) + (value >> shift) - SUB_BUCKETS)
+
+
+def bucket_upper(index):
+    """Maior valor que cai no bucket `index`"""
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return ((SUB_BUCKETS + index % SUB_BUCKETS + 1) << shift) - 1
+
+
+class Histogram:
+    """Distribuição de latências em µs: registrar é um índice e um incremento"""
+    __slots__ = ('counts', 'count', 'sum', 'max', 'lock')
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def record(self, value):
+        index = bucket_index(value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        """Limite superior do bucket que contém o quantil q"""
+        with self.lock:
+            if not self.count:
+                return 0
+            rank = max(1, int(q * self.count + 0.5))
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank:
+                    return min(bucket_upper(index), self.max)
+            return self.max
+
+    def summary(self):
+        summary = {'count': self.count, 'max': self.max,
+                   'mean': self.sum / self.count if self.count else 0}
+        for q in QUANTILES:
+            summary[f"p{q * 100:g}"] = self.quantile(q)
+        return summary
+
+
+class TimedLock:
+    """Lock que mede quanto cada thread esperou para adquiri-lo"""
+    __slots__ = ('lock', 'waits')
+
+    def __init__(self, lock, waits):
+        self.lock = lock
+        self.waits = waits  # Histogram de espera em µs
+
+    def acquire(self):
+        started = time.perf_counter_ns()
+        self.lock.acquire()
+        self.waits.record((time.perf_counter_ns() - started) // 1000)
+        return True
+
+    def release(self):
+        self.lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+class ServerMetrics:
+    """Contadores e histogramas do servidor, baratos o bastante para ficar sempre ligados"""
+
+    COUNTERS = ('datagrams_received', 'datagrams_sent', 'datagrams_dropped_in',
+                'datagrams_dropped_out', 'datagrams_rate_limited', 'datagrams_shed',
+                'journal_errors', 'matches_closed')
+
+    def __init__(self):
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.active_handlers = 0
+        self.handlers = {}  # tipo de mensagem -> Histogram do tempo de tratamento
+        self.lock_wait = Histogram()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def handler_started(self):
+        with self.lock:
+            self.counters['datagrams_received'] += 1
+            self.active_handlers += 1
+
+    def handler_finished(self):
+        with self.lock:
+            self.active_handlers -= 1
+
+    def observe(self, msg_type, elapsed_ns):
+        """Tempo de tratamento de uma mensagem"""
+        histogram = self.handlers.get(msg_type)
+        if histogram is None:
+            with self.lock:
+                histogram = self.handlers.setdefault(msg_type, Histogram())
+        histogram.record(elapsed_ns // 1000)
+
+    def report(self, gauges, counters=None):
+        """Tudo num dicionário (a resposta da mensagem stats).
+
+        `counters` traz contadores mantidos por outros componentes.
+        """
+        with self.lock:
+            counters = dict(self.counters, **(counters or {}))
+            gauges = dict(gauges, active_handlers=self.active_handlers,
+                          threads=threading.active_count())
+            handlers = dict(self.handlers)
+        return {
+            'type': 'stats',
+            'uptime': time.time() - self.started,
+            'counters': counters,
+            'gauges': gauges,
+            'latency_us': {msg_type: h.summary() for msg_type, h in sorted(handlers.items())},
+            'lock_wait_us': self.lock_wait.summary(),
+        }
+
+
+def render_prometheus(report, prefix='battleshipy'):
+    """Relatório no formato texto do Prometheus (latências como summaries em segundos)"""
+    lines = []
+    for name, value in report['counters'].items():
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value}")
+    for name, value in report['gauges'].items():
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name} {value}")
+
+    def summary(name, label, stats):
+        labels = f'{label},' if label else ''
+        for q in QUANTILES:
+            value = stats[f"p{q * 100:g}"] / 1e6
+            lines.append(f'{prefix}_{name}{{{labels}quantile="{q}"}} {value:.6f}')
+        suffix = f'{{{label}}}' if label else ''
+        lines.append(f"{prefix}_{name}_sum{suffix} {stats['mean'] * stats['count'] / 1e6:.6f}")
+        lines.append(f"{prefix}_{name}_count{suffix} {stats['count']}")
+
+    lines.append(f"# TYPE {prefix}_handler_seconds summary")
+    for msg_type, stats in report['latency_us'].items():
+        summary('handler_seconds', f'type="{msg_type}"', stats)
+    lines.append(f"# TYPE {prefix}_lock_wait_seconds summary")
+    summary('lock_wait_seconds', '', report['lock_wait_us'])
+    if 'pairing_wait_us' in report:
+        lines.append(f"# TYPE {prefix}_pairing_wait_seconds summary")
+        summary('pairing_wait_seconds', '', report['pairing_wait_us'])
+    lines.append(f"{prefix}_uptime_seconds {report['uptime']:.0f}")
+    return '\n'.join(lines) + '\n'
+
+
+def start_metrics_http(port, report, host='127.0.0.1'):
+    """Endpoint /metrics em texto do Prometheus numa thread própria"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = render_prometheus(report()).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"📈 {self.address_string()} {format % args}")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True, name='battleshipy-metrics')
+    thread.start()
+    return server
+
+
+def query_stats(server_addr, timeout=1.0):
+    """Envia uma mensagem stats ao servidor e devolve o relatório"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(encode({'type': 'stats'}), server_addr)
+        data, _ = sock.recvfrom(65535)
+    return decode(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Métricas de um servidor BATTLESHI.PY local")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--format', choices=['table', 'json', 'prometheus'], default='table')
+    args = parser.parse_args(argv)
+
+    report = query_stats((args.host, args.port))
+    if args.format == 'json':
+        print(json.dumps(report, indent=2))
+        return
+    if args.format == 'prometheus':
+        print(render_prometheus(report), end='')
+        return
+    print(f"⏱️ Uptime {report['uptime']:.0f}s")
+    for name, value in {**report['counters'], **report['gauges']}.items():
+        print(f"   {name:<24} {value}")
+    print(f"{'tipo':>14} {'n':>8} {'p50':>8} {'p99':>8} {'p99.9':>8} {'max':>8}  (µs)")
+    rows = dict(report['latency_us'], **{'(lock)': report['lock_wait_us']})
+    if 'pairing_wait_us' in report:
+        rows['(fila)'] = report['pairing_wait_us']
+    for msg_type, stats in rows.items():
+        print(f"{msg_type:>14} {stats['count']:>8} {stats['p50']:>8} {stats['p99']:>8} "
+              f"{stats['p99.9']:>8} {stats['max']:>8}")
+
+
+if __name__ == "__main__":
+    main()
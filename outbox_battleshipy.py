@@ -0,0 +1,62 @@
+import threading
+from protocol_battleshipy import BATCH_HEADER, BATCH_ITEM, MAX_BATCH, pack_batch
+
+# Orçamento de um lote em bytes: abaixo do MTU mínimo do IPv6 (1280) com
+# folga para os cabeçalhos IP/UDP e o envelope da camada confiável
+BATCH_BUDGET = 1200
+# Com janela 0 os lotes saem ao fim de cada handler; este tique só recolhe o
+# que foi enviado fora deles (fila ranqueada)
+FLUSH_FALLBACK = 0.01
+
+
+class Outbox:
+    """Datagramas por par à espera do próximo flush.
+
+    add() acumula os frames já codificados de cada par; flush() entrega a
+    `send(addr, data)` um lote por par (ou o próprio frame, se for só um).
+    Um frame que estouraria o orçamento faz o lote atual sair na hora. Os
+    envios acontecem com o lock tomado, então a ordem de cada par é a de add().
+    """
+
+    def __init__(self, send, budget=BATCH_BUDGET):
+        self.send = send
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.pending = {}  # addr -> [frames, bytes do lote]
+        self.batches = 0   # datagramas com mais de um frame
+        self.batched = 0   # frames que foram dentro deles
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, addr, data):
+        size = BATCH_ITEM.size + len(data)
+        with self.lock:
+            entry = self.pending.get(addr)
+            if entry is None:
+                self.pending[addr] = [[data], BATCH_HEADER.size + size]
+                return
+            if entry[1] + size > self.budget or len(entry[0]) >= MAX_BATCH:
+                self._send(addr, entry[0])
+                entry[0] = [data]
+                entry[1] = BATCH_HEADER.size + size
+            else:
+                entry[0].append(data)
+                entry[1] += size
+
+    def flush(self):
+        """Envia tudo o que está pendente"""
+        with self.lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, {}
+            for addr, (frames, _) in pending.items():
+                self._send(addr, frames)
+
+    def _send(self, addr, frames):
+        if len(frames) == 1:
+            self.send(addr, frames[0])
+            return
+        self.batches += 1
+        self.batched += len(frames)
+        self.send(addr, pack_batch(frames))
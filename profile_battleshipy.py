@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import socket
+import logging
+import argparse
+import threading
+from collections import Counter
+from protocol_battleshipy import encode, decode
+
+PROFILE_INTERVAL = 0.005  # 200 amostras por segundo por thread
+PROFILE_SECONDS = 10.0
+MAX_PROFILE_SECONDS = 300.0
+SWITCH_INTERVAL = 0.0001  # Só durante a janela de amostragem
+HANDLER_FRAME = '_handle_message'  # Threads fora dele não estão tratando datagramas
+TYPE_FRAME = '_dispatch_message'   # Onde o tipo da mensagem já é conhecido
+TOP_FUNCTIONS = 25
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Amostra as pilhas das threads do servidor durante uma janela de tempo.
+
+    Desligado, não custa nada: nenhum hook é instalado e o caminho dos
+    lances não consulta o profiler. Ligado, uma thread própria lê
+    sys._current_frames() a cada `interval` e conta as pilhas das threads
+    que estão dentro de _handle_message, com o tipo da mensagem (lido das
+    variáveis locais de _dispatch_message) na raiz. O resultado sai em
+    formato collapsed (uma pilha por linha e a contagem), o mesmo do
+    flamegraph.pl e do speedscope, mais um resumo por função e por tipo.
+    """
+
+    def __init__(self, directory='.', prefix='profile', interval=PROFILE_INTERVAL,
+                 all_threads=False):
+        self.directory = directory
+        self.prefix = prefix
+        self.interval = interval
+        self.all_threads = all_threads  # Incluir threads ociosas e auxiliares
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.stacks = Counter()
+        self.samples = 0
+        self.runs = 0
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self, seconds=PROFILE_SECONDS, on_done=None):
+        """Abre uma janela de amostragem; devolve o caminho base ou None se já houver uma"""
+        seconds = min(max(0.1, seconds), MAX_PROFILE_SECONDS)
+        with self.lock:
+            if self.thread is not None:
+                return None
+            self.runs += 1
+            base = os.path.join(self.directory, f"{self.prefix}-{self.runs}")
+            self.stacks = Counter()
+            self.samples = 0
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, args=(seconds, base, on_done),
+                                           daemon=True, name='battleshipy-profiler')
+            self.thread.start()
+        logging.info(f"🔬 Amostrando o servidor por {seconds:.1f}s ({base}.folded)")
+        return base
+
+    def stop(self):
+        """Encerra a janela atual antes do prazo (os arquivos são gravados do mesmo jeito)"""
+        self.stop_event.set()
+
+    def _run(self, seconds, base, on_done):
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        # Com o intervalo padrão (5 ms) a thread de amostragem só ganha o GIL
+        # quando um handler o solta, quase sempre num sendto, e as amostras
+        # se concentram ali; um intervalo curto durante a janela faz o handler
+        # ceder o GIL no meio do Python e as amostras caem onde o tempo vai
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(SWITCH_INTERVAL)
+        try:
+            while not self.stop_event.wait(self.interval) and time.monotonic() < deadline:
+                self.sample(skip=me)
+            result = self.write(base)
+            logging.info(f"🔬 {result['samples']} amostras em {result['folded']}")
+            if on_done is not None:
+                on_done(result)
+        except Exception as e:
+            logging.error(f"❌ Erro no profiler: {e}")
+        finally:
+            sys.setswitchinterval(switch_interval)
+            with self.lock:
+                self.thread = None
+
+    def sample(self, skip=None):
+        """Uma amostra de cada thread"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+            stack = []
+            root = None
+            handling = False
+            while frame is not None:
+                code = frame.f_code
+                if code.co_name == TYPE_FRAME and root is None:
+                    # Antes do decode terminar o tipo ainda não existe
+                    root = f"msg:{frame.f_locals.get('msg_type') or '(decode)'}"
+                elif code.co_name == HANDLER_FRAME:
+                    handling = True
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            if handling:
+                # Fora de _dispatch_message: camada confiável, roteamento, acks
+                root = root or 'msg:(envelope)'
+            elif self.all_threads:
+                root = f"thread:{names.get(ident, ident)}"
+            else:
+                continue
+            stack.append(root)
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def write(self, base):
+        """Grava BASE.folded e BASE.txt; devolve o resumo"""
+        stacks = self.stacks
+        with open(f"{base}.folded", 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        summary = summarize(stacks)
+        with open(f"{base}.txt", 'w') as f:
+            f.write(format_summary(summary))
+        return {'type': 'profile_result', 'samples': self.samples,
+                'folded': f"{base}.folded", 'summary': f"{base}.txt",
+                'types': summary['types'], 'functions': summary['self'][:TOP_FUNCTIONS]}
+
+
+def summarize(stacks):
+    """Amostras por tipo de mensagem e por função (própria e inclusiva)"""
+    types = Counter()
+    own = Counter()
+    inclusive = Counter()
+    by_type = {}
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        root, leaf = frames[0], frames[-1]
+        types[root] += count
+        own[leaf] += count
+        by_type.setdefault(root, Counter())[leaf] += count
+        for name in set(frames[1:]):
+            inclusive[name] += count
+    return {
+        'total': sum(types.values()),
+        'types': types.most_common(),
+        'self': own.most_common(),
+        'inclusive': inclusive.most_common(),
+        'by_type': {root: leaves.most_common(5) for root, leaves in by_type.items()},
+    }
+
+
+def format_summary(summary):
+    total = summary['total'] or 1
+    lines = [f"{summary['total']} amostras", "", "Por tipo de mensagem:"]
+    for root, count in summary['types']:
+        lines.append(f"  {count / total:6.1%} {count:>7}  {root}")
+        for leaf, leaf_count in summary['by_type'][root]:
+            lines.append(f"           {leaf_count:>7}    {leaf}")
+    lines += ["", "Tempo próprio por função:"]
+    for name, count in summary['self'][:TOP_FUNCTIONS]:
+        lines.append(f"  {count / total:6.1%} {count:>7}  {name}")
+    lines += ["", "Tempo inclusivo por função:"]
+    for name, count in summary['inclusive'][:TOP_FUNCTIONS]:
+        lines.append(f"  {count / total:6.1%} {count:>7}  {name}")
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Pede ao servidor BATTLESHI.PY local uma janela de amostragem")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--seconds', type=float, default=PROFILE_SECONDS)
+    args = parser.parse_args(argv)
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(2.0)
+        sock.sendto(encode({'type': 'profile', 'seconds': args.seconds}), (args.host, args.port))
+        started = decode(sock.recvfrom(65535)[0])
+        if started.get('busy'):
+            raise SystemExit("⏳ Já há uma amostragem em andamento no servidor")
+        print(f"🔬 Amostrando por {started['seconds']:.1f}s...")
+        sock.settimeout(started['seconds'] + 5.0)
+        result = decode(sock.recvfrom(65535)[0])
+    total = sum(count for _, count in result['types']) or 1
+    print(f"📄 {result['folded']} ({result['samples']} passadas)")
+    for root, count in result['types']:
+        print(f"   {count / total:6.1%}  {root}")
+    print("   Tempo próprio:")
+    for name, count in result['functions'][:10]:
+        print(f"   {count / total:6.1%}  {name}")
+
+
+if __name__ == "__main__":
+    main()
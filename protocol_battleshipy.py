@@ -0,0 +1,330 @@
+import json
+import struct
+
+# Protocolos negociados no join
+PROTOCOL_JSON = 'json'
+PROTOCOL_BINARY = 'bin1'
+SUPPORTED_PROTOCOLS = (PROTOCOL_JSON, PROTOCOL_BINARY)
+
+SHIP_NAMES = ["Porta-aviões", "Encouraçado", "Cruzador", "Submarino", "Destroyer"]
+
+# Frames binários: marca, versão, opcode e match_id (0 = sem partida)
+BINARY_MAGIC = 0xB5
+BINARY_VERSION = 1
+HEADER = struct.Struct('!BBBI')
+
+OP_PLACE_SHIPS = 2
+OP_SHOOT = 3
+OP_RESTART = 4
+OP_GAME_START = 17
+OP_PLACEMENT_SUCCESS = 18
+OP_GAME_BEGIN = 19
+OP_SHOT_RESULT = 20
+OP_ERROR = 21
+OP_GAME_RESTART = 22
+OP_GAME_STATE = 23
+
+OPCODES = {
+    'place_ships': OP_PLACE_SHIPS,
+    'shoot': OP_SHOOT,
+    'restart': OP_RESTART,
+    'game_start': OP_GAME_START,
+    'placement_success': OP_PLACEMENT_SUCCESS,
+    'game_begin': OP_GAME_BEGIN,
+    'shot_result': OP_SHOT_RESULT,
+    'error': OP_ERROR,
+    'game_restart': OP_GAME_RESTART,
+    'game_state': OP_GAME_STATE,
+}
+MESSAGE_TYPES = {opcode: msg_type for msg_type, opcode in OPCODES.items()}
+
+SHOOT_BODY = struct.Struct('!BB')
+SHOT_RESULT_BODY = struct.Struct('!BBBBBBBB')
+SHOT_SYNC_BODY = struct.Struct('!IQ')  # seq e hash do tiro (opcional, no fim do frame)
+GAME_STATE_BODY = struct.Struct('!BBB')
+
+RESULT_CODES = {'erro': 0, 'acerto': 1, 'afundado': 2, 'repetido': 3}
+RESULTS = {code: result for result, code in RESULT_CODES.items()}
+
+STATE_CODES = {'waiting': 0, 'placing': 1, 'playing': 2, 'finished': 3}
+STATES = {code: state for state, code in STATE_CODES.items()}
+
+NO_SHIP = 0xFF
+
+# Códigos de erro e seus textos (renderizados por quem recebe)
+ERR_NOT_PLACING = 1
+ERR_PLAYER_NOT_FOUND = 2
+ERR_INVALID_PLACEMENT = 3
+ERR_NOT_PLAYING = 4
+ERR_NOT_YOUR_TURN = 5
+ERR_INVALID_COORDS = 6
+ERR_REPEATED_SHOT = 7
+ERR_MATCH_FULL = 8
+ERR_INVALID_TOKEN = 9
+ERR_INVALID_RULES = 10
+ERR_BUSY = 11
+ERR_INVALID_NAME = 12
+ERR_MATCH_NOT_FOUND = 13
+ERR_SPECTATORS_FULL = 14
+
+ERROR_MESSAGES = {
+    ERR_NOT_PLACING: "⏳ Jogo não está na fase de posicionamento",
+    ERR_PLAYER_NOT_FOUND: "❌ Jogador não encontrado",
+    ERR_INVALID_PLACEMENT: "❌ Posicionamento inválido. Use 'Navios Aleatórios'",
+    ERR_NOT_PLAYING: "⏳ Jogo não está em andamento",
+    ERR_NOT_YOUR_TURN: "🎯 Não é sua vez",
+    ERR_INVALID_COORDS: "❌ Coordenadas inválidas",
+    ERR_REPEATED_SHOT: "🎯 Já atirou nesta posição",
+    ERR_MATCH_FULL: "🎮 Partida cheia ou inexistente.",
+    ERR_INVALID_TOKEN: "🔑 Sessão inválida ou expirada.",
+    ERR_INVALID_RULES: "📐 Regras inválidas para a partida",
+    ERR_BUSY: "🚦 Servidor ocupado, tente novamente",
+    ERR_INVALID_NAME: "📛 Partida ranqueada precisa de um nome (até 32 caracteres)",
+    ERR_MATCH_NOT_FOUND: "🔎 Partida não encontrada",
+    ERR_SPECTATORS_FULL: "👀 A partida já tem o máximo de espectadores",
+}
+
+STATIC_TEXTS = {
+    'game_start': 'Posicione seus navios!',
+    'placement_success': 'Navios posicionados! Aguardando oponente...',
+    'game_begin': 'Jogo iniciado!',
+    'game_restart': 'Jogo reiniciado! Posicione navios.',
+}
+
+
+# Envelope da camada confiável (opcional): envolve frames JSON ou binários
+# marca, flags, sessão, match_id, seq, ack cumulativo e bitmap de acks seletivos
+RELIABLE_MAGIC = 0xB7
+ENVELOPE = struct.Struct('!BBHIIII')
+FLAG_DATA = 0x01
+
+# Lote: vários frames já codificados (JSON ou binários) num só datagrama,
+# cada um precedido do seu tamanho; só para quem anunciou 'batch' no join
+BATCH_MAGIC = 0xBA
+BATCH_HEADER = struct.Struct('!BB')  # marca e número de frames
+BATCH_ITEM = struct.Struct('!H')
+MAX_BATCH = 255
+
+
+class ProtocolError(ValueError):
+    """Datagrama que não pode ser decodificado"""
+
+
+def render_text(message):
+    """Texto de status de uma mensagem do servidor, a partir dos códigos"""
+    msg_type = message.get('type')
+    if msg_type in STATIC_TEXTS:
+        return STATIC_TEXTS[msg_type]
+    if msg_type == 'join_success':
+        return f"Jogador {message['player_id']} conectado!"
+    if msg_type == 'snapshot':
+        if message.get('part', 0) > 0:
+            return None  # Continuação de um snapshot em partes: só células
+        return f"Jogador {message['player_id']} reconectado!"
+    if msg_type == 'spectate_success':
+        if message.get('streaming') is False:
+            return None  # Só o desafio do nonce: resposta curta, sem texto
+        return f"👀 Assistindo à partida {message['match_id']}"
+    if msg_type == 'error':
+        return ERROR_MESSAGES.get(message.get('code'), "❌ Erro desconhecido")
+    if msg_type == 'shot_result':
+        if message.get('game_over'):
+            return f"🎉 Jogador {message['winner']} venceu!"
+        result = message['result']
+        if result == 'acerto':
+            return f"💥 Acertou o {message['ship_name']}!"
+        if result == 'afundado':
+            return f"💀 Afundou o {message['ship_name']}!"
+        return "🌊 Água! Vez do oponente."
+    return None
+
+
+def is_binary(data):
+    return len(data) >= HEADER.size and data[0] == BINARY_MAGIC
+
+
+def is_envelope(data):
+    return len(data) >= ENVELOPE.size and data[0] == RELIABLE_MAGIC
+
+
+def is_batch(data):
+    return len(data) >= BATCH_HEADER.size and data[0] == BATCH_MAGIC
+
+
+def pack_batch(payloads):
+    """Junta até MAX_BATCH frames num datagrama"""
+    parts = [BATCH_HEADER.pack(BATCH_MAGIC, len(payloads))]
+    for payload in payloads:
+        parts.append(BATCH_ITEM.pack(len(payload)))
+        parts.append(payload)
+    return b''.join(parts)
+
+
+def unpack_batch(data):
+    """Frames de um lote; um datagrama comum vira uma lista de um"""
+    if not is_batch(data):
+        return [data]
+    payloads = []
+    offset = BATCH_HEADER.size
+    for _ in range(data[1]):
+        if offset + BATCH_ITEM.size > len(data):
+            raise ProtocolError("lote truncado")
+        (size,) = BATCH_ITEM.unpack_from(data, offset)
+        offset += BATCH_ITEM.size
+        if offset + size > len(data):
+            raise ProtocolError("lote truncado")
+        payloads.append(data[offset:offset + size])
+        offset += size
+    return payloads
+
+
+def peek_type(data):
+    """Identifica o tipo da mensagem sem decodificá-la inteira"""
+    if is_envelope(data):
+        data = data[ENVELOPE.size:]
+    if is_binary(data):
+        return MESSAGE_TYPES.get(data[2])
+    start = data.find(b'"type"')
+    if start < 0:
+        return None
+    start = data.find(b'"', start + 6)
+    end = data.find(b'"', start + 1)
+    return data[start + 1:end].decode(errors='replace')
+
+
+def peek_match_id(data):
+    """Lê o match_id da mensagem sem decodificá-la inteira"""
+    if is_envelope(data):
+        match_id = ENVELOPE.unpack_from(data)[3]
+        if match_id:
+            return match_id
+        data = data[ENVELOPE.size:]
+    if is_binary(data):
+        return HEADER.unpack_from(data)[3] or None
+    start = data.find(b'"match_id"')
+    if start < 0:
+        return None
+    start = data.find(b':', start + 10) + 1
+    end = start
+    while end < len(data) and data[end] in b' 0123456789':
+        end += 1
+    try:
+        return int(data[start:end])
+    except ValueError:
+        return None
+
+
+def encode(message, protocol=PROTOCOL_JSON):
+    """Codifica uma mensagem no protocolo do destinatário"""
+    if protocol == PROTOCOL_BINARY:
+        opcode = OPCODES.get(message['type'])
+        if opcode is not None:
+            return _encode_binary(opcode, message)
+    if message.get('message') is None:
+        text = render_text(message)
+        if text is not None:
+            message = dict(message, message=text)
+    return json.dumps(message).encode()
+
+
+def decode(data):
+    """Decodifica um datagrama JSON ou binário em um dicionário"""
+    if is_binary(data):
+        return _decode_binary(data)
+    try:
+        return json.loads(data.decode())
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ProtocolError(str(e)) from e
+
+
+def _encode_binary(opcode, message):
+    header = HEADER.pack(BINARY_MAGIC, BINARY_VERSION, opcode, message.get('match_id') or 0)
+    if opcode == OP_SHOOT:
+        return header + SHOOT_BODY.pack(message['x'], message['y'])
+    if opcode == OP_SHOT_RESULT:
+        ship_id = message.get('ship_id')
+        frame = header + SHOT_RESULT_BODY.pack(
+            message['x'], message['y'], RESULT_CODES[message['result']],
+            NO_SHIP if ship_id is None else ship_id,
+            message.get('ship_size') or 0,
+            message['shooter'], message['current_turn'],
+            message.get('winner') or 0)
+        if 'seq' in message:
+            frame += SHOT_SYNC_BODY.pack(message['seq'], message['hash'])
+        return frame
+    if opcode == OP_PLACE_SHIPS:
+        body = bytearray([len(message['ships'])])
+        for ship in message['ships']:
+            positions = ship['positions']
+            body.append(len(positions))
+            for x, y in positions:
+                body += bytes((x, y))
+        return header + bytes(body)
+    if opcode == OP_GAME_BEGIN:
+        return header + bytes((message['turn'],))
+    if opcode == OP_ERROR:
+        return header + bytes((message['code'],))
+    if opcode == OP_GAME_STATE:
+        return header + GAME_STATE_BODY.pack(STATE_CODES[message['game_state']],
+                                             message['player_id'],
+                                             message['current_turn'])
+    return header
+
+
+def _decode_binary(data):
+    try:
+        _, version, opcode, match_id = HEADER.unpack_from(data)
+        if version != BINARY_VERSION or opcode not in MESSAGE_TYPES:
+            raise ProtocolError(f"frame desconhecido: versão {version}, opcode {opcode}")
+        message = {'type': MESSAGE_TYPES[opcode]}
+        if match_id:
+            message['match_id'] = match_id
+        body = HEADER.size
+
+        if opcode == OP_SHOOT:
+            message['x'], message['y'] = SHOOT_BODY.unpack_from(data, body)
+        elif opcode == OP_SHOT_RESULT:
+            (x, y, result, ship_id, ship_size,
+             shooter, current_turn, winner) = SHOT_RESULT_BODY.unpack_from(data, body)
+            has_ship = ship_id != NO_SHIP
+            message.update({
+                'x': x, 'y': y, 'result': RESULTS[result],
+                'ship_id': ship_id if has_ship else None,
+                'ship_name': SHIP_NAMES[ship_id] if has_ship else None,
+                'ship_size': ship_size if has_ship else None,
+                'shooter': shooter, 'current_turn': current_turn,
+            })
+            if winner:
+                message['game_over'] = True
+                message['winner'] = winner
+            trailer = body + SHOT_RESULT_BODY.size
+            if len(data) >= trailer + SHOT_SYNC_BODY.size:
+                message['seq'], message['hash'] = SHOT_SYNC_BODY.unpack_from(data, trailer)
+        elif opcode == OP_PLACE_SHIPS:
+            ships = []
+            offset = body + 1
+            for _ in range(data[body]):
+                count = data[offset]
+                cells = data[offset + 1:offset + 1 + 2 * count]
+                if len(cells) != 2 * count:
+                    raise ProtocolError("place_ships truncado")
+                ships.append({'positions': [[cells[i], cells[i + 1]]
+                                            for i in range(0, len(cells), 2)]})
+                offset += 1 + 2 * count
+            message['ships'] = ships
+        elif opcode == OP_GAME_BEGIN:
+            message['turn'] = data[body]
+        elif opcode == OP_ERROR:
+            message['code'] = data[body]
+        elif opcode == OP_GAME_STATE:
+            state, player_id, current_turn = GAME_STATE_BODY.unpack_from(data, body)
+            message.update({'game_state': STATES[state], 'player_id': player_id,
+                            'current_turn': current_turn})
+    except (struct.error, IndexError, KeyError) as e:
+        raise ProtocolError(f"frame binário inválido: {e}") from e
+
+    if opcode >= OP_GAME_START:
+        text = render_text(message)
+        if text is not None:
+            message['message'] = text
+    return message
@@ -0,0 +1,364 @@
+import socket
+import selectors
+import threading
+import argparse
+import logging
+import random
+import heapq
+import time
+from protocol_battleshipy import ENVELOPE, RELIABLE_MAGIC, FLAG_DATA
+
+ACK_WINDOW = 32        # Acks seletivos cobrem os 32 seqs após o ack cumulativo
+MAX_OUT_OF_ORDER = 256
+INITIAL_RTO = 0.05
+CHANNEL_IDLE = 300.0   # Canal ocioso e sem pendentes é descartado após 5 min
+CHANNEL_LINGER = 5.0   # Canal liberado (fim de partida) espera só os últimos acks
+EXPIRE_INTERVAL = 5.0
+
+
+class ReliableChannel:
+    """Estado de um par: sequência, pendentes de ack e reordenação"""
+    __slots__ = ('session', 'peer_session', 'next_seq', 'unacked', 'expected',
+                 'out_of_order', 'srtt', 'rttvar', 'rto', 'ack_pending', 'match_id',
+                 'last_active', 'released')
+
+    def __init__(self, session=None):
+        self.session = random.getrandbits(16) if session is None else session
+        self.peer_session = None
+        self.next_seq = 1
+        self.unacked = {}       # seq -> [payload, enviado_em, tentativas, prazo]
+        self.expected = 1       # Próximo seq a entregar em ordem
+        self.out_of_order = {}  # seq -> payload recebido fora de ordem
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = INITIAL_RTO
+        self.ack_pending = False
+        self.match_id = 0
+        self.last_active = time.monotonic()
+        self.released = False
+
+    def ack_fields(self):
+        """Ack cumulativo e bitmap dos seqs recebidos fora de ordem"""
+        ack = self.expected - 1
+        bits = 0
+        for seq in self.out_of_order:
+            offset = seq - ack - 2
+            if 0 <= offset < ACK_WINDOW:
+                bits |= 1 << offset
+        return ack, bits
+
+
+class ReliableEndpoint:
+    """Entrega confiável e em ordem sobre UDP, por endereço de par.
+
+    Cada datagrama de dados leva seq, ack cumulativo e acks seletivos.
+    O RTO segue a estimativa de RTT do RFC 6298 (algoritmo de Karn para
+    retransmissões) e duplicatas são descartadas, mas sempre confirmadas.
+    """
+
+    def __init__(self, min_rto=0.005, max_rto=1.0, max_retries=30):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.max_retries = max_retries
+        self.channels = {}
+        self.timers = []  # heap de (prazo, desempate, addr, seq)
+        self._tiebreak = 0
+        self.lock = threading.Lock()
+        self.retransmits = 0
+        self.duplicates = 0
+        self.gave_up = 0
+        self.expired = 0
+
+    def has_channel(self, addr):
+        return addr in self.channels
+
+    def forget(self, addr):
+        """Descarta o canal de um par que mudou de endereço"""
+        with self.lock:
+            self.channels.pop(addr, None)
+
+    def release(self, addr):
+        """Marca o canal de um par cuja partida acabou para descarte antecipado"""
+        with self.lock:
+            channel = self.channels.get(addr)
+            if channel is not None:
+                channel.released = True
+
+    def expire(self, now=None, idle=CHANNEL_IDLE, linger=CHANNEL_LINGER):
+        """Descarta canais sem pendentes e sem atividade recente; devolve quantos"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            stale = [addr for addr, channel in self.channels.items()
+                     if not channel.unacked and now - channel.last_active >
+                     (linger if channel.released else idle)]
+            for addr in stale:
+                del self.channels[addr]
+            self.expired += len(stale)
+        return len(stale)
+
+    def _channel(self, addr):
+        channel = self.channels.get(addr)
+        if channel is None:
+            channel = self.channels[addr] = ReliableChannel()
+        return channel
+
+    def _packet(self, channel, flags, seq, payload=b''):
+        ack, bits = channel.ack_fields()
+        channel.ack_pending = False
+        return ENVELOPE.pack(RELIABLE_MAGIC, flags, channel.session, channel.match_id,
+                             seq, ack, bits) + payload
+
+    def _schedule(self, addr, seq, deadline):
+        self._tiebreak += 1
+        heapq.heappush(self.timers, (deadline, self._tiebreak, addr, seq))
+
+    def wrap(self, addr, payload, match_id=None):
+        """Envelopa um payload com o próximo seq e o registra para retransmissão"""
+        now = time.monotonic()
+        with self.lock:
+            channel = self._channel(addr)
+            channel.last_active = now
+            if match_id is not None:
+                channel.match_id = match_id
+            seq = channel.next_seq
+            channel.next_seq += 1
+            deadline = now + channel.rto
+            channel.unacked[seq] = [payload, now, 0, deadline]
+            self._schedule(addr, seq, deadline)
+            return self._packet(channel, FLAG_DATA, seq, payload)
+
+    def receive(self, addr, data):
+        """Processa um envelope; devolve os payloads liberados em ordem"""
+        _, flags, session, _, seq, ack, bits = ENVELOPE.unpack_from(data)
+        now = time.monotonic()
+        with self.lock:
+            channel = self._channel(addr)
+            if channel.peer_session != session:
+                if channel.peer_session is not None:
+                    channel = self._restart_channel(addr, channel, now)
+                channel.peer_session = session
+            channel.last_active = now
+            if channel.next_seq == 1 and channel.expected == 1 and ack > 0:
+                # O par confirma dados que este canal nunca enviou: ele fala com
+                # uma encarnação anterior deste endpoint (servidor reiniciado a
+                # partir de um snapshot). Só o ack com a sessão nova responde,
+                # para que ele recomece o canal e reenvie o que está pendente
+                channel.ack_pending = True
+                return []
+            self._process_ack(channel, ack, bits, now)
+
+            if not flags & FLAG_DATA:
+                return []
+            channel.ack_pending = True
+            channel.released = False  # O par voltou a falar (revanche, nova partida)
+            if seq < channel.expected or seq in channel.out_of_order:
+                self.duplicates += 1
+                return []
+            payload = data[ENVELOPE.size:]
+            if seq != channel.expected:
+                if len(channel.out_of_order) < MAX_OUT_OF_ORDER:
+                    channel.out_of_order[seq] = payload
+                return []
+
+            delivered = [payload]
+            channel.expected += 1
+            while channel.expected in channel.out_of_order:
+                delivered.append(channel.out_of_order.pop(channel.expected))
+                channel.expected += 1
+            return delivered
+
+    def _restart_channel(self, addr, channel, now):
+        """O par reiniciou: recomeçar o canal nos dois sentidos.
+
+        A sessão local continua a mesma (senão o par também veria um
+        reinício e os dois lados se reiniciariam sem fim) e o que ainda não
+        foi confirmado volta à fila com os seqs novos.
+        """
+        fresh = self.channels[addr] = ReliableChannel(channel.session)
+        fresh.match_id = channel.match_id
+        fresh.released = channel.released
+        for seq in sorted(channel.unacked):
+            fresh.unacked[fresh.next_seq] = [channel.unacked[seq][0], now, 0, now]
+            self._schedule(addr, fresh.next_seq, now)
+            fresh.next_seq += 1
+        return fresh
+
+    def _process_ack(self, channel, ack, bits, now):
+        for seq in [s for s in channel.unacked
+                    if s <= ack or (s - ack - 2 >= 0 and bits >> (s - ack - 2) & 1)]:
+            _, sent_at, retries, _ = channel.unacked.pop(seq)
+            if retries == 0:
+                self._update_rtt(channel, now - sent_at)
+
+    def _update_rtt(self, channel, sample):
+        if channel.srtt is None:
+            channel.srtt = sample
+            channel.rttvar = sample / 2
+        else:
+            channel.rttvar = 0.75 * channel.rttvar + 0.25 * abs(channel.srtt - sample)
+            channel.srtt = 0.875 * channel.srtt + 0.125 * sample
+        channel.rto = min(self.max_rto, max(self.min_rto, channel.srtt + 4 * channel.rttvar))
+
+    def take_ack(self, addr):
+        """Ack puro, se o último dado recebido ainda não foi confirmado"""
+        with self.lock:
+            channel = self.channels.get(addr)
+            if channel is None or not channel.ack_pending:
+                return None
+            return self._packet(channel, 0, 0)
+
+    def poll(self, now=None):
+        """Retransmissões vencidas: lista de (addr, datagrama)"""
+        now = time.monotonic() if now is None else now
+        due = []
+        with self.lock:
+            while self.timers and self.timers[0][0] <= now:
+                deadline, _, addr, seq = heapq.heappop(self.timers)
+                channel = self.channels.get(addr)
+                entry = channel.unacked.get(seq) if channel else None
+                if entry is None or entry[3] != deadline:
+                    continue  # Já confirmado ou reagendado
+                entry[2] += 1
+                if entry[2] > self.max_retries:
+                    del channel.unacked[seq]
+                    self.gave_up += 1
+                    continue
+                entry[3] = now + min(self.max_rto, channel.rto * 2 ** entry[2])
+                self._schedule(addr, seq, entry[3])
+                self.retransmits += 1
+                due.append((addr, self._packet(channel, FLAG_DATA, seq, entry[0])))
+        return due
+
+    def next_deadline(self):
+        with self.lock:
+            return self.timers[0][0] if self.timers else None
+
+
+def start_retransmit_timer(endpoint, send, stop_event=None, max_sleep=0.01):
+    """Thread que reenvia os datagramas vencidos com send(data, addr)
+
+    De tempos em tempos também descarta os canais ociosos do endpoint.
+    """
+    def run():
+        next_expire = time.monotonic() + EXPIRE_INTERVAL
+        while stop_event is None or not stop_event.is_set():
+            if time.monotonic() >= next_expire:
+                endpoint.expire()
+                next_expire = time.monotonic() + EXPIRE_INTERVAL
+            for addr, packet in endpoint.poll():
+                try:
+                    send(packet, addr)
+                except OSError as e:
+                    logging.error(f"❌ Erro ao retransmitir para {addr}: {e}")
+            deadline = endpoint.next_deadline()
+            wait = max_sleep if deadline is None else deadline - time.monotonic()
+            time.sleep(min(max_sleep, max(0.0005, wait)))
+
+    thread = threading.Thread(target=run, daemon=True, name='battleshipy-retransmit')
+    thread.start()
+    return thread
+
+
+class LossyProxy:
+    """Proxy UDP local que perde, duplica, atrasa e reordena datagramas"""
+
+    def __init__(self, listen_addr, server_addr, loss=0.1, duplicate=0.02,
+                 reorder=0.1, delay=0.001, seed=None):
+        self.listen_addr = listen_addr
+        self.server_addr = server_addr
+        self.loss = loss
+        self.duplicate = duplicate
+        self.reorder = reorder
+        self.delay = delay
+        self.random = random.Random(seed)
+        self.front = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.upstreams = {}  # addr do cliente -> socket exclusivo para o servidor
+        self.queue = []      # heap de (instante, desempate, socket, dados, destino)
+        self._tiebreak = 0
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+        self.dropped = 0
+        self.forwarded = 0
+
+    def _schedule(self, sock, data, dest):
+        if self.random.random() < self.loss:
+            self.dropped += 1
+            return
+        copies = 2 if self.random.random() < self.duplicate else 1
+        for _ in range(copies):
+            delay = self.delay
+            if self.random.random() < self.reorder:
+                delay += self.random.uniform(self.delay, 10 * self.delay + 0.002)
+            self._tiebreak += 1
+            heapq.heappush(self.queue, (time.monotonic() + delay, self._tiebreak,
+                                        sock, data, dest))
+
+    def serve_forever(self):
+        self.front.bind(self.listen_addr)
+        self.front.setblocking(False)
+        self.selector.register(self.front, selectors.EVENT_READ, None)
+        self.running = True
+        while self.running:
+            timeout = 0.01
+            if self.queue:
+                timeout = max(0.0, min(timeout, self.queue[0][0] - time.monotonic()))
+            for key, _ in self.selector.select(timeout):
+                self._drain(key.fileobj, key.data)
+            now = time.monotonic()
+            while self.queue and self.queue[0][0] <= now:
+                _, _, sock, data, dest = heapq.heappop(self.queue)
+                try:
+                    sock.sendto(data, dest)
+                    self.forwarded += 1
+                except OSError:
+                    self.dropped += 1
+
+    def _drain(self, sock, client_addr):
+        while True:
+            try:
+                data, addr = sock.recvfrom(65535)
+            except BlockingIOError:
+                return
+            if client_addr is None:
+                # Cliente -> servidor, por um socket exclusivo do cliente
+                upstream = self.upstreams.get(addr)
+                if upstream is None:
+                    upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    upstream.bind(('127.0.0.1', 0))
+                    upstream.setblocking(False)
+                    self.upstreams[addr] = upstream
+                    self.selector.register(upstream, selectors.EVENT_READ, addr)
+                self._schedule(upstream, data, self.server_addr)
+            else:
+                # Servidor -> cliente, saindo pela porta pública do proxy
+                self._schedule(self.front, data, client_addr)
+
+    def stop(self):
+        self.running = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Proxy UDP com perdas para testar a camada confiável")
+    parser.add_argument('--listen-port', type=int, default=12346)
+    parser.add_argument('--server-host', default='127.0.0.1')
+    parser.add_argument('--server-port', type=int, default=12345)
+    parser.add_argument('--loss', type=float, default=0.1)
+    parser.add_argument('--duplicate', type=float, default=0.02)
+    parser.add_argument('--reorder', type=float, default=0.1)
+    parser.add_argument('--delay', type=float, default=0.001)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    proxy = LossyProxy(('127.0.0.1', args.listen_port), (args.server_host, args.server_port),
+                       args.loss, args.duplicate, args.reorder, args.delay, args.seed)
+    print(f"🌊 Proxy com perdas em 127.0.0.1:{args.listen_port} -> "
+          f"{args.server_host}:{args.server_port} (perda {args.loss:.0%})")
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"📦 Repassados: {proxy.forwarded}, descartados: {proxy.dropped}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import os
+import sys
+import glob
+import time
+import socket
+import selectors
+import argparse
+from protocol_battleshipy import ProtocolError, decode, encode
+from journal_battleshipy import (
+    JournalReader, JournalError, REC_PLACE, REC_SHOT, REC_RESTART,
+)
+from server_battleshipy import make_player
+
+
+class Replay:
+    """Estado de uma partida reconstruído do diário com os Player do servidor.
+
+    Os tiros são reaplicados de verdade: um resultado diferente do gravado
+    fica em `mismatches`, que é o que interessa numa disputa.
+    """
+
+    def __init__(self, ruleset, match_id=0):
+        self.ruleset = ruleset
+        self.match_id = match_id
+        self.events = 0  # Eventos já aplicados
+        self.mismatches = []
+        self.reset()
+
+    def reset(self):
+        self.players = {pid: make_player(None, pid, ruleset=self.ruleset) for pid in (1, 2)}
+        self.game_state = 'placing'
+        self.current_turn = 1
+
+    def load(self, checkpoint):
+        """Parte de um checkpoint em vez do lance zero"""
+        self.reset()
+        for player_id, (fleet, shots) in checkpoint.players.items():
+            player = self.players[player_id]
+            if fleet is not None:
+                player.place_ships(fleet)
+            for x, y in shots:
+                player.take_shot(x, y)
+        self.game_state = checkpoint.game_state
+        self.current_turn = checkpoint.current_turn
+        self.events = checkpoint.events
+
+    def apply(self, kind, player_id, data):
+        """Aplica um evento; devolve a mensagem que o servidor transmitiu, se houver"""
+        self.events += 1
+        if kind == REC_RESTART:
+            self.reset()
+            return {'type': 'game_restart'}
+        if kind == REC_PLACE:
+            self.players[player_id].place_ships(data)
+            if all(p.ready for p in self.players.values()):
+                self.game_state = 'playing'
+                self.current_turn = 1
+                return {'type': 'game_begin', 'turn': 1}
+            return None
+        x, y, recorded, ship_id = data
+        target = self.players[3 - player_id]
+        result, ship = target.take_shot(x, y)
+        if result != recorded or (ship.id if ship else None) != ship_id:
+            self.mismatches.append((self.events - 1, player_id, x, y, recorded, result))
+        if result == 'erro':
+            self.current_turn = 3 - player_id
+        message = {
+            'type': 'shot_result', 'x': x, 'y': y, 'result': result,
+            'ship_id': ship.id if ship else None,
+            'ship_name': ship.name if ship else None,
+            'ship_size': ship.size if ship else None,
+            'shooter': player_id, 'current_turn': self.current_turn,
+        }
+        if target.has_lost():
+            self.game_state = 'finished'
+            message['game_over'] = True
+            message['winner'] = player_id
+        return message
+
+    def view(self):
+        """Visão completa sem navios intactos, a mesma dos espectadores"""
+        return {
+            'type': 'spectate_state',
+            'match_id': self.match_id,
+            'game_state': self.game_state,
+            'current_turn': self.current_turn,
+            'rules': self.ruleset.to_message(),
+            'boards': [{'player_id': pid, 'radar': self.players[pid].radar_view()}
+                       for pid in sorted(self.players)],
+        }
+
+
+def state_at(reader, index):
+    """Estado depois dos `index` primeiros eventos: checkpoint + o que veio depois"""
+    index = max(0, min(index, len(reader)))
+    replay = Replay(reader.ruleset, reader.match_id)
+    checkpoint = reader.checkpoint_before(index)
+    if checkpoint is not None:
+        replay.load(checkpoint)
+    for event in reader.events(replay.events, index):
+        replay.apply(*event)
+    return replay
+
+
+def journal_stats(paths):
+    """Totais de muitos diários lendo só os registros de tiro, sem reconstruir tabuleiros"""
+    totals = {'files': 0, 'events': 0, 'games': 0, 'shots': 0, 'hits': 0, 'bytes': 0}
+    for path in paths:
+        try:
+            reader = JournalReader(path)
+        except (JournalError, OSError) as e:
+            print(f"⚠️ {path}: {e}", file=sys.stderr)
+            continue
+        with reader:
+            fleet = len(reader.ruleset.ship_sizes)
+            sunk = {1: 0, 2: 0}
+            for kind, player_id, data in reader.events():
+                if kind == REC_RESTART:
+                    sunk = {1: 0, 2: 0}
+                elif kind == REC_SHOT:
+                    totals['shots'] += 1
+                    if data[2] != 'erro':
+                        totals['hits'] += 1
+                    if data[2] == 'afundado':
+                        sunk[player_id] += 1
+                        if sunk[player_id] == fleet:
+                            totals['games'] += 1
+            totals['files'] += 1
+            totals['events'] += len(reader)
+            totals['bytes'] += len(reader.data)
+    return totals
+
+
+def serve_replay(reader, port, speed, start=0, host='127.0.0.1'):
+    """Transmite o diário a clientes espectadores (client --spectate) a `speed` eventos/s"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    sock.setblocking(False)
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    streams = {}  # addr -> [Replay, próximo envio]
+    print(f"📼 Replay da partida {reader.match_id} ({len(reader)} eventos) em {host}:{port}")
+    try:
+        while True:
+            now = time.monotonic()
+            for _ in selector.select(timeout=0.01):
+                while True:
+                    try:
+                        data, addr = sock.recvfrom(65535)
+                    except BlockingIOError:
+                        break
+                    try:
+                        msg_type = decode(data).get('type')
+                    except (ProtocolError, AttributeError):
+                        continue  # Datagrama inválido (ou JSON que não é objeto)
+                    if msg_type != 'spectate' or addr in streams:
+                        continue
+                    replay = state_at(reader, start)
+                    sock.sendto(encode({'type': 'spectate_success', 'match_id': reader.match_id,
+                                        'delay': 0, 'rules': reader.ruleset.to_message()}), addr)
+                    sock.sendto(encode(replay.view()), addr)
+                    streams[addr] = [replay, now]
+            for addr, stream in list(streams.items()):
+                replay, due = stream
+                while due <= now and replay.events < len(reader):
+                    message = replay.apply(*reader.event(replay.events))
+                    if message is not None:
+                        sock.sendto(encode(message), addr)
+                    due += 1.0 / speed
+                stream[1] = due
+                if replay.events >= len(reader):
+                    del streams[addr]
+    except KeyboardInterrupt:
+        pass
+    finally:
+        selector.close()
+        sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay e auditoria dos diários do BATTLESHI.PY")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    info = sub.add_parser('info', help="regras, eventos e checkpoints de um diário")
+    info.add_argument('journal')
+
+    state = sub.add_parser('state', help="tabuleiros depois de N eventos")
+    state.add_argument('journal')
+    state.add_argument('--at', type=int, default=None, help="padrão: o fim do diário")
+
+    audit = sub.add_parser('audit', help="reaplica todos os tiros e confere os resultados")
+    audit.add_argument('journal')
+
+    stats = sub.add_parser('stats', help="totais de um diretório de diários")
+    stats.add_argument('directory')
+
+    serve = sub.add_parser('serve', help="transmite o replay para client_battleshipy --spectate")
+    serve.add_argument('journal')
+    serve.add_argument('--port', type=int, default=12400)
+    serve.add_argument('--speed', type=float, default=5.0, help="eventos por segundo")
+    serve.add_argument('--from', dest='start', type=int, default=0, help="evento inicial")
+    args = parser.parse_args(argv)
+
+    if args.command == 'stats':
+        started = time.perf_counter()
+        totals = journal_stats(glob.glob(os.path.join(args.directory, '*.bsj')))
+        elapsed = time.perf_counter() - started
+        print(f"📚 {totals['files']} diários, {totals['bytes'] / 1024:.0f} KiB, "
+              f"{totals['events']} eventos em {elapsed:.2f}s")
+        if totals['shots']:
+            print(f"🎮 {totals['games']} jogos concluídos, {totals['shots']} tiros, "
+                  f"{totals['hits'] / totals['shots']:.1%} de acertos")
+        return
+
+    with JournalReader(args.journal) as reader:
+        if args.command == 'info':
+            rules = reader.ruleset
+            print(f"📼 Partida {reader.match_id}: {rules.name}, "
+                  f"{len(reader)} eventos, {len(reader.checkpoints)} checkpoints, "
+                  f"{len(reader.data)} bytes")
+        elif args.command == 'state':
+            index = len(reader) if args.at is None else args.at
+            started = time.perf_counter()
+            replay = state_at(reader, index)
+            elapsed = time.perf_counter() - started
+            print(f"⏱️ Evento {replay.events}: {replay.game_state}, vez do jogador "
+                  f"{replay.current_turn} (reconstruído em {elapsed * 1000:.2f} ms)")
+            for pid, player in sorted(replay.players.items()):
+                view = player.own_view()
+                print(f"   Jogador {pid}: {len(view['hits'])} acertos, {len(view['sunk'])} "
+                      f"células afundadas, {len(view['misses'])} águas recebidas")
+        elif args.command == 'audit':
+            replay = state_at(reader, 0)
+            for event in reader.events():
+                replay.apply(*event)
+            if replay.mismatches:
+                for index, shooter, x, y, recorded, result in replay.mismatches:
+                    print(f"❌ Evento {index}: jogador {shooter} em ({x},{y}) gravado "
+                          f"'{recorded}', reconstruído '{result}'")
+                raise SystemExit(1)
+            print(f"✅ {len(reader)} eventos conferidos, nenhuma divergência")
+        elif args.command == 'serve':
+            serve_replay(reader, args.port, args.speed, args.start)
+
+
+if __name__ == "__main__":
+    main()
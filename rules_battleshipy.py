@@ -0,0 +1,91 @@
+from board_battleshipy import BOARD_SIZE, SHIP_SIZES, placement_masks
+from protocol_battleshipy import SHIP_NAMES
+
+MAX_BOARD_SIZE = 4096
+MAX_SHIPS = 1024
+DENSE_LIMIT = 16  # Até 16x16 o tabuleiro cabe em bitboards de 256 bits
+
+SIZE_NAMES = {5: "Porta-aviões", 4: "Encouraçado", 3: "Cruzador", 2: "Destroyer", 1: "Bote"}
+
+
+class Ruleset:
+    """Tamanho do tabuleiro e composição da frota, escolhidos ao criar a partida"""
+    __slots__ = ('name', 'board_size', 'ship_sizes', 'ship_names', 'key', '_placements')
+
+    def __init__(self, board_size, ship_sizes, name=None):
+        if not 2 <= board_size <= MAX_BOARD_SIZE:
+            raise ValueError(f"tabuleiro fora de 2..{MAX_BOARD_SIZE}: {board_size}")
+        if not 1 <= len(ship_sizes) <= MAX_SHIPS:
+            raise ValueError(f"frota fora de 1..{MAX_SHIPS} navios: {len(ship_sizes)}")
+        if any(not 1 <= size <= board_size for size in ship_sizes):
+            raise ValueError("navio maior que o tabuleiro")
+        if sum(ship_sizes) > board_size * board_size // 2:
+            raise ValueError("frota ocupa mais da metade do tabuleiro")
+        self.board_size = board_size
+        self.ship_sizes = list(ship_sizes)
+        self.key = (board_size, tuple(ship_sizes))
+        self.name = name or f"{board_size}x{board_size}/{len(ship_sizes)}"
+        self.ship_names = (SHIP_NAMES if self.key == (BOARD_SIZE, tuple(SHIP_SIZES))
+                           else self._generic_names())
+        self._placements = {}
+
+    def _generic_names(self):
+        names = []
+        seen = {}
+        for size in self.ship_sizes:
+            seen[size] = seen.get(size, 0) + 1
+            name = SIZE_NAMES.get(size, f"Navio de {size}")
+            names.append(name if self.ship_sizes.count(size) == 1 else f"{name} {seen[size]}")
+        return names
+
+    @property
+    def sparse(self):
+        """Tabuleiros grandes usam células esparsas em vez de bitboards"""
+        return self.board_size > DENSE_LIMIT
+
+    def in_bounds(self, x, y):
+        return (isinstance(x, int) and isinstance(y, int)
+                and 0 <= x < self.board_size and 0 <= y < self.board_size)
+
+    def placements(self, size):
+        """Máscaras legais de um navio (só para tabuleiros densos)"""
+        masks = self._placements.get(size)
+        if masks is None:
+            masks = self._placements[size] = placement_masks(size, self.board_size)
+        return masks
+
+    def to_message(self):
+        return {'name': self.name, 'board_size': self.board_size, 'ships': self.ship_sizes}
+
+
+RULESETS = {
+    'classic': Ruleset(BOARD_SIZE, SHIP_SIZES, 'classic'),
+    'large': Ruleset(16, [5, 4, 4, 3, 3, 3, 2, 2, 2], 'large'),
+    # 1000x1000 com 300 navios: só faz sentido com o tabuleiro esparso
+    'huge': Ruleset(1000, [5] * 40 + [4] * 60 + [3] * 100 + [2] * 100, 'huge'),
+}
+DEFAULT_RULESET = RULESETS['classic']
+_BY_KEY = {ruleset.key: ruleset for ruleset in RULESETS.values()}
+
+
+def parse_rules(value):
+    """Ruleset pedido no join: nome de um preset ou {'board_size': N, 'ships': [...]}.
+
+    Levanta ValueError se as regras forem inválidas.
+    """
+    if value is None:
+        return DEFAULT_RULESET
+    if isinstance(value, str):
+        if value not in RULESETS:
+            raise ValueError(f"regras desconhecidas: {value}")
+        return RULESETS[value]
+    try:
+        board_size = value['board_size']
+        ship_sizes = list(value['ships'])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"regras malformadas: {e}") from e
+    if not isinstance(board_size, int) or not all(isinstance(s, int) for s in ship_sizes):
+        raise ValueError("regras devem usar inteiros")
+    name = value.get('name')
+    key = (board_size, tuple(ship_sizes))
+    return _BY_KEY.get(key) or Ruleset(board_size, ship_sizes, str(name)[:32] if name else None)
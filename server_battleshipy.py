@@ -1,285 +1,1331 @@
 import socket
 import threading
+import hmac
+import hashlib
 import json
 import logging
+import asyncio
+import secrets
+import argparse
+import struct
+import multiprocessing
+import signal
+import sys
+import os
+import gc
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from protocol_battleshipy import (
+    PROTOCOL_JSON, SUPPORTED_PROTOCOLS,
+    ERR_NOT_PLACING, ERR_PLAYER_NOT_FOUND, ERR_INVALID_PLACEMENT, ERR_NOT_PLAYING,
+    ERR_NOT_YOUR_TURN, ERR_INVALID_COORDS, ERR_REPEATED_SHOT, ERR_MATCH_FULL,
+    ERR_INVALID_TOKEN, ERR_INVALID_RULES, ERR_BUSY, ERR_INVALID_NAME, ERR_MATCH_NOT_FOUND,
+    ERR_SPECTATORS_FULL,
+    decode, encode, peek_type, peek_match_id, is_envelope,
+)
+from reliable_battleshipy import ReliableEndpoint, start_retransmit_timer
+from board_battleshipy import BOARD_SIZE, cell_bit, mask_cells
+from rules_battleshipy import DEFAULT_RULESET, parse_rules
+from ai_battleshipy import AIPlayer, DIFFICULTIES, DEFAULT_DIFFICULTY
+from fleet_battleshipy import random_fleet_positions
+from spectate_battleshipy import SpectatorHub, SPECTATOR_TTL
+from journal_battleshipy import MatchJournal, MAX_OPEN_JOURNALS
+from snapshot_battleshipy import Snapshotter, read_snapshot, SNAPSHOT_INTERVAL
+from metrics_battleshipy import ServerMetrics, TimedLock, start_metrics_http
+from profile_battleshipy import SamplingProfiler, PROFILE_SECONDS
+from ingress_battleshipy import RateLimiter, IngressQueue, INGRESS_LIMIT
+from matchmaking_battleshipy import Matchmaker, RatingBook, valid_name
+from outbox_battleshipy import Outbox, BATCH_BUDGET, FLUSH_FALLBACK
+from sync_battleshipy import ShotLog
+from log_battleshipy import log, parse_sample, LOG_CAPACITY, LOG_FORMATS
+
+MATCHMAKING_TICK = 0.05      # Resolução das tentativas agendadas da fila ranqueada
+RATINGS_SAVE_INTERVAL = 5.0
+MATCH_FINISHED_TTL = 120.0   # Partida encerrada sem revanche nesse tempo é desfeita
+PEER_TIMEOUT = 600.0         # Jogador calado por tanto tempo: a partida é desfeita
+REAP_INTERVAL = 5.0
+SNAPSHOT_CELLS = 48          # Células por parte de snapshot: cada parte cabe num datagrama
 
 class Ship:
-    def __init__(self, name, size, ship_id):
+    __slots__ = ('name', 'size', 'id', 'hits', 'mask', 'cells', 'board_size')
+    
+    def __init__(self, name, size, ship_id, board_size=BOARD_SIZE):
         self.name = name
         self.size = size
         self.id = ship_id
         self.hits = 0
-        self.positions = []
+        self.mask = 0        # Células no bitboard (tabuleiros densos)
+        self.cells = None    # frozenset de (x, y) (tabuleiros esparsos)
+        self.board_size = board_size
+    
+    @property
+    def positions(self):
+        if self.cells is not None:
+            return sorted(self.cells)
+        return [tuple(cell) for cell in mask_cells(self.mask, self.board_size)]
     
     def is_sunk(self):
         return self.hits >= self.size
 
 class Player:
-    def __init__(self, addr, player_id):
+    __slots__ = ('addr', 'id', 'token', 'ruleset', 'ships', 'ready', 'fleet_mask', 'shot_mask',
+                 'last_seen')
+    
+    def __init__(self, addr, player_id, token=None, ruleset=DEFAULT_RULESET):
         self.addr = addr
         self.id = player_id
-        self.board = [[' ' for _ in range(10)] for _ in range(10)]
+        self.token = token  # Sessão para reconectar de outro endereço
+        self.ruleset = ruleset
+        self.last_seen = time.monotonic()  # Última mensagem do jogador
+        self.reset()
+    
+    def reset(self):
+        """Limpa navios e tiros (bitboards)"""
         self.ships = []
         self.ready = False
-        self.shots_taken = set()
-        self.ship_positions = {}  # Mapeia (x,y) -> ship_id
+        self.fleet_mask = 0  # Todas as células com navio
+        self.shot_mask = 0   # Todas as células que já receberam tiro
+    
+    @property
+    def board(self):
+        """Tabuleiro NxN em caracteres, derivado dos bitboards"""
+        size = self.ruleset.board_size
+        sunk_mask = self._sunk_mask()
+        board = [[' '] * size for _ in range(size)]
+        for x in range(size):
+            for y in range(size):
+                bit = cell_bit(x, y, size)
+                if sunk_mask & bit:
+                    board[x][y] = 'D'
+                elif self.fleet_mask & bit:
+                    board[x][y] = 'X' if self.shot_mask & bit else 'S'
+                elif self.shot_mask & bit:
+                    board[x][y] = 'O'
+        return board
+    
+    def _sunk_mask(self):
+        sunk_mask = 0
+        for ship in self.ships:
+            if ship.is_sunk():
+                sunk_mask |= ship.mask
+        return sunk_mask
+    
+    def own_view(self):
+        """Tabuleiro visto pelo próprio jogador: navios, acertos, águas e afundados"""
+        size = self.ruleset.board_size
+        sunk_mask = self._sunk_mask()
+        return {
+            'ships': mask_cells(self.fleet_mask, size),
+            'hits': mask_cells(self.fleet_mask & self.shot_mask & ~sunk_mask, size),
+            'misses': mask_cells(self.shot_mask & ~self.fleet_mask, size),
+            'sunk': mask_cells(sunk_mask, size),
+        }
+    
+    def radar_view(self):
+        """Tabuleiro visto pelo oponente (sem navios intactos)"""
+        view = self.own_view()
+        del view['ships']
+        return view
     
     def place_ships(self, ships_data):
         """Coloca navios no tabuleiro do jogador"""
         try:
             # Limpar dados anteriores
-            self.ships = []
-            self.board = [[' ' for _ in range(10)] for _ in range(10)]
-            self.shots_taken = set()
-            self.ship_positions = {}
+            self.reset()
             
-            # Definir tipos de navios
-            ship_sizes = [5, 4, 3, 3, 2]
-            ship_names = ["Porta-aviões", "Encouraçado", "Cruzador", "Submarino", "Destroyer"]
+            # A frota tem que estar completa
+            ship_sizes = self.ruleset.ship_sizes
+            if len(ships_data) != len(ship_sizes):
+                return False
             
             for i, ship_data in enumerate(ships_data):
                 size = ship_sizes[i]
-                name = ship_names[i]
+                name = self.ruleset.ship_names[i]
                 positions = ship_data['positions']
                 
                 # Validar posições
-                if not self._validate_ship_placement(positions, size):
+                placement = self._validate_ship_placement(positions, size)
+                if not placement:
+                    self.reset()
                     return False
                 
-                # Criar navio
-                ship = Ship(name, size, i)
-                ship.positions = positions
-                self.ships.append(ship)
-                
-                # Marcar no tabuleiro e mapear posições
-                for x, y in positions:
-                    self.board[x][y] = 'S'
-                    self.ship_positions[(x, y)] = ship.id
+                ship = Ship(name, size, i, self.ruleset.board_size)
+                self._add_ship(ship, placement)
             
             self.ready = True
             return True
             
         except Exception as e:
             logging.error(f"Erro ao colocar navios: {e}")
+            self.reset()
             return False
     
+    def _add_ship(self, ship, mask):
+        """Marca o navio no bitboard"""
+        ship.mask = mask
+        self.ships.append(ship)
+        self.fleet_mask |= mask
+    
     def _validate_ship_placement(self, positions, size):
-        """Valida se o posicionamento do navio é válido"""
+        """Valida o posicionamento; retorna a máscara do navio ou 0 se inválido"""
         # Verificar tamanho
         if len(positions) != size:
-            return False
+            return 0
         
         # Verificar se está dentro do tabuleiro
+        mask = 0
         for x, y in positions:
-            if not (0 <= x < 10 and 0 <= y < 10):
-                return False
-            if self.board[x][y] != ' ':  # Verificar sobreposição
-                return False
+            if not self.ruleset.in_bounds(x, y):
+                return 0
+            mask |= cell_bit(x, y, self.ruleset.board_size)
         
-        # Verificar se as posições são consecutivas
-        return self._are_positions_consecutive(positions)
+        # Linha reta consecutiva e sem sobreposição
+        if mask not in self.ruleset.placements(size) or mask & self.fleet_mask:
+            return 0
+        return mask
     
-    def _are_positions_consecutive(self, positions):
-        """Verifica se as posições formam uma linha reta consecutiva"""
-        if len(positions) <= 1:
-            return True
+    def take_shot(self, x, y):
+        """Processa um tiro no tabuleiro do jogador"""
+        bit = cell_bit(x, y, self.ruleset.board_size)
+        if self.shot_mask & bit:
+            return "repetido", None
         
-        # Verificar horizontal
-        row_same = all(pos[0] == positions[0][0] for pos in positions)
-        if row_same:
-            cols = sorted([pos[1] for pos in positions])
-            return all(cols[i] + 1 == cols[i+1] for i in range(len(cols)-1))
+        self.shot_mask |= bit
         
-        # Verificar vertical
-        col_same = all(pos[1] == positions[0][1] for pos in positions)
-        if col_same:
-            rows = sorted([pos[0] for pos in positions])
-            return all(rows[i] + 1 == rows[i+1] for i in range(len(rows)-1))
+        if not self.fleet_mask & bit:  # Água
+            return "erro", None
         
-        return False
+        # Acertou um navio: no máximo um teste de máscara por navio
+        for ship in self.ships:
+            if ship.mask & bit:
+                ship.hits += 1
+                if ship.is_sunk():
+                    return "afundado", ship
+                return "acerto", ship
+    
+    def has_lost(self):
+        """Verifica se o jogador perdeu"""
+        return not self.fleet_mask & ~self.shot_mask
+    
+    def shot_cells(self):
+        """Células que já receberam tiro"""
+        return mask_cells(self.shot_mask, self.ruleset.board_size)
+    
+    def to_state(self):
+        """Navios e tiros em tipos simples, para o snapshot: as próprias máscaras"""
+        return {'ships': [ship.mask for ship in self.ships], 'shots': self.shot_mask}
+    
+    def load_state(self, state):
+        """Inverso de to_state, sem revalidar: o snapshot veio do próprio servidor"""
+        self.reset()
+        shots = self.shot_mask = state['shots']
+        for i, mask in enumerate(state['ships']):
+            ship = Ship(self.ruleset.ship_names[i], self.ruleset.ship_sizes[i], i,
+                        self.ruleset.board_size)
+            self._add_ship(ship, mask)
+            ship.hits = bin(mask & shots).count('1')
+
+class SparsePlayer(Player):
+    """Jogador de tabuleiros grandes: célula -> navio num dicionário e tiros num
+    conjunto. Memória e custo por tiro dependem dos navios e dos tiros, nunca
+    da área, e nenhuma grade densa é alocada."""
+    __slots__ = ('fleet', 'shots', 'afloat')
+    
+    def reset(self):
+        """Limpa navios e tiros"""
+        self.ships = []
+        self.ready = False
+        self.fleet_mask = 0
+        self.shot_mask = 0
+        self.fleet = {}      # (x, y) -> Ship
+        self.shots = set()   # (x, y) que já receberam tiro
+        self.afloat = 0      # Células de navio ainda intactas
+    
+    @property
+    def board(self):
+        raise ValueError("tabuleiro esparso não tem grade densa")
+    
+    def own_view(self):
+        """Tabuleiro visto pelo próprio jogador: navios, acertos, águas e afundados"""
+        sunk = {cell for ship in self.ships if ship.is_sunk() for cell in ship.cells}
+        return {
+            'ships': [list(cell) for cell in self.fleet],
+            'hits': [list(cell) for cell in self.shots
+                     if cell in self.fleet and cell not in sunk],
+            'misses': [list(cell) for cell in self.shots if cell not in self.fleet],
+            'sunk': [list(cell) for cell in sunk],
+        }
+    
+    def _add_ship(self, ship, cells):
+        """Marca o navio no dicionário de células"""
+        ship.cells = cells
+        self.ships.append(ship)
+        for cell in cells:
+            self.fleet[cell] = ship
+        self.afloat += ship.size
+    
+    def _validate_ship_placement(self, positions, size):
+        """Valida o posicionamento; retorna as células do navio ou None se inválido"""
+        if len(positions) != size:
+            return None
+        
+        cells = []
+        for x, y in positions:
+            if not self.ruleset.in_bounds(x, y) or (x, y) in self.fleet:
+                return None
+            cells.append((x, y))
+        
+        # Linha reta de células consecutivas
+        cells.sort()
+        x0, y0 = cells[0]
+        horizontal = all(cell == (x0, y0 + i) for i, cell in enumerate(cells))
+        vertical = all(cell == (x0 + i, y0) for i, cell in enumerate(cells))
+        if not (horizontal or vertical):
+            return None
+        return frozenset(cells)
     
     def take_shot(self, x, y):
-        """Processa um tiro no tabuleiro do jogador"""
-        if (x, y) in self.shots_taken:
+        """Processa um tiro: O(1) em qualquer tamanho de tabuleiro"""
+        cell = (x, y)
+        if cell in self.shots:
             return "repetido", None
         
-        self.shots_taken.add((x, y))
-        
-        if self.board[x][y] == 'S':  # Acertou um navio
-            self.board[x][y] = 'X'  # Marcar como acerto
-            
-            # Encontrar navio atingido
-            ship_id = self.ship_positions.get((x, y))
-            hit_ship = None
-            for ship in self.ships:
-                if ship.id == ship_id:
-                    ship.hits += 1
-                    hit_ship = ship
-                    break
-            
-            if hit_ship and hit_ship.is_sunk():
-                # Marcar todas as posições do navio como afundado
-                for px, py in hit_ship.positions:
-                    self.board[px][py] = 'D'
-                return "afundado", hit_ship
-            else:
-                return "acerto", hit_ship
-        else:
-            self.board[x][y] = 'O'  # Marcar como água
+        self.shots.add(cell)
+        ship = self.fleet.get(cell)
+        if ship is None:  # Água
             return "erro", None
+        
+        ship.hits += 1
+        self.afloat -= 1
+        if ship.is_sunk():
+            return "afundado", ship
+        return "acerto", ship
     
     def has_lost(self):
         """Verifica se o jogador perdeu"""
-        return all(ship.is_sunk() for ship in self.ships)
+        return self.afloat == 0
+    
+    def shot_cells(self):
+        """Células que já receberam tiro"""
+        return list(self.shots)
+    
+    def to_state(self):
+        """Navios e tiros em listas de células, para o snapshot"""
+        return {'ships': [sorted(ship.cells) for ship in self.ships],
+                'shots': list(self.shots)}
+    
+    def load_state(self, state):
+        """Inverso de to_state, sem revalidar: o snapshot veio do próprio servidor"""
+        self.reset()
+        self.shots = shots = {tuple(cell) for cell in state['shots']}
+        for i, cells in enumerate(state['ships']):
+            ship = Ship(self.ruleset.ship_names[i], self.ruleset.ship_sizes[i], i,
+                        self.ruleset.board_size)
+            self._add_ship(ship, frozenset(tuple(cell) for cell in cells))
+            ship.hits = sum(1 for cell in ship.cells if cell in shots)
+            self.afloat -= ship.hits
 
-class BattleShipServer:
-    def __init__(self, host='127.0.0.1', port=12345):
-        self.host = host
-        self.port = port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+def make_player(addr, player_id, token=None, ruleset=DEFAULT_RULESET):
+    """Jogador com a representação de tabuleiro adequada às regras"""
+    cls = SparsePlayer if ruleset.sparse else Player
+    return cls(addr, player_id, token, ruleset)
+
+class Match:
+    def __init__(self, match_id, ruleset=DEFAULT_RULESET):
+        self.id = match_id
+        self.ruleset = ruleset  # Tabuleiro e frota, fixos desde a criação
         self.players = {}
         self.game_state = "waiting"
         self.current_turn = 1
         self.lock = threading.Lock()
+        self.ai = None       # Oponente do servidor no modo solo
+        self.ai_addr = None  # Chave do jogador da IA em players (não é um endereço real)
+        self.journal = None  # Diário aberto enquanto a partida não termina
+        self.version = 0     # Incrementada a cada mudança, para o snapshot incremental
+        self.names = {}      # player_id -> nome no ranking (só partidas da fila ranqueada)
+        self.shots = ShotLog()  # seq, hash Zobrist e últimos tiros, para os clientes conferirem
+        self.last_active = time.monotonic()  # Última mensagem de qualquer jogador
+    
+    def is_stale(self, now):
+        """Encerrada sem revanche ou com um jogador humano calado há tempo demais"""
+        if self.game_state == "finished":
+            return now - self.last_active > MATCH_FINISHED_TTL
+        return any(now - player.last_seen > PEER_TIMEOUT
+                   for addr, player in self.players.items() if addr != self.ai_addr)
+    
+    def is_full(self):
+        return len(self.players) >= 2
+    
+    def opponent_of(self, player):
+        """Retorna o oponente de um jogador na partida"""
+        return next(p for p in self.players.values() if p.id != player.id)
+
+class BattleShipDatagramProtocol(asyncio.DatagramProtocol):
+    """Recebe datagramas no event loop e despacha para o servidor"""
+    
+    def __init__(self, server):
+        self.server = server
+    
+    def datagram_received(self, data, addr):
+        self.server._dispatch_async(data, addr)
+    
+    def error_received(self, exc):
+        logging.error(f"❌ Erro ao receber mensagem: {exc}")
+
+class ForwardedDatagramProtocol(BattleShipDatagramProtocol):
+    """Recebe datagramas repassados por outros processos do shard"""
+    
+    def datagram_received(self, data, addr):
+        forwarded = self.server._unwrap_forwarded(data)
+        if forwarded is not None:
+            self.server._handle_forwarded(*forwarded)
+
+# Cabeçalho de repasse entre workers: marca, flags, IPv4 e porta do cliente
+FORWARD_HEADER = struct.Struct('!BB4sH')
+FORWARD_MAGIC = 0xFE
+FORWARD_RESERVED = 0x01  # join com match_id reservado pelo lobby
+
+class BattleShipServer:
+    # Mensagens tratadas no pool de workers em vez do event loop
+    SLOW_MESSAGE_TYPES = {'place_ships'}
+    
+    def __init__(self, host='127.0.0.1', port=12345,
+                 worker_index=0, worker_count=1, forward_base=None, journal_dir=None,
+                 snapshot_path=None, snapshot_interval=SNAPSHOT_INTERVAL, metrics_port=None,
+                 profile_dir='.', rate_scale=1.0, ingress_limit=INGRESS_LIMIT,
+                 shed_policy='oldest', ratings_path=None, batch_window=None,
+                 batch_budget=BATCH_BUDGET):
+        self.host = host
+        self.port = port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Sharding: a partida N pertence ao worker N % worker_count
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        self.forward_base = forward_base if forward_base is not None else port + 1
+        self.forward_sock = None
+        self.lobbies = {}            # ruleset.key -> (match_id, addrs) do lobby (worker 0)
+        self.running = False
+        self.loop = None
+        self.executor = None
+        self.max_pending = 0
+        self.pending = 0
+        self._stop_event = None
+        self.matches = {}        # match_id -> Match
+        self.addr_matches = {}   # addr -> Match
+        self.open_matches = {}   # ruleset.key -> partida aguardando o segundo jogador
+        self.next_match_id = 1
+        # Contadores e latências sempre ligados (mensagem stats e /metrics)
+        self.metrics = ServerMetrics()
+        self.metrics_port = metrics_port
+        self.metrics_http = None
+        # Protege apenas o registro de partidas; a espera por ele é medida
+        self.lock = TimedLock(threading.Lock(), self.metrics.lock_wait)
+        # Proteção contra enxurradas: token buckets por endereço e tipo, e
+        # (no modo threaded) uma fila limitada na frente dos handlers
+        self.rate_limiter = RateLimiter(scale=rate_scale)
+        self.ingress = IngressQueue(ingress_limit, shed_policy)
+        self.peer_codecs = {}    # addr -> protocolo negociado no join
+        self.sessions = {}       # token -> Match, para retomar de outro endereço
+        # Camada confiável: ativada por par quando ele envia envelopes
+        self.reliable = ReliableEndpoint()
+        # Espectadores recebem os eventos por uma thread própria
+        self.spectators = SpectatorHub(self.sock)
+        self.spectate_secret = secrets.token_bytes(16)  # Chave dos nonces de spectate
+        # Diários binários das partidas (desligados sem journal_dir)
+        self.journal_dir = journal_dir
+        self.open_journals = OrderedDict()  # match_id -> MatchJournal, do menos ao mais usado
+        self.journals_lock = threading.Lock()
+        self.run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+        # Amostragem de pilhas sob demanda (mensagem profile ou SIGUSR1)
+        self.profiler = SamplingProfiler(profile_dir, f"profile-{self.run_id}-w{worker_index}")
+        # Snapshot periódico das partidas vivas, um arquivo por worker
+        if snapshot_path is not None and worker_count > 1:
+            snapshot_path = f"{snapshot_path}.w{worker_index}"
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.snapshotter = None
+        # Fila ranqueada e notas: vivem no worker 0, que recebe os joins sem
+        # partida; os donos das partidas mandam os resultados para ele
+        self.matchmaker = Matchmaker()
+        self.ratings = RatingBook(ratings_path if worker_index == 0 else None)
+        # Lotes de saída (desligados sem batch_window): o que cada par recebe
+        # dentro de uma janela sai num só datagrama. Janela 0 junta só o que
+        # uma mensagem recebida produz, sem atrasar nada
+        self.batch_window = batch_window
+        self.outbox = Outbox(self._transmit, batch_budget) if batch_window is not None else None
+        self.batch_peers = set()  # pares que anunciaram 'batch' no join
         
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
     
-    def start(self):
-        """Inicia o servidor"""
+    def _bind(self):
+        """Abre o socket público e, com vários workers, o socket de repasse"""
+        if self.worker_count > 1:
+            # Todos os workers escutam a mesma porta e respondem por ela
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.forward_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.forward_sock.bind(self._forward_addr(self.worker_index))
+        self.sock.bind((self.host, self.port))
+    
+    def _forward_addr(self, worker_index):
+        return ('127.0.0.1', self.forward_base + worker_index)
+    
+    def start(self, workers=4):
+        """Inicia o servidor com `workers` threads tratando a fila de entrada"""
         try:
-            self.sock.bind((self.host, self.port))
+            self._bind()
             logging.info(f"🚀 Servidor BATTLESHI.PY iniciado em {self.host}:{self.port}")
             print(f"🎮 Servidor BATTLESHI.PY rodando em {self.host}:{self.port}")
             print("⏳ Aguardando jogadores...")
             
+            self.running = True
+            self._start_snapshots()
+            self._start_metrics()
+            self._install_profile_signal()
+            start_retransmit_timer(self.reliable, self.sock.sendto)
+            self.spectators.start()
+            self._start_matchmaking()
+            self._start_batching()
+            self._start_reaper()
+            for i in range(workers):
+                threading.Thread(target=self._handler_loop, daemon=True,
+                                 name=f'battleshipy-handler-{i}').start()
+            if self.forward_sock is not None:
+                threading.Thread(target=self._listen_forwarded, daemon=True).start()
             self._listen()
             
         except Exception as e:
             logging.error(f"❌ Erro ao iniciar servidor: {e}")
     
+    def start_async(self, workers=4):
+        """Inicia o servidor no modo asyncio"""
+        try:
+            asyncio.run(self._serve_async(workers))
+        except Exception as e:
+            logging.error(f"❌ Erro ao iniciar servidor: {e}")
+    
+    def stop(self):
+        """Encerra o servidor (em qualquer modo)"""
+        self.running = False
+        self.spectators.stop()
+        self.ingress.close()
+        if self.snapshotter is not None:
+            self.snapshotter.stop()
+        self._save_ratings()
+        if self.outbox is not None:
+            self.outbox.flush()
+        if self.metrics_http is not None:
+            self.metrics_http.shutdown()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+        else:
+            # Acorda o recvfrom bloqueado com um datagrama vazio
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as wakeup:
+                wakeup.sendto(b'', self.sock.getsockname())
+    
     def _listen(self):
-        """Escuta por mensagens dos clientes"""
-        while True:
+        """Escuta por mensagens dos clientes e as enfileira para os handlers"""
+        while self.running:
             try:
-                data, addr = self.sock.recvfrom(1024)
-                threading.Thread(target=self._handle_message, args=(data, addr)).start()
+                data, addr = self.sock.recvfrom(65535)
+                if not self.running:
+                    break
+                # Repassar antes de limitar: só o worker dono conhece o endereço
+                if self.worker_count > 1 and self._route(data, addr):
+                    continue
+                # Quem já está numa partida passa na frente de joins e desconhecidos
+                known = addr in self.addr_matches
+                if not self._admit(data, addr, known):
+                    continue
+                self._enqueue((self._handle_message, (data, addr, True)), 0 if known else 1)
             except Exception as e:
                 logging.error(f"❌ Erro ao receber mensagem: {e}")
+        self.sock.close()
     
-    def _handle_message(self, data, addr):
-        """Processa mensagens recebidas dos clientes"""
+    def _listen_forwarded(self):
+        """Escuta datagramas repassados por outros workers"""
+        while self.running:
+            try:
+                packet, _ = self.forward_sock.recvfrom(65535)
+                forwarded = self._unwrap_forwarded(packet)
+                if forwarded is not None:
+                    self._enqueue((self._handle_forwarded, forwarded), 0)
+            except Exception as e:
+                logging.error(f"❌ Erro ao receber repasse: {e}")
+    
+    def _admit(self, data, addr, known):
+        """Token bucket do endereço para o tipo da mensagem; False descarta"""
+        if self.rate_limiter.allow(addr, peek_type(data), time.monotonic(), known):
+            return True
+        self.metrics.count('datagrams_rate_limited')
+        return False
+    
+    def _enqueue(self, item, priority):
+        """Põe na fila de entrada; cheia, descarta conforme a política"""
+        shed = self.ingress.put(item, priority)
+        if shed is None:
+            return
+        self.metrics.count('datagrams_shed')
+        if shed is item and self.ingress.policy == 'busy':
+            handler, args = item
+            if handler == self._handle_message:
+                # Recusa explícita, em JSON e fora da camada confiável
+                try:
+                    self.sock.sendto(encode({'type': 'error', 'code': ERR_BUSY}), args[1])
+                except OSError:
+                    pass
+    
+    def _handler_loop(self):
+        """Thread do pool: trata a fila de entrada até o servidor parar"""
+        while True:
+            item = self.ingress.get()
+            if item is None:
+                return
+            handler, args = item
+            handler(*args)
+    
+    async def _serve_async(self, workers):
+        """Event loop de datagramas: sem uma thread por mensagem"""
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='battleshipy')
+        self.max_pending = workers * 4
+        
+        # O socket fica não bloqueante; os envios continuam usando
+        # self.sock.sendto, que é seguro a partir dos workers
+        self._bind()
+        self.sock.setblocking(False)
+        transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: BattleShipDatagramProtocol(self), sock=self.sock)
+        if self.forward_sock is not None:
+            self.forward_sock.setblocking(False)
+            await self.loop.create_datagram_endpoint(
+                lambda: ForwardedDatagramProtocol(self), sock=self.forward_sock)
+        
+        logging.info(f"🚀 Servidor BATTLESHI.PY (asyncio) iniciado em {self.host}:{self.port}")
+        print(f"🎮 Servidor BATTLESHI.PY rodando em {self.host}:{self.port} (asyncio)")
+        print("⏳ Aguardando jogadores...")
+        
+        self.running = True
+        self._start_snapshots()
+        self._start_metrics()
+        self._install_profile_signal()
+        retransmit_stop = threading.Event()
+        start_retransmit_timer(self.reliable, self.sock.sendto, retransmit_stop)
+        self.spectators.start()
+        self._start_matchmaking()
+        self._start_batching()
+        self._start_reaper()
+        try:
+            await self._stop_event.wait()
+        finally:
+            retransmit_stop.set()
+            self.spectators.stop()
+            transport.close()
+            self.executor.shutdown(wait=True)
+            self.loop = None
+    
+    def _dispatch_async(self, data, addr):
+        """Trata a mensagem no event loop ou no pool limitado de workers"""
+        if self.worker_count > 1 and self._route(data, addr):
+            return  # O worker dono aplica os limites
+        if not self._admit(data, addr, addr in self.addr_matches):
+            return
+        if self.pending < self.max_pending and peek_type(data) in self.SLOW_MESSAGE_TYPES:
+            self.pending += 1
+            future = self.loop.run_in_executor(self.executor, self._handle_message,
+                                               data, addr, True)
+            future.add_done_callback(self._worker_done)
+        else:
+            self._handle_message(data, addr, True)
+    
+    def _worker_done(self, future):
+        self.pending -= 1
+    
+    def _route(self, data, addr):
+        """Repassa a mensagem ao worker dono da partida; True se repassou"""
+        match_id = peek_match_id(data)
+        if match_id is None:
+            # Joins sem partida vão para o lobby no worker 0
+            if self.worker_index != 0 and peek_type(data) == 'join':
+                self._forward(0, data, addr)
+                return True
+            return False
+        
+        owner = match_id % self.worker_count
+        if owner == self.worker_index:
+            return False
+        self._forward(owner, data, addr)
+        return True
+    
+    def _forward(self, worker_index, data, addr, flags=0):
+        """Envia o datagrama a outro worker preservando o endereço do cliente"""
+        header = FORWARD_HEADER.pack(FORWARD_MAGIC, flags,
+                                     socket.inet_aton(addr[0]), addr[1])
+        try:
+            self.sock.sendto(header + data, self._forward_addr(worker_index))
+        except Exception as e:
+            logging.error(f"❌ Erro ao repassar para o worker {worker_index}: {e}")
+    
+    def _unwrap_forwarded(self, packet):
+        """(dados, endereço do cliente, reservado) de um datagrama repassado, ou
+        None se inválido ou barrado pelo limite por endereço.
+        
+        O limite é aplicado aqui, no worker dono da partida, que é quem sabe
+        se o endereço já joga nela; joins reservados pelo lobby já passaram
+        pelo limite do worker 0.
+        """
+        if len(packet) < FORWARD_HEADER.size or packet[0] != FORWARD_MAGIC:
+            return None
+        _, flags, ip, port = FORWARD_HEADER.unpack_from(packet)
+        addr = (socket.inet_ntoa(ip), port)
+        data = packet[FORWARD_HEADER.size:]
+        reserved = bool(flags & FORWARD_RESERVED)
+        if not reserved and not self._admit(data, addr, addr in self.addr_matches):
+            return None
+        return data, addr, reserved
+    
+    def _handle_forwarded(self, data, addr, reserved):
+        """Processa um datagrama repassado como local"""
+        self._handle_message(data, addr, routed=True, reserved=reserved)
+    
+    def _handle_message(self, data, addr, routed=False, reserved=False):
+        """Processa mensagens recebidas dos clientes (routed: já passou pelo repasse)"""
+        self.metrics.handler_started()
         try:
-            message = json.loads(data.decode())
+            if self.worker_count > 1 and not routed and self._route(data, addr):
+                return
+            
+            if not is_envelope(data):
+                self._dispatch_message(data, addr, reserved)
+                return
+            
+            # Datagrama da camada confiável: entregar em ordem e confirmar
+            for payload in self.reliable.receive(addr, data):
+                self._dispatch_message(payload, addr, reserved)
+            ack = self.reliable.take_ack(addr)
+            if ack is not None:
+                self.sock.sendto(ack, addr)
+                self.metrics.count('datagrams_sent')
+                    
+        except Exception as e:
+            self.metrics.count('datagrams_dropped_in')
+            logging.error(f"❌ Erro ao processar mensagem: {e}")
+        finally:
+            if self.batch_window == 0:
+                self.outbox.flush()
+            self.metrics.handler_finished()
+    
+    def _dispatch_message(self, data, addr, reserved=False):
+        """Decodifica uma mensagem e a entrega ao handler do seu tipo"""
+        started = time.perf_counter_ns()
+        msg_type = None
+        try:
+            message = decode(data)
             msg_type = message.get('type')
             
-            with self.lock:
-                if msg_type == 'join':
-                    self._handle_join(addr, message)
-                elif msg_type == 'place_ships':
-                    self._handle_place_ships(addr, message)
+            if msg_type == 'stats':
+                self._handle_stats(addr)
+                return
+            if msg_type == 'profile':
+                self._handle_profile(addr, message)
+                return
+            if msg_type == 'join':
+                self._handle_join(addr, message, reserved)
+                return
+            if msg_type == 'unqueue':
+                if self.matchmaker.cancel(addr):
+                    self._send_to_client(addr, {'type': 'unqueued'})
+                return
+            if msg_type == 'rating_result':
+                # Só vale repassado por outro worker (nunca direto de um cliente)
+                if reserved:
+                    self._rate(message['winner'], message['loser'])
+                return
+            if msg_type == 'resume':
+                self._handle_resume(addr, message)
+                return
+            if msg_type in ('spectate', 'unspectate'):
+                self._handle_spectate(addr, message)
+                return
+            
+            match = self.addr_matches.get(addr)
+            if match is None:
+                self._send_error(addr, ERR_PLAYER_NOT_FOUND)
+                return
+            
+            # Cada partida tem seu próprio lock: o tráfego de um jogo
+            # nunca espera por outro
+            with match.lock:
+                now = time.monotonic()
+                match.last_active = now
+                player = match.players.get(addr)
+                if player is not None:
+                    player.last_seen = now
+                if msg_type == 'place_ships':
+                    self._handle_place_ships(match, addr, message)
                 elif msg_type == 'shoot':
-                    self._handle_shoot(addr, message)
+                    self._handle_shoot(match, addr, message)
                 elif msg_type == 'restart':
-                    self._handle_restart(addr)
+                    self._handle_restart(match, addr)
+                elif msg_type == 'sync':
+                    # Só leitura: não marca a partida para o próximo snapshot
+                    self._handle_sync(match, addr, message)
+                if msg_type != 'sync':
+                    match.version += 1
                     
         except Exception as e:
+            self.metrics.count('datagrams_dropped_in')
             logging.error(f"❌ Erro ao processar mensagem: {e}")
+        finally:
+            self.metrics.observe(msg_type or 'invalid', time.perf_counter_ns() - started)
     
-    def _handle_join(self, addr, message):
-        """Lida com jogadores se conectando"""
-        if addr in self.players:
-            self._send_game_state(addr)
+    def _find_match_for_join(self, message, ruleset, reserved=False):
+        """Escolhe a partida de um novo jogador (chamado com self.lock)"""
+        match_id = message.get('match_id')
+        if match_id is not None:
+            # Quem entra por match_id joga com as regras de quem criou a partida
+            match = self.matches.get(match_id)
+            if match is None and reserved:
+                # Partida reservada pelo lobby para este worker
+                match = Match(match_id, ruleset)
+                self.matches[match_id] = match
+            if match is None or match.is_full():
+                return None
+            return match
+        
+        if message.get('private') or message.get('mode') == 'ai':
+            # Partida nova fora do lobby; o oponente entra pelo match_id
+            # ou, no modo solo, é a IA do servidor
+            match = Match(self.next_match_id, ruleset)
+            self.matches[match.id] = match
+            self.next_match_id += 1
+            return match
+        
+        # Só são pareados jogadores que pediram as mesmas regras
+        match = self.open_matches.get(ruleset.key)
+        if match is None or match.is_full():
+            match = self.open_matches[ruleset.key] = Match(self.next_match_id, ruleset)
+            self.matches[match.id] = match
+            self.next_match_id += 1
+        return match
+    
+    def _lobby_assign(self, addr, ruleset, private=False):
+        """Reserva a partida de um join anônimo no modo shard (worker 0)"""
+        if private:
+            self.next_match_id += 1
+            return self.next_match_id - 1
+        match_id, addrs = self.lobbies.get(ruleset.key, (None, ()))
+        if addr not in addrs:
+            if match_id is None or len(addrs) >= 2:
+                match_id = self.next_match_id
+                self.next_match_id += 1
+                addrs = set()
+            addrs.add(addr)
+            self.lobbies[ruleset.key] = (match_id, addrs)
+        return match_id
+    
+    def _queue_ranked(self, addr, message, ruleset):
+        """Põe o jogador na fila ranqueada (ou renova o lugar) e pareia se der"""
+        with self.lock:
+            match = self._active_match(addr)
+            if match is not None:
+                with match.lock:
+                    self._send_game_state(match, addr)
+                return
+        rating, rd = self.ratings.get(message['name'], time.time())
+        pairs, queued = self.matchmaker.enqueue(addr, message['name'], rating, ruleset.key,
+                                                message, time.monotonic())
+        self._send_to_client(addr, {'type': 'queued', 'rating': round(rating),
+                                    'rd': round(rd), 'queued': queued})
+        for first, second in pairs:
+            self._start_ranked(first, second)
+    
+    def _start_ranked(self, first, second):
+        """Cria a partida de um par da fila, no worker dono do match_id"""
+        with self.lock:
+            match_id = self.next_match_id
+            self.next_match_id += 1
+        owner = match_id % self.worker_count
+        log.info('ranked_pair', "🏅 {first} ({first_rating:.0f}) x {second} "
+                 "({second_rating:.0f}) na partida {match}",
+                 first=first.name, first_rating=first.rating, second=second.name,
+                 second_rating=second.rating, match=match_id)
+        for ticket in (first, second):
+            message = dict(ticket.message, match_id=match_id)
+            if owner == self.worker_index:
+                self._handle_join(ticket.addr, message, reserved=True)
+            else:
+                self._forward(owner, json.dumps(message).encode(), ticket.addr, FORWARD_RESERVED)
+    
+    def _start_matchmaking(self):
+        """Thread das tentativas agendadas da fila e da gravação das notas"""
+        def run():
+            saved = time.monotonic()
+            while self.running:
+                time.sleep(MATCHMAKING_TICK)
+                now = time.monotonic()
+                try:
+                    pairs, expired = self.matchmaker.due(now)
+                    for first, second in pairs:
+                        self._start_ranked(first, second)
+                    for ticket in expired:
+                        self._send_to_client(ticket.addr, {'type': 'queue_expired'})
+                    if now - saved >= RATINGS_SAVE_INTERVAL:
+                        saved = now
+                        self._save_ratings()
+                except Exception as e:
+                    logging.error(f"❌ Erro na fila ranqueada: {e}")
+        
+        threading.Thread(target=run, daemon=True, name='battleshipy-matchmaking').start()
+    
+    def _start_batching(self):
+        """Thread que esvazia os lotes de saída a cada janela"""
+        if self.outbox is None:
             return
+        interval = self.batch_window / 1000 or FLUSH_FALLBACK
+        
+        def run():
+            while self.running:
+                time.sleep(interval)
+                try:
+                    self.outbox.flush()
+                except Exception as e:
+                    logging.error(f"❌ Erro ao esvaziar lotes: {e}")
         
-        if len(self.players) >= 2:
-            self._send_error(addr, "🎮 Jogo cheio. Máximo de 2 jogadores.")
+        threading.Thread(target=run, daemon=True, name='battleshipy-outbox').start()
+    
+    def _start_reaper(self):
+        """Thread que desfaz as partidas encerradas ou abandonadas"""
+        def run():
+            while self.running:
+                time.sleep(REAP_INTERVAL)
+                try:
+                    self._reap_matches()
+                except Exception as e:
+                    logging.error(f"❌ Erro ao desfazer partidas: {e}")
+        
+        threading.Thread(target=run, daemon=True, name='battleshipy-reaper').start()
+    
+    def _reap_matches(self, now=None):
+        """Desfaz as partidas paradas (Match.is_stale); devolve quantas"""
+        now = time.monotonic() if now is None else now
+        closed = 0
+        with self.lock:
+            for match in list(self.matches.values()):
+                with match.lock:
+                    if match.is_stale(now):
+                        self._close_match(match)
+                        closed += 1
+        return closed
+    
+    def _active_match(self, addr):
+        """Partida em que o endereço joga (com self.lock). Uma partida encerrada
+        é desfeita: quem pede outro join depois do fim quer um jogo novo"""
+        match = self.addr_matches.get(addr)
+        if match is None:
+            return None
+        with match.lock:
+            if match.game_state != "finished":
+                return match
+            self._close_match(match)
+        return None
+    
+    def _close_match(self, match):
+        """Tira a partida do registro e libera endereços, sessões, protocolos,
+        diário e transmissão (com self.lock e o lock da partida)"""
+        self.matches.pop(match.id, None)
+        if self.open_matches.get(match.ruleset.key) is match:
+            del self.open_matches[match.ruleset.key]
+        for addr, player in match.players.items():
+            if self.addr_matches.get(addr) is match:
+                del self.addr_matches[addr]
+            self.sessions.pop(player.token, None)
+            self.peer_codecs.pop(addr, None)
+            self.batch_peers.discard(addr)
+            self.reliable.release(addr)
+        if match.journal is not None:
+            match.journal.close()
+            match.journal = None
+            with self.journals_lock:
+                self.open_journals.pop(match.id, None)
+        self.spectators.drop(match.id)
+        self.metrics.count('matches_closed')
+        log.info('match_closed', "🧹 Partida {match} desfeita ({state})",
+                 match=match.id, state=match.game_state)
+    
+    def _rate(self, winner, loser):
+        """Atualiza as notas de uma partida ranqueada (no worker 0)"""
+        if self.worker_index != 0:
+            data = json.dumps({'type': 'rating_result', 'winner': winner, 'loser': loser})
+            self._forward(0, data.encode(), ('127.0.0.1', 0), FORWARD_RESERVED)
             return
+        (rw, _), (rl, _) = self.ratings.record(winner, loser, time.time())
+        log.info('rated', "🏅 {winner} venceu {loser}: notas {winner_rating:.0f} e {loser_rating:.0f}",
+                 winner=winner, loser=loser, winner_rating=rw, loser_rating=rl)
+    
+    def _save_ratings(self):
+        try:
+            self.ratings.save()
+        except OSError as e:
+            logging.error(f"❌ Erro ao gravar as notas: {e}")
+    
+    def _handle_join(self, addr, message, reserved=False):
+        """Lida com jogadores se conectando"""
+        try:
+            ruleset = parse_rules(message.get('rules'))
+        except ValueError as e:
+            log.warning('invalid_rules', "📐 Regras inválidas de {addr}: {error}",
+                        addr=addr, error=str(e))
+            self._send_error(addr, ERR_INVALID_RULES)
+            return
+        if message.get('mode') == 'ai' and ruleset.sparse:
+            # A IA conta posicionamentos em bitboards: só tabuleiros densos
+            self._send_error(addr, ERR_INVALID_RULES)
+            return
+        ranked = message.get('mode') == 'ranked'
+        if ranked and not valid_name(message.get('name')):
+            self._send_error(addr, ERR_INVALID_NAME)
+            return
+        if ranked and message.get('match_id') is None:
+            self._queue_ranked(addr, message, ruleset)
+            return
+        if not reserved:
+            # Quem entra numa partida por conta própria sai da fila ranqueada
+            self.matchmaker.cancel(addr)
         
-        player_id = len(self.players) + 1
-        self.players[addr] = Player(addr, player_id)
+        with self.lock:
+            match = self._active_match(addr)
+            if match is not None:
+                with match.lock:
+                    self._send_game_state(match, addr)
+                return
+            
+            if self.worker_count > 1 and message.get('match_id') is None:
+                # O lobby distribui as partidas entre os workers em rodízio
+                private = message.get('private', False) or message.get('mode') == 'ai'
+                message['match_id'] = self._lobby_assign(addr, ruleset, private)
+                owner = message['match_id'] % self.worker_count
+                if owner != self.worker_index:
+                    self._forward(owner, json.dumps(message).encode(), addr, FORWARD_RESERVED)
+                    return
+                reserved = True
+            
+            match = self._find_match_for_join(message, ruleset, reserved)
+            if match is None:
+                self._send_error(addr, ERR_MATCH_FULL)
+                return
+            
+            match.lock.acquire()
+            self.addr_matches[addr] = match
+            match.last_active = time.monotonic()
         
-        logging.info(f"🎯 Jogador {player_id} conectado: {addr}")
+        try:
+            player_id = len(match.players) + 1
+            # O token começa pelo match_id para que o shard dono seja encontrado
+            token = f"{match.id}-{secrets.token_urlsafe(12)}"
+            match.players[addr] = make_player(addr, player_id, token, match.ruleset)
+            self.sessions[token] = match
+            if ranked and reserved:
+                match.names[player_id] = message['name']
+            
+            log.info('join', "🎯 Jogador {player} conectado à partida {match}: {addr}",
+                     player=player_id, match=match.id, addr=addr)
+            
+            response = {
+                'type': 'join_success',
+                'player_id': player_id,
+                'match_id': match.id,
+                'token': token,
+                'rules': match.ruleset.to_message()
+            }
+            self._reply_negotiated(addr, message, response, match)
+            
+            if message.get('mode') == 'ai' and not match.is_full():
+                self._add_ai(match, message.get('difficulty', DEFAULT_DIFFICULTY))
+            
+            if match.is_full():
+                match.game_state = "placing"
+                log.info('match_full', "🚀 Dois jogadores conectados na partida {match}. "
+                         "Iniciando posicionamento.", match=match.id)
+                self._broadcast(match, {'type': 'game_start'})
+        finally:
+            match.version += 1
+            match.lock.release()
+    
+    def _add_ai(self, match, difficulty):
+        """Ocupa o segundo lugar da partida com a IA do servidor"""
+        if difficulty not in DIFFICULTIES:
+            difficulty = DEFAULT_DIFFICULTY
+        match.ai = AIPlayer(difficulty, ruleset=match.ruleset)
+        match.ai_addr = ('ai', match.id)
+        player_id = len(match.players) + 1
+        match.players[match.ai_addr] = make_player(match.ai_addr, player_id, ruleset=match.ruleset)
+        self._place_ai_fleet(match)
+        log.info('ai_join', "🤖 IA ({difficulty}) entrou como jogador {player} na partida {match}",
+                 difficulty=difficulty, player=player_id, match=match.id)
+    
+    def _place_ai_fleet(self, match):
+        """Frota aleatória para a IA e memória de tiros zerada"""
+        player = match.players[match.ai_addr]
+        player.place_ships(random_fleet_positions(match.ruleset, match.ai.random))
+        match.ai.reset()
+        self._record(match, 'place', player)
+    
+    def _play_ai(self, match):
+        """Joga os turnos da IA até a vez voltar ao humano ou o jogo acabar"""
+        player = match.players[match.ai_addr]
+        while match.game_state == "playing" and match.current_turn == player.id:
+            x, y = match.ai.next_shot()
+            response = self._fire(match, player, x, y)
+            if response is None:
+                logging.error(f"❌ IA repetiu o tiro ({x},{y}) na partida {match.id}")
+                return
+            match.ai.observe(x, y, response['result'], response['ship_size'])
+    
+    def _reply_negotiated(self, addr, message, response, match):
+        """Responde em JSON e passa a usar o protocolo pedido pelo cliente"""
+        protocol = message.get('protocol', PROTOCOL_JSON)
+        if match.ruleset is not DEFAULT_RULESET:
+            # bin1 usa coordenadas em bytes e os nomes da frota clássica
+            protocol = PROTOCOL_JSON
+        if protocol in SUPPORTED_PROTOCOLS:
+            response['protocol'] = protocol
+        batch = self.outbox is not None and bool(message.get('batch'))
+        if batch:
+            response['batch'] = True
+        self._send_to_client(addr, response)
+        if protocol != PROTOCOL_JSON and protocol in SUPPORTED_PROTOCOLS:
+            self.peer_codecs[addr] = protocol
+        if batch:
+            self.batch_peers.add(addr)
+    
+    def _handle_resume(self, addr, message):
+        """Reassocia uma sessão a um novo endereço e envia o estado completo"""
+        token = message.get('token')
+        with self.lock:
+            match = self.sessions.get(token)
+            if match is None:
+                self._send_error(addr, ERR_INVALID_TOKEN)
+                return
+            
+            with match.lock:
+                player = next(p for p in match.players.values() if p.token == token)
+                old_addr = player.addr
+                if old_addr != addr:
+                    if addr in self.addr_matches:
+                        self._send_error(addr, ERR_INVALID_TOKEN)
+                        return
+                    del match.players[old_addr]
+                    del self.addr_matches[old_addr]
+                    self.peer_codecs.pop(old_addr, None)
+                    self.batch_peers.discard(old_addr)
+                    self.reliable.forget(old_addr)
+                    player.addr = addr
+                    match.players[addr] = player
+                    self.addr_matches[addr] = match
+                    log.info('resume', "🔁 Jogador {player} da partida {match} retomou de {addr}",
+                             player=player.id, match=match.id, addr=addr)
+                    match.version += 1
+                
+                player.last_seen = match.last_active = time.monotonic()
+                parts = self._snapshot_parts(match, player)
+                self._reply_negotiated(addr, message, parts[0], match)
+                for part in parts[1:]:
+                    self._send_to_client(addr, part)
+    
+    def _snapshot_parts(self, match, player):
+        """Estado completo da partida na visão de um jogador, em partes.
         
-        response = {
-            'type': 'join_success',
-            'player_id': player_id,
-            'message': f"Jogador {player_id} conectado!"
+        Tabuleiros esparsos grandes têm listas de células que não cabem num
+        datagrama: as células são divididas em partes de SNAPSHOT_CELLS, todas
+        com o mesmo seq e hash; só a primeira leva o cabeçalho completo.
+        """
+        snapshot = {
+            'type': 'snapshot',
+            'player_id': player.id,
+            'match_id': match.id,
+            'game_state': match.game_state,
+            'current_turn': match.current_turn,
+            'rules': match.ruleset.to_message(),
+            'ready': player.ready,
+            'board': player.own_view(),
+            'radar': None,
+            'seq': match.shots.seq,
+            'hash': match.shots.hash,
         }
-        self._send_to_client(addr, response)
+        if match.is_full():
+            snapshot['radar'] = match.opponent_of(player).radar_view()
+        cells = [(side, key, cell) for side in ('board', 'radar')
+                 for key, values in (snapshot[side] or {}).items() for cell in values]
+        if len(cells) <= SNAPSHOT_CELLS:
+            return [snapshot]
         
-        if len(self.players) == 2:
-            self.game_state = "placing"
-            logging.info("🚀 Dois jogadores conectados. Iniciando posicionamento.")
-            self._broadcast({
-                'type': 'game_start',
-                'message': 'Posicione seus navios!'
-            })
+        parts = []
+        count = -(-len(cells) // SNAPSHOT_CELLS)
+        for index in range(count):
+            part = snapshot if index == 0 else {
+                'type': 'snapshot',
+                'match_id': match.id,
+                'seq': snapshot['seq'],
+                'hash': snapshot['hash'],
+            }
+            part['board'] = {key: [] for key in snapshot['board']}
+            part['radar'] = None if snapshot['radar'] is None else {
+                key: [] for key in snapshot['radar']}
+            part['part'] = index
+            part['parts'] = count
+            for side, key, cell in cells[index * SNAPSHOT_CELLS:(index + 1) * SNAPSHOT_CELLS]:
+                part[side][key].append(cell)
+            parts.append(part)
+        return parts
+    
+    def _handle_spectate(self, addr, message):
+        """Inscreve, renova ou remove um espectador de uma partida.
+        
+        A transmissão só começa quando o pedido traz o nonce que o servidor
+        mandou ao endereço: um spectate com endereço falsificado recebe no
+        máximo uma resposta curta, nunca a partida inteira.
+        """
+        match = self.matches.get(message.get('match_id'))
+        if match is None:
+            self._send_error(addr, ERR_MATCH_NOT_FOUND)
+            return
+        if addr in match.players:
+            self._send_error(addr, ERR_MATCH_FULL)
+            return
+        if not self._valid_spectate_nonce(addr, match.id, message.get('nonce')):
+            if message['type'] == 'spectate':
+                self._send_to_client(addr, {
+                    'type': 'spectate_success',
+                    'match_id': match.id,
+                    'nonce': self._spectate_nonce(addr, match.id),
+                    'streaming': False,
+                })
+            return
+        if message['type'] == 'unspectate':
+            self.spectators.unsubscribe(match.id, addr)
+            return
+        
+        try:
+            delay = float(message.get('delay', 0))
+        except (TypeError, ValueError):
+            delay = 0.0
+        with match.lock:
+            delay = self.spectators.subscribe(match.id, addr, delay,
+                                              lambda: self._spectator_view(match))
+        if delay is None:
+            self._send_error(addr, ERR_SPECTATORS_FULL)
+            return
+        self._send_to_client(addr, {
+            'type': 'spectate_success',
+            'match_id': match.id,
+            'delay': delay,
+            'rules': match.ruleset.to_message(),
+            'nonce': self._spectate_nonce(addr, match.id),  # Para as renovações
+            'streaming': True,
+        })
+    
+    def _spectate_nonce(self, addr, match_id, window=0):
+        """Nonce de spectate de um endereço: HMAC do endereço, da partida e da
+        janela de SPECTATOR_TTL, sem guardar nada por pedido"""
+        period = int(time.time() // SPECTATOR_TTL) - window
+        key = f"{addr[0]}:{addr[1]}:{match_id}:{period}".encode()
+        return hmac.new(self.spectate_secret, key, hashlib.sha256).hexdigest()[:16]
     
-    def _handle_place_ships(self, addr, message):
+    def _valid_spectate_nonce(self, addr, match_id, nonce):
+        """Nonce desta janela ou da anterior (vale de SPECTATOR_TTL a 2x)"""
+        if not isinstance(nonce, str):
+            return False
+        return any(hmac.compare_digest(nonce, self._spectate_nonce(addr, match_id, window))
+                   for window in (0, 1))
+    
+    def _spectator_view(self, match):
+        """Estado completo para espectadores: só o que os dois radares já mostram"""
+        players = sorted(match.players.values(), key=lambda p: p.id)
+        return {
+            'type': 'spectate_state',
+            'match_id': match.id,
+            'game_state': match.game_state,
+            'current_turn': match.current_turn,
+            'rules': match.ruleset.to_message(),
+            'boards': [{'player_id': p.id, 'radar': p.radar_view()} for p in players]
+        }
+    
+    def _handle_place_ships(self, match, addr, message):
         """Lida com posicionamento de navios"""
-        if self.game_state != "placing":
-            self._send_error(addr, "⏳ Jogo não está na fase de posicionamento")
+        if match.game_state != "placing":
+            self._send_error(addr, ERR_NOT_PLACING)
             return
         
-        player = self.players.get(addr)
+        player = match.players.get(addr)
         if not player:
-            self._send_error(addr, "❌ Jogador não encontrado")
+            self._send_error(addr, ERR_PLAYER_NOT_FOUND)
             return
         
         ships_data = message.get('ships', [])
         
         if player.place_ships(ships_data):
-            logging.info(f"🎯 Jogador {player.id} posicionou {len(ships_data)} navios")
+            log.info('place', "🎯 Jogador {player} posicionou {ships} navios na partida {match}",
+                     player=player.id, ships=len(ships_data), match=match.id)
             
-            self._send_to_client(addr, {
-                'type': 'placement_success',
-                'message': 'Navios posicionados! Aguardando oponente...'
-            })
+            self._send_to_client(addr, {'type': 'placement_success'})
+            self._record(match, 'place', player)
             
             # Verificar se ambos estão prontos
-            all_ready = all(p.ready for p in self.players.values())
+            all_ready = all(p.ready for p in match.players.values())
             if all_ready:
-                self.game_state = "playing"
-                self.current_turn = 1
-                logging.info("⚔️ Ambos jogadores prontos. Jogo iniciado!")
-                self._broadcast({
+                match.game_state = "playing"
+                match.current_turn = 1
+                log.info('game_begin', "⚔️ Ambos jogadores prontos. Partida {match} iniciada!",
+                         match=match.id)
+                self._broadcast(match, {
                     'type': 'game_begin',
-                    'message': 'Jogo iniciado!',
-                    'turn': self.current_turn
+                    'turn': match.current_turn
                 })
         else:
-            self._send_error(addr, "❌ Posicionamento inválido. Use 'Navios Aleatórios'")
+            self._send_error(addr, ERR_INVALID_PLACEMENT)
     
-    def _handle_shoot(self, addr, message):
+    def _handle_shoot(self, match, addr, message):
         """Lida com tiros dos jogadores"""
-        if self.game_state != "playing":
-            self._send_error(addr, "⏳ Jogo não está em andamento")
+        if match.game_state != "playing":
+            self._send_error(addr, ERR_NOT_PLAYING)
             return
         
-        player = self.players.get(addr)
-        if not player or player.id != self.current_turn:
-            self._send_error(addr, "🎯 Não é sua vez")
+        player = match.players.get(addr)
+        if not player or player.id != match.current_turn:
+            self._send_error(addr, ERR_NOT_YOUR_TURN)
             return
         
         x = message.get('x')
         y = message.get('y')
         
-        if x is None or y is None or not (0 <= x < 10 and 0 <= y < 10):
-            self._send_error(addr, "❌ Coordenadas inválidas")
+        if not match.ruleset.in_bounds(x, y):
+            self._send_error(addr, ERR_INVALID_COORDS)
+            return
+        
+        if self._fire(match, player, x, y) is None:
+            self._send_error(addr, ERR_REPEATED_SHOT)
             return
         
+        if match.ai is not None:
+            self._play_ai(match)
+    
+    def _fire(self, match, player, x, y):
+        """Aplica um tiro válido e transmite o resultado; None se repetido"""
         # Encontrar oponente
-        opponent = next(p for p in self.players.values() if p.id != player.id)
+        opponent = match.opponent_of(player)
         
         # Processar tiro
         result, ship = opponent.take_shot(x, y)
         
         if result == "repetido":
-            self._send_error(addr, "🎯 Já atirou nesta posição")
-            return
+            return None
         
-        logging.info(f"🎯 Jogador {player.id} atirou em ({x},{y}): {result}")
+        log.info('shot', "🎯 Jogador {player} atirou em ({x},{y}) na partida {match}: {result}",
+                 player=player.id, x=x, y=y, match=match.id, result=result)
         
         # Preparar resposta
         response = {
@@ -287,79 +1333,495 @@ class BattleShipServer:
             'x': x,
             'y': y,
             'result': result,
+            'ship_id': ship.id if ship else None,
             'ship_name': ship.name if ship else None,
             'ship_size': ship.size if ship else None,
             'shooter': player.id,
-            'current_turn': self.current_turn
+            'current_turn': match.current_turn
         }
         
-        # Atualizar turno
+        # Atualizar turno (o texto de status é renderizado a partir do resultado)
         if result == "erro":
-            self.current_turn = 3 - self.current_turn
-            response['current_turn'] = self.current_turn
-            response['message'] = "🌊 Água! Vez do oponente."
-        elif result == "acerto":
-            response['message'] = f"💥 Acertou o {ship.name}!"
-        elif result == "afundado":
-            response['message'] = f"💀 Afundou o {ship.name}!"
+            match.current_turn = 3 - match.current_turn
+            response['current_turn'] = match.current_turn
         
         # Verificar fim de jogo
         if opponent.has_lost():
-            self.game_state = "finished"
+            match.game_state = "finished"
             response['game_over'] = True
             response['winner'] = player.id
-            response['message'] = f"🎉 Jogador {player.id} venceu!"
-            logging.info(f"🎉 Jogador {player.id} venceu o jogo!")
+            log.info('game_over', "🎉 Jogador {player} venceu a partida {match}!",
+                     player=player.id, match=match.id)
+            if len(match.names) == 2:
+                self._rate(match.names[player.id], match.names[opponent.id])
+        
+        match.shots.append(response)
         
         # Enviar resultado para ambos
-        self._broadcast(response)
+        self._broadcast(match, response)
+        self._record(match, 'shot', player.id, x, y, result, ship)
+        if match.game_state == "finished":
+            # Os canais confiáveis só esperam os últimos acks antes de sair
+            for addr in match.players:
+                self.reliable.release(addr)
+        return response
     
-    def _handle_restart(self, addr):
+    def _handle_restart(self, match, addr):
         """Reinicia o jogo"""
+        for player in match.players.values():
+            player.reset()
+        # O estado muda antes de gravar: com "finished" o diário fecharia de novo
+        match.game_state = "placing" if match.is_full() else "waiting"
+        match.current_turn = 1
+        match.shots.reset()
+        self._record(match, 'restart')
+        if match.ai is not None:
+            self._place_ai_fleet(match)
+        
+        self._broadcast(match, {'type': 'game_restart'})
+        log.info('restart', "🔄 Partida {match} reiniciada", match=match.id)
+    
+    def _handle_sync(self, match, addr, message):
+        """Reenvia os tiros depois do seq que o cliente conhece (ou o estado completo)"""
+        since = message.get('since')
+        # Sem since (ou full): o cliente divergiu e pede o estado completo
+        events = None if message.get('full') else match.shots.since(since)
+        if events is None:
+            # Pedido completo, histórico já descartado ou reinício do servidor
+            for part in self._snapshot_parts(match, match.players[addr]):
+                self._send_to_client(addr, part)
+            return
+        self._send_to_client(addr, {
+            'type': 'sync',
+            'match_id': match.id,
+            'since': since,
+            'seq': match.shots.seq,
+            'hash': match.shots.hash,
+            'events': events,
+        })
+    
+    def _record(self, match, event, *args):
+        """Anexa um lance aceito ao diário da partida (com o lock da partida).
+        
+        O lance já foi aplicado: uma falha do diário é contada e registrada,
+        nunca interrompe quem chamou.
+        """
+        if self.journal_dir is None:
+            return
+        try:
+            if match.journal is None:
+                path = os.path.join(self.journal_dir, f"{self.run_id}-{match.id}.bsj")
+                match.journal = MatchJournal(path, match.id, match.ruleset)
+            journal = match.journal
+            getattr(journal, event)(*args)
+            if match.game_state == "finished":
+                # Fecha ao fim do jogo (o reinício reabre)
+                journal.close()
+                match.journal = None
+                with self.journals_lock:
+                    self.open_journals.pop(match.id, None)
+                return
+            if event == 'shot' and journal.checkpoint_due():
+                journal.checkpoint(match.game_state, match.current_turn, match.players.values())
+            self._touch_journal(match.id, journal)
+        except Exception as e:
+            self.metrics.count('journal_errors')
+            logging.error(f"❌ Erro ao gravar o diário da partida {match.id}: {e}")
+    
+    def _touch_journal(self, match_id, journal):
+        """Marca o diário como o mais recente e fecha os arquivos além do limite.
+        
+        Milhares de partidas ao mesmo tempo não esgotam os descritores: só os
+        MAX_OPEN_JOURNALS mais usados ficam abertos, e um diário fechado reabre
+        em modo append no próximo lance.
+        """
+        evicted = []
+        with self.journals_lock:
+            self.open_journals[match_id] = journal
+            self.open_journals.move_to_end(match_id)
+            while len(self.open_journals) > MAX_OPEN_JOURNALS:
+                evicted.append(self.open_journals.popitem(last=False)[1])
+        for old in evicted:
+            old.suspend()  # Fora do journals_lock: só o lock do próprio diário
+    
+    def _start_metrics(self):
+        """Endpoint HTTP das métricas, se pedido (sempre só em localhost)"""
+        if self.metrics_port is None:
+            return
+        port = self.metrics_port + self.worker_index
+        self.metrics_http = start_metrics_http(port, self.stats_report)
+        logging.info(f"📈 Métricas em http://127.0.0.1:{port}/metrics")
+    
+    def stats_report(self):
+        """Contadores, medidores e histogramas do servidor"""
         with self.lock:
-            for player in self.players.values():
-                player.ready = False
-                player.board = [[' ' for _ in range(10)] for _ in range(10)]
-                player.ships = []
-                player.shots_taken = set()
-                player.ship_positions = {}
-            
-            self.game_state = "placing"
-            self.current_turn = 1
-            
-            self._broadcast({
-                'type': 'game_restart',
-                'message': 'Jogo reiniciado! Posicione navios.'
-            })
-            logging.info("🔄 Jogo reiniciado")
+            matches = list(self.matches.values())
+            players = len(self.addr_matches)
+        active = sum(1 for match in matches if match.game_state in ('placing', 'playing'))
+        report = self.metrics.report({
+            'worker': self.worker_index,
+            'matches': len(matches),
+            'active_matches': active,
+            'players': players,
+            'spectator_feeds': len(self.spectators.feeds),
+            'reliable_channels': len(self.reliable.channels),
+            'pending_slow_handlers': self.pending,
+            'ingress_depth': len(self.ingress),
+            'queued_players': len(self.matchmaker),
+            'rated_players': len(self.ratings),
+            'batch_peers': len(self.batch_peers),
+            'log_queue': len(log),
+            'open_journals': len(self.open_journals),
+        }, {
+            'spectator_datagrams': self.spectators.sent,
+            'retransmits': self.reliable.retransmits,
+            'reliable_channels_expired': self.reliable.expired,
+            'players_paired': self.matchmaker.paired,
+            'queue_expired': self.matchmaker.expired,
+            'batches_sent': self.outbox.batches if self.outbox is not None else 0,
+            'messages_batched': self.outbox.batched if self.outbox is not None else 0,
+            'log_dropped': log.dropped,
+            'log_sampled_out': log.sampled_out,
+        })
+        report['pairing_wait_us'] = self.matchmaker.waits.summary()
+        return report
+    
+    def _handle_stats(self, addr):
+        """Responde com as métricas; só para quem está na mesma máquina"""
+        if not addr[0].startswith('127.'):
+            log.warning('stats_refused', "📈 Pedido de stats recusado de {addr}", addr=addr)
+            return
+        try:
+            self.sock.sendto(encode(self.stats_report()), addr)
+        except OSError as e:
+            logging.error(f"❌ Erro ao enviar stats para {addr}: {e}")
+    
+    def _handle_profile(self, addr, message):
+        """Abre uma janela de amostragem e responde com o resumo ao final"""
+        if not addr[0].startswith('127.'):
+            log.warning('profile_refused', "🔬 Pedido de profile recusado de {addr}", addr=addr)
+            return
+        try:
+            seconds = float(message.get('seconds', PROFILE_SECONDS))
+        except (TypeError, ValueError):
+            seconds = PROFILE_SECONDS
+        
+        def done(result):
+            try:
+                self.sock.sendto(encode(result), addr)
+            except OSError as e:
+                logging.error(f"❌ Erro ao enviar o profile para {addr}: {e}")
+        
+        base = self.profiler.start(seconds, done)
+        reply = {'type': 'profile_started', 'seconds': seconds, 'busy': base is None}
+        self.sock.sendto(encode(reply), addr)
+    
+    def _install_profile_signal(self):
+        """SIGUSR1 abre uma janela de amostragem de PROFILE_SECONDS"""
+        if not hasattr(signal, 'SIGUSR1') or threading.current_thread() is not threading.main_thread():
+            return
+        signal.signal(signal.SIGUSR1,
+                      lambda signum, frame: self.profiler.start(PROFILE_SECONDS))
+    
+    def _start_snapshots(self):
+        """Restaura o snapshot existente e passa a gravá-lo periodicamente"""
+        if self.snapshot_path is None:
+            return
+        if os.path.exists(self.snapshot_path):
+            started = time.perf_counter()
+            count = self.restore_snapshot(self.snapshot_path)
+            logging.info(f"💾 {count} partidas restauradas de {self.snapshot_path} "
+                         f"em {time.perf_counter() - started:.3f}s")
+        self.snapshotter = Snapshotter(self, self.snapshot_path, self.snapshot_interval)
+        self.snapshotter.start()
+    
+    def restore_snapshot(self, path):
+        """Recria as partidas de um snapshot antes de servir; devolve quantas"""
+        # Milhares de objetos novos de uma vez: sem o coletor de ciclos, que
+        # varreria o heap inteiro várias vezes durante a carga
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._restore_records(*read_snapshot(path))
+        finally:
+            if gc_enabled:
+                gc.enable()
+    
+    def _restore_records(self, header, records):
+        open_ids = set(header.get('open', ()))
+        with self.lock:
+            for record in records:
+                match = self._restore_match(record)
+                if match.id in open_ids:
+                    self.open_matches[match.ruleset.key] = match
+                if self.journal_dir is not None and any(p.ready for p in match.players.values()):
+                    # O diário novo desta execução começa do estado restaurado
+                    with match.lock:
+                        self._record(match, 'checkpoint', match.game_state,
+                                     match.current_turn, match.players.values())
+            self.next_match_id = max(self.next_match_id, header['next_match_id'])
+        return len(records)
+    
+    def _match_record(self, match):
+        """Partida em tipos simples para o snapshot (com o lock da partida)"""
+        players = []
+        for addr, player in match.players.items():
+            state = player.to_state()
+            state['id'] = player.id
+            state['addr'] = None if addr == match.ai_addr else list(addr)
+            state['token'] = player.token
+            state['protocol'] = self.peer_codecs.get(addr, PROTOCOL_JSON)
+            state['batch'] = addr in self.batch_peers
+            state['ready'] = player.ready
+            players.append(state)
+        return {
+            'id': match.id,
+            'rules': match.ruleset.to_message(),
+            'state': match.game_state,
+            'turn': match.current_turn,
+            'ai': match.ai.difficulty if match.ai is not None else None,
+            'players': players,
+            'names': match.names,
+            'seq': match.shots.seq,
+            'hash': match.shots.hash,
+        }
+    
+    def _restore_match(self, record):
+        """Inverso de _match_record: registra a partida, endereços e sessões"""
+        match = Match(record['id'], parse_rules(record['rules']))
+        match.game_state = record['state']
+        match.current_turn = record['turn']
+        match.names = {int(player_id): name for player_id, name in record.get('names', {}).items()}
+        # Os tiros anteriores não voltam: um sync pedido antes disso recebe o estado completo
+        match.shots = ShotLog(record.get('seq', 0), record.get('hash', 0))
+        if record['ai'] is not None:
+            match.ai = AIPlayer(record['ai'], ruleset=match.ruleset)
+            match.ai_addr = ('ai', match.id)
+        for state in record['players']:
+            addr = match.ai_addr if state['addr'] is None else tuple(state['addr'])
+            player = make_player(addr, state['id'], state['token'], match.ruleset)
+            player.load_state(state)
+            player.ready = state['ready']
+            match.players[addr] = player
+            if addr == match.ai_addr:
+                continue
+            self.addr_matches[addr] = match
+            self.sessions[player.token] = match
+            if state['protocol'] != PROTOCOL_JSON:
+                self.peer_codecs[addr] = state['protocol']
+            if state.get('batch') and self.outbox is not None:
+                self.batch_peers.add(addr)
+        if match.ai is not None:
+            self._restore_ai_memory(match)
+        self.matches[match.id] = match
+        return match
+    
+    def _restore_ai_memory(self, match):
+        """O que a IA sabe é o radar dela sobre o humano (sempre um tabuleiro denso)"""
+        target = match.opponent_of(match.players[match.ai_addr])
+        sunk = [(ship.mask, ship.size) for ship in target.ships if ship.is_sunk()]
+        sunk_mask = target._sunk_mask()
+        match.ai.load(target.shot_mask & ~target.fleet_mask,
+                      target.shot_mask & target.fleet_mask & ~sunk_mask, sunk)
     
     def _send_to_client(self, addr, message):
-        """Envia mensagem para um cliente"""
+        """Envia mensagem para um cliente, no protocolo negociado"""
+        self._send_raw(addr, encode(message, self.peer_codecs.get(addr, PROTOCOL_JSON)))
+    
+    def _send_raw(self, addr, data):
+        """Envia um datagrama já codificado (ou o deixa no lote do par)"""
+        if addr in self.batch_peers:
+            self.outbox.add(addr, data)
+            return
+        self._transmit(addr, data)
+    
+    def _transmit(self, addr, data):
+        """Um sendto: o envelope da camada confiável vai em volta do lote inteiro"""
+        if self.reliable.has_channel(addr):
+            data = self.reliable.wrap(addr, data)
         try:
-            self.sock.sendto(json.dumps(message).encode(), addr)
+            self.sock.sendto(data, addr)
+            self.metrics.count('datagrams_sent')
         except Exception as e:
+            self.metrics.count('datagrams_dropped_out')
             logging.error(f"❌ Erro ao enviar para {addr}: {e}")
     
-    def _broadcast(self, message):
-        """Envia mensagem para todos os jogadores"""
-        for addr in self.players.keys():
-            self._send_to_client(addr, message)
+    def _broadcast(self, match, message):
+        """Envia mensagem para todos os jogadores da partida"""
+        # Codificar uma única vez por protocolo
+        encoded = {}
+        for addr in match.players.keys():
+            if addr == match.ai_addr:
+                continue
+            protocol = self.peer_codecs.get(addr, PROTOCOL_JSON)
+            data = encoded.get(protocol)
+            if data is None:
+                data = encoded[protocol] = encode(message, protocol)
+            self._send_raw(addr, data)
+        
+        if self.spectators.is_watched(match.id):
+            # Os eventos já são seguros para espectadores (nada de navios intactos)
+            data = encoded.get(PROTOCOL_JSON) or encode(message)
+            self.spectators.publish(match.id, data, lambda: self._spectator_view(match))
     
-    def _send_error(self, addr, error_msg):
+    def _send_error(self, addr, code):
         """Envia mensagem de erro"""
-        self._send_to_client(addr, {'type': 'error', 'message': error_msg})
+        self._send_to_client(addr, {'type': 'error', 'code': code})
     
-    def _send_game_state(self, addr):
+    def _send_game_state(self, match, addr):
         """Envia estado do jogo para jogador reconectado"""
-        player = self.players.get(addr)
+        player = match.players.get(addr)
         if player:
             self._send_to_client(addr, {
                 'type': 'game_state',
-                'game_state': self.game_state,
+                'game_state': match.game_state,
                 'player_id': player.id,
-                'current_turn': self.current_turn
+                'match_id': match.id,
+                'current_turn': match.current_turn
             })
 
+def setup_logging(level, log_format='text', log_mode='async', log_queue=LOG_CAPACITY,
+                  log_sample=None, worker=None):
+    """Configura o logger raiz e, no modo async, a thread de escrita do log"""
+    prefix = '' if worker is None else f'[w{worker}] '
+    fmt = '%(message)s' if log_format == 'json' else f'%(asctime)s - {prefix}%(message)s'
+    logging.basicConfig(level=level, format=fmt)
+    context = None if worker is None else {'worker': worker}
+    log.configure(log_queue, parse_sample(log_sample), log_format, context)
+    if log_mode == 'async':
+        log.start()
+
+
+def run_worker(host, port, mode, workers, worker_index, worker_count, log_level,
+               journal_dir=None, snapshot_path=None, snapshot_interval=SNAPSHOT_INTERVAL,
+               metrics_port=None, profile_dir='.', rate_scale=1.0,
+               ingress_limit=INGRESS_LIMIT, shed_policy='oldest', ratings_path=None,
+               batch_window=None, batch_budget=BATCH_BUDGET, log_format='text',
+               log_mode='async', log_queue=LOG_CAPACITY, log_sample=None):
+    """Ponto de entrada de cada processo do shard"""
+    setup_logging(log_level, log_format, log_mode, log_queue, log_sample,
+                  worker=worker_index)
+    server = BattleShipServer(host, port, worker_index, worker_count, journal_dir=journal_dir,
+                              snapshot_path=snapshot_path, snapshot_interval=snapshot_interval,
+                              metrics_port=metrics_port, profile_dir=profile_dir,
+                              rate_scale=rate_scale, ingress_limit=ingress_limit,
+                              shed_policy=shed_policy, ratings_path=ratings_path,
+                              batch_window=batch_window, batch_budget=batch_budget)
+    if mode == 'async':
+        server.start_async(workers)
+    else:
+        server.start(workers)
+
+def run_sharded(host, port, mode, workers, processes, log_level, journal_dir=None,
+                snapshot_path=None, snapshot_interval=SNAPSHOT_INTERVAL, metrics_port=None,
+                profile_dir='.', rate_scale=1.0, ingress_limit=INGRESS_LIMIT,
+                shed_policy='oldest', ratings_path=None, batch_window=None,
+                batch_budget=BATCH_BUDGET, log_format='text', log_mode='async',
+                log_queue=LOG_CAPACITY, log_sample=None):
+    """Sobe N processos na mesma porta UDP (SO_REUSEPORT)"""
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise SystemExit("❌ SO_REUSEPORT não disponível neste sistema")
+    procs = [
+        multiprocessing.Process(target=run_worker,
+                                args=(host, port, mode, workers, i, processes, log_level,
+                                      journal_dir, snapshot_path, snapshot_interval,
+                                      metrics_port, profile_dir, rate_scale,
+                                      ingress_limit, shed_policy, ratings_path,
+                                      batch_window, batch_budget, log_format, log_mode,
+                                      log_queue, log_sample),
+                                daemon=True)
+        for i in range(processes)
+    ]
+    for proc in procs:
+        proc.start()
+    
+    # SIGTERM no launcher também encerra os workers
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for proc in procs:
+            proc.join()
+    except (KeyboardInterrupt, SystemExit):
+        for proc in procs:
+            proc.terminate()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor BATTLESHI.PY")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--mode', choices=['threaded', 'async'], default='threaded',
+                        help="threaded: pool de threads atrás de uma fila limitada; "
+                             "async: event loop asyncio")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="tamanho do pool de threads (handlers no threaded, "
+                             "mensagens lentas no async)")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="número de processos compartilhando a porta (sharding por partida)")
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--log-format', choices=LOG_FORMATS, default='text',
+                        help="text: as mensagens de sempre; json: uma linha com os campos por evento")
+    parser.add_argument('--log-mode', choices=['async', 'sync'], default='async',
+                        help="async: formatação e escrita numa thread própria; "
+                             "sync: na thread do handler")
+    parser.add_argument('--log-queue', type=int, default=LOG_CAPACITY,
+                        help="registros na fila do log antes de descartar")
+    parser.add_argument('--log-sample', action='append', metavar='EVENTO=N',
+                        help="registra 1 a cada N eventos desse nome ou nível (ex.: shot=100, "
+                             "INFO=10); pode repetir")
+    parser.add_argument('--journal', metavar='DIR',
+                        help="grava um diário binário por partida neste diretório")
+    parser.add_argument('--snapshot', metavar='FILE',
+                        help="restaura as partidas deste arquivo ao iniciar e o regrava periodicamente")
+    parser.add_argument('--snapshot-interval', type=float, default=SNAPSHOT_INTERVAL,
+                        help="segundos entre snapshots")
+    parser.add_argument('--metrics-port', type=int,
+                        help="métricas em texto do Prometheus em http://127.0.0.1:PORTA/metrics "
+                             "(com vários processos, PORTA + índice do worker)")
+    parser.add_argument('--rate-scale', type=float, default=1.0,
+                        help="multiplica os limites por endereço e tipo de mensagem (0 desliga)")
+    parser.add_argument('--ingress-limit', type=int, default=INGRESS_LIMIT,
+                        help="datagramas na fila de entrada por prioridade (modo threaded)")
+    parser.add_argument('--shed', choices=['oldest', 'busy'], default='oldest',
+                        help="fila cheia: descartar o mais antigo ou recusar com erro busy")
+    parser.add_argument('--ratings', metavar='FILE',
+                        help="notas da fila ranqueada (Glicko), carregadas e regravadas neste arquivo")
+    parser.add_argument('--batch-window', type=float, metavar='MS',
+                        help="junta os envios a cada par em lotes de até MS ms "
+                             "(0: só o que cada mensagem recebida produz; sem a opção, desligado)")
+    parser.add_argument('--batch-budget', type=int, default=BATCH_BUDGET, metavar='BYTES',
+                        help="tamanho máximo de um lote")
+    parser.add_argument('--profile-dir', default='.',
+                        help="onde gravar as amostragens pedidas por mensagem profile ou SIGUSR1")
+    args = parser.parse_args(argv)
+    
+    if args.journal:
+        os.makedirs(args.journal, exist_ok=True)
+    
+    if args.processes > 1:
+        run_sharded(args.host, args.port, args.mode, args.workers,
+                    args.processes, args.log_level.upper(), args.journal,
+                    args.snapshot, args.snapshot_interval, args.metrics_port,
+                    args.profile_dir, args.rate_scale, args.ingress_limit, args.shed,
+                    args.ratings, args.batch_window, args.batch_budget, args.log_format,
+                    args.log_mode, args.log_queue, args.log_sample)
+        return
+    
+    setup_logging(args.log_level.upper(), args.log_format, args.log_mode, args.log_queue,
+                  args.log_sample)
+    server = BattleShipServer(args.host, args.port, journal_dir=args.journal,
+                              snapshot_path=args.snapshot,
+                              snapshot_interval=args.snapshot_interval,
+                              metrics_port=args.metrics_port,
+                              profile_dir=args.profile_dir,
+                              rate_scale=args.rate_scale,
+                              ingress_limit=args.ingress_limit,
+                              shed_policy=args.shed,
+                              ratings_path=args.ratings,
+                              batch_window=args.batch_window,
+                              batch_budget=args.batch_budget)
+    if args.mode == 'async':
+        server.start_async(args.workers)
+    else:
+        server.start(args.workers)
+
 if __name__ == "__main__":
-    server = BattleShipServer()
-    server.start()
\ No newline at end of file
+    main()
\ No newline at end of file
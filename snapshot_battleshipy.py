@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import logging
+import threading
+
+# Snapshot das partidas vivas: uma linha JSON de cabeçalho e uma por partida.
+# O arquivo é sempre substituído inteiro (temporário + fsync + rename), então
+# um crash no meio da gravação deixa o snapshot anterior intacto.
+SNAPSHOT_FORMAT = 'bss1'
+SNAPSHOT_INTERVAL = 1.0
+
+
+class SnapshotError(ValueError):
+    """Arquivo que não é um snapshot válido"""
+
+
+class Snapshotter:
+    """Grava periodicamente todas as partidas do servidor, fora do caminho dos lances.
+
+    Cada partida tem um contador de versão, incrementado a cada mensagem que
+    a altera. Só as partidas com versão nova são copiadas (com o lock da
+    partida, em tipos simples) e recodificadas (já sem o lock); as demais
+    reaproveitam a linha da passada anterior. Os jogadores esperam no máximo
+    a cópia de uma partida, nunca a escrita do arquivo.
+    """
+
+    def __init__(self, server, path, interval=SNAPSHOT_INTERVAL):
+        self.server = server
+        self.path = path
+        self.interval = interval
+        self.lines = {}  # match_id -> (versão, linha codificada)
+        self.stop_event = threading.Event()
+        self.written = 0
+        self.encoded = 0  # Partidas recodificadas desde o início
+        self.last_duration = 0.0
+
+    def snapshot(self):
+        """Uma passada: recodifica o que mudou e regrava o arquivo se preciso.
+
+        Devolve quantas partidas foram recodificadas.
+        """
+        started = time.perf_counter()
+        server = self.server
+        with server.lock:
+            matches = list(server.matches.values())
+            next_match_id = server.next_match_id
+            open_ids = {match.id for match in server.open_matches.values()}
+        changed = len(matches) != len(self.lines)
+        encoded = 0
+        for match in matches:
+            cached = self.lines.get(match.id)
+            if cached is not None and cached[0] == match.version:
+                continue
+            with match.lock:
+                version = match.version
+                record = server._match_record(match)
+            self.lines[match.id] = (version, json.dumps(record).encode() + b'\n')
+            encoded += 1
+        if not encoded and not changed and self.written:
+            return 0
+        if len(self.lines) > len(matches):
+            live = {match.id for match in matches}
+            for match_id in [m for m in self.lines if m not in live]:
+                del self.lines[match_id]
+
+        header = {'format': SNAPSHOT_FORMAT, 'next_match_id': next_match_id,
+                  'open': sorted(open_ids), 'matches': len(self.lines), 'time': time.time()}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(header).encode() + b'\n')
+            f.writelines(line for _, line in self.lines.values())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.written += 1
+        self.encoded += encoded
+        self.last_duration = time.perf_counter() - started
+        return encoded
+
+    def start(self):
+        thread = threading.Thread(target=self._run, daemon=True, name='battleshipy-snapshot')
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Encerra a thread com uma última passada"""
+        self.stop_event.set()
+        try:
+            self.snapshot()
+        except OSError as e:
+            logging.error(f"❌ Erro ao gravar o snapshot final: {e}")
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.snapshot()
+            except Exception as e:
+                logging.error(f"❌ Erro ao gravar o snapshot {self.path}: {e}")
+
+
+def read_snapshot(path):
+    """(cabeçalho, registros das partidas) de um snapshot.
+
+    As linhas das partidas são decodificadas numa única chamada, como um
+    array JSON; se alguma estiver truncada, cai para linha a linha e a
+    ignora, como o registro final do diário.
+    """
+    with open(path, 'rb') as f:
+        lines = f.read().split(b'\n')
+    try:
+        header = json.loads(lines[0])
+    except ValueError as e:
+        raise SnapshotError(f"cabeçalho inválido em {path}: {e}") from e
+    if not isinstance(header, dict) or header.get('format') != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"não é um snapshot: {path}")
+    lines = [line for line in lines[1:] if line]
+    try:
+        return header, json.loads(b'[' + b','.join(lines) + b']')
+    except ValueError:
+        pass
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            logging.warning(f"⚠️ Linha truncada ignorada no snapshot {path}")
+    return header, records
@@ -0,0 +1,240 @@
+import socket
+import threading
+import logging
+import time
+from collections import deque
+from protocol_battleshipy import encode
+
+FEED_LIMIT = 4096        # Eventos guardados por partida para espectadores atrasados
+KEYFRAME_INTERVAL = 64   # Uma visão completa da partida a cada N eventos
+MAX_LAG = 256            # Espectador mais atrasado que isso pula para a última visão completa
+BATCH = 32               # Eventos por espectador a cada passada
+YIELD_EVERY = 256        # Envios entre pausas para as threads dos jogadores
+SPECTATOR_TTL = 30.0     # Sem renovar o spectate, o espectador é esquecido
+MAX_SPECTATORS = 1024    # Espectadores por partida
+MAX_DELAY = 300.0
+SEND_FLAGS = getattr(socket, 'MSG_DONTWAIT', 0)  # Envio não bloqueante sem mudar o socket
+
+
+class Spectator:
+    __slots__ = ('addr', 'delay', 'cursor', 'seen')
+
+    def __init__(self, addr, delay):
+        self.addr = addr
+        self.delay = delay    # Segundos de atraso da transmissão
+        self.cursor = None    # Próximo seq a enviar (None até a primeira visão completa)
+        self.seen = time.monotonic()
+
+
+class Feed:
+    """Eventos já codificados de uma partida, numerados continuamente.
+
+    Só a thread de envio remove eventos do início e só ela lê os eventos
+    pelo seq. O lock do feed (curto, quase sem disputa) só impede que um
+    descarte caia entre o cálculo do seq de uma visão completa e o seu append.
+    """
+    __slots__ = ('lock', 'events', 'base', 'keyframes', 'since_keyframe', 'spectators')
+
+    def __init__(self):
+        self.lock = threading.Lock()  # append/append_keyframe contra trim
+        self.events = []          # (instante, datagrama)
+        self.base = 0             # seq de events[0]
+        self.keyframes = deque()  # (instante, seq) das visões completas
+        self.since_keyframe = 0
+        self.spectators = {}      # addr -> Spectator
+
+    def append(self, data, now=None):
+        with self.lock:
+            self.events.append((time.monotonic() if now is None else now, data))
+
+    def append_keyframe(self, data, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.keyframes.append((now, self.base + len(self.events)))
+            self.events.append((now, data))
+        self.since_keyframe = 0
+
+    def keyframe_before(self, due):
+        """seq da visão completa mais recente publicada até `due`"""
+        for stamp, seq in reversed(self.keyframes):
+            if stamp <= due and seq >= self.base:
+                return seq
+        return None
+
+    def trim(self):
+        """Descarta eventos antigos além de FEED_LIMIT (só na thread de envio)"""
+        if len(self.events) <= FEED_LIMIT:
+            return
+        with self.lock:
+            excess = len(self.events) - FEED_LIMIT
+            del self.events[:excess]
+            self.base += excess
+            while self.keyframes and self.keyframes[0][1] < self.base:
+                self.keyframes.popleft()
+
+
+class SpectatorHub:
+    """Transmite as partidas a espectadores sem atrasar os jogadores.
+
+    Cada evento é codificado uma única vez e anexado ao feed da partida. Uma
+    thread própria envia, em lotes e sem bloquear, os eventos já vencidos para
+    cada espectador (instante do evento + atraso pedido). Quem fica para trás
+    não recebe a fila inteira: pula para a última visão completa da partida.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.feeds = {}  # match_id -> Feed
+        self.lock = threading.Lock()  # Protege feeds e espectadores, não os eventos
+        self.wakeup = threading.Event()
+        self.running = False
+        self.sent = 0
+        self.skipped = 0  # Saltos para a visão completa (espectadores atrasados)
+
+    def is_watched(self, match_id):
+        return match_id in self.feeds
+
+    def subscribe(self, match_id, addr, delay, keyframe):
+        """Inscreve (ou renova) um espectador; keyframe() monta a visão completa.
+
+        Chamado com o lock da partida, como publish. Devolve o atraso aceito,
+        ou None se a partida já tem MAX_SPECTATORS espectadores.
+        """
+        delay = min(max(0.0, delay), MAX_DELAY)
+        with self.lock:
+            feed = self.feeds.get(match_id)
+            if feed is None:
+                feed = self.feeds[match_id] = Feed()
+                feed.append_keyframe(encode(keyframe()))
+            spectator = feed.spectators.get(addr)
+            if spectator is None:
+                if len(feed.spectators) >= MAX_SPECTATORS:
+                    return None
+                spectator = feed.spectators[addr] = Spectator(addr, delay)
+            spectator.delay = delay
+            spectator.seen = time.monotonic()
+        self.wakeup.set()
+        return delay
+
+    def unsubscribe(self, match_id, addr):
+        with self.lock:
+            feed = self.feeds.get(match_id)
+            if feed is not None:
+                feed.spectators.pop(addr, None)
+
+    def drop(self, match_id):
+        """Encerra a transmissão de uma partida desfeita"""
+        with self.lock:
+            self.feeds.pop(match_id, None)
+
+    def publish(self, match_id, data, keyframe):
+        """Anexa um evento já codificado (chamado com o lock da partida)"""
+        feed = self.feeds.get(match_id)
+        if feed is None:
+            return
+        feed.append(data)
+        feed.since_keyframe += 1
+        if feed.since_keyframe >= KEYFRAME_INTERVAL:
+            feed.append_keyframe(encode(keyframe()))
+        self.wakeup.set()
+
+    def start(self):
+        self.running = True
+        thread = threading.Thread(target=self._run, daemon=True, name='battleshipy-spectators')
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def _run(self):
+        last_expire = time.monotonic()
+        while self.running:
+            # Com espectadores atrasados, eventos vencem mesmo sem publicações novas
+            self.wakeup.wait(0.01 if self.feeds else 1.0)
+            self.wakeup.clear()
+            now = time.monotonic()
+            try:
+                self.pump(now)
+                if now - last_expire > 1.0:
+                    last_expire = now
+                    self.expire(now)
+            except Exception as e:
+                logging.error(f"❌ Erro ao transmitir para espectadores: {e}")
+
+    def pump(self, now=None):
+        """Uma passada de envio por todos os espectadores; devolve quantos envios"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            feeds = [(feed, list(feed.spectators.values())) for feed in self.feeds.values()]
+        sent = 0
+        next_yield = YIELD_EVERY
+        for feed, spectators in feeds:
+            feed.trim()
+            for spectator in spectators:
+                batch = self._due(feed, spectator, now)
+                for data in batch:
+                    try:
+                        self.sock.sendto(data, SEND_FLAGS, spectator.addr)
+                    except BlockingIOError:
+                        # Buffer do socket cheio: os jogadores têm prioridade,
+                        # o resto fica para a próxima passada
+                        self.sent += sent
+                        return sent
+                    except OSError as e:
+                        logging.debug(f"Espectador {spectator.addr} inacessível: {e}")
+                        break
+                    spectator.cursor += 1
+                    sent += 1
+                if sent >= next_yield:
+                    # Devolver o GIL aos jogadores entre os lotes
+                    next_yield = sent + YIELD_EVERY
+                    time.sleep(0)
+        self.sent += sent
+        return sent
+
+    def _due(self, feed, spectator, now):
+        """Próximos eventos vencidos para um espectador, no máximo BATCH"""
+        due = now - spectator.delay
+        end = feed.base + len(feed.events)
+        cursor = spectator.cursor
+        if cursor is None or cursor < feed.base:
+            # Primeira vez, ou os eventos dele já saíram do feed
+            keyframe = feed.keyframe_before(due)
+            if keyframe is None:
+                return []
+            if cursor is not None:
+                self.skipped += 1
+            spectator.cursor = cursor = keyframe
+        elif end - cursor > MAX_LAG:
+            # Atrasado demais: pular para a última visão completa já vencida
+            keyframe = feed.keyframe_before(due)
+            if keyframe is not None and keyframe > cursor:
+                self.skipped += 1
+                spectator.cursor = cursor = keyframe
+        events = feed.events
+        batch = []
+        index = cursor - feed.base
+        while index < len(events) and len(batch) < BATCH:
+            stamp, data = events[index]
+            if stamp > due:
+                break
+            batch.append(data)
+            index += 1
+        return batch
+
+    def expire(self, now=None):
+        """Esquece espectadores que não renovaram e partidas sem espectadores"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            for match_id, feed in list(self.feeds.items()):
+                for addr, spectator in list(feed.spectators.items()):
+                    if now - spectator.seen > SPECTATOR_TTL:
+                        del feed.spectators[addr]
+                if not feed.spectators:
+                    del self.feeds[match_id]
+
+    def count(self, match_id):
+        feed = self.feeds.get(match_id)
+        return len(feed.spectators) if feed is not None else 0
@@ -0,0 +1,89 @@
+from collections import deque
+from itertools import islice
+
+# Hash Zobrist do estado visível de uma partida: cada tiro (atirador, célula,
+# resultado) tem uma chave de 64 bits e o hash é o XOR das chaves de todos os
+# tiros desde o início (ou o último reinício). Atualizar custa um XOR, a ordem
+# dos tiros não importa, e os dois jogadores e espectadores veem o mesmo hash.
+# As chaves saem de um splitmix64 do tiro, sem tabela, então valem para
+# qualquer tamanho de tabuleiro.
+ZOBRIST_SEED = 0x6261747473686970  # "battship"
+MASK64 = (1 << 64) - 1
+MARKS = {'erro': 0, 'acerto': 1, 'afundado': 2}
+
+SYNC_HISTORY = 1024  # Tiros guardados por partida para responder deltas
+SYNC_BATCH = 32      # Tiros por resposta de sync (o resto vem no próximo pedido)
+
+
+def zobrist_key(shooter, x, y, result):
+    """Chave de 64 bits de um tiro"""
+    z = (ZOBRIST_SEED + (shooter << 44 | x << 24 | y << 4 | MARKS[result])
+         * 0x9E3779B97F4A7C15) & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+class ShotLog:
+    """Lado do servidor: sequência, hash e últimos tiros de uma partida.
+
+    Cada shot_result leva o seq e o hash depois do tiro; um cliente que
+    perdeu algum pede só os tiros depois do último seq que conhece.
+    """
+    __slots__ = ('seq', 'hash', 'events')
+
+    def __init__(self, seq=0, hash=0, limit=SYNC_HISTORY):
+        self.seq = seq
+        self.hash = hash
+        self.events = deque(maxlen=limit)  # shot_results, o último com seq == self.seq
+
+    def reset(self):
+        self.seq = 0
+        self.hash = 0
+        self.events.clear()
+
+    def append(self, event):
+        """Registra um shot_result, preenchendo nele o seq e o hash"""
+        self.seq += 1
+        self.hash ^= zobrist_key(event['shooter'], event['x'], event['y'], event['result'])
+        event['seq'] = self.seq
+        event['hash'] = self.hash
+        self.events.append(event)
+
+    def since(self, seq, limit=SYNC_BATCH):
+        """Os tiros depois de seq, ou None se o histórico não chega até lá"""
+        first = self.seq - len(self.events) + 1  # seq do tiro mais antigo guardado
+        if not isinstance(seq, int) or seq > self.seq or seq + 1 < first:
+            return None
+        start = seq + 1 - first
+        return list(islice(self.events, start, start + limit))
+
+
+class ShotTracker:
+    """Lado do cliente: confere o seq e o hash de cada shot_result"""
+    __slots__ = ('seq', 'hash')
+
+    def __init__(self, seq=0, hash=0):
+        self.seq = seq
+        self.hash = hash
+
+    def reset(self, seq=0, hash=0):
+        self.seq = seq
+        self.hash = hash
+
+    def check(self, message):
+        """'apply' para aplicar, 'old' já aplicado, 'gap' se faltam tiros antes
+        deste, 'desync' se o hash divergiu (o tiro é aplicado mesmo assim)"""
+        seq = message.get('seq')
+        if seq is None:
+            return 'apply'  # Servidor antigo ou replay: sem conferência
+        if seq <= self.seq:
+            return 'old'
+        if seq > self.seq + 1:
+            return 'gap'
+        self.seq = seq
+        self.hash ^= zobrist_key(message['shooter'], message['x'], message['y'], message['result'])
+        return 'apply' if self.hash == message['hash'] else 'desync'
+
+    def matches(self, seq, hash):
+        return self.seq == seq and self.hash == hash
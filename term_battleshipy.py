@@ -0,0 +1,413 @@
+import os
+import sys
+import time
+import heapq
+import select
+import argparse
+from itertools import count
+from protocol_battleshipy import PROTOCOL_JSON, SUPPORTED_PROTOCOLS
+from rules_battleshipy import RULESETS
+from core_battleshipy import ClientCore, NOTIFY_MS
+
+MAX_DATAGRAMS = 256  # Datagramas lidos por volta antes de olhar o teclado e os timers
+
+# Cores do client_battleshipy em SGR de 16 cores
+SGR = {
+    'accent': '1;36',
+    'accent2': '1;35',
+    'text': '37',
+    'grid': '90',
+    'ship': '32',
+    'hit': '1;31',
+    'miss': '34',
+    'sunk': '1;33',
+}
+
+# Cada célula tem dois caracteres; os símbolos são os da legenda do cliente gráfico
+CELLS = {
+    ' ': ('· ', SGR['grid']),
+    'S': ('▓▓', SGR['ship']),
+    'X': ('▒▒', SGR['hit']),
+    'O': ('░░', SGR['miss']),
+    'D': ('██', SGR['sunk']),
+}
+
+KEYS = {
+    b'\x1b[A': 'up', b'\x1bOA': 'up', b'k': 'up',
+    b'\x1b[B': 'down', b'\x1bOB': 'down', b'j': 'down',
+    b'\x1b[C': 'right', b'\x1bOC': 'right', b'l': 'right',
+    b'\x1b[D': 'left', b'\x1bOD': 'left', b'h': 'left',
+    b' ': 'fire', b'\r': 'fire', b'\n': 'fire',
+    b'a': 'place', b'r': 'restart', b'q': 'quit', b'\x0c': 'redraw',
+}
+MOVES = {'up': (-1, 0), 'down': (1, 0), 'left': (0, -1), 'right': (0, 1)}
+
+# Linhas da tela (1-based)
+TITLE_ROW, STATUS_ROW, NOTICE_ROW, BOARD_TITLE_ROW = 1, 2, 3, 5
+GAP = 6  # Colunas entre os dois tabuleiros
+
+
+def move(row, col):
+    return f"\x1b[{row};{col}H"
+
+
+class TerminalBoard:
+    """Tabuleiro no terminal: moldura escrita uma vez, depois só as células que mudam.
+
+    update() devolve as sequências ANSI das células alteradas; células
+    vizinhas na mesma linha e com a mesma cor saem sem novo posicionamento
+    do cursor nem nova cor.
+    """
+
+    def __init__(self, top, left, size, show_ships, title):
+        self.top = top    # Linha das coordenadas de coluna
+        self.left = left  # Coluna das coordenadas de linha
+        self.size = size
+        self.show_ships = show_ships
+        self.title = title
+        self.invalidate()
+
+    def invalidate(self):
+        self.drawn = [[None] * self.size for _ in range(self.size)]
+
+    def static(self):
+        """Título e coordenadas (letras só enquanto o alfabeto basta)"""
+        n = self.size
+        parts = [move(self.top - 1, self.left + 2), f"\x1b[{SGR['accent']}m{self.title}\x1b[0m",
+                 move(self.top, self.left + 2), f"\x1b[{SGR['text']}m",
+                 ''.join(f"{i + 1:<2}" for i in range(n))]
+        for i in range(n):
+            label = chr(ord('A') + i) if n <= 26 else str(i + 1)
+            parts.append(f"{move(self.top + 1 + i, self.left)}{label:<2}")
+        parts.append("\x1b[0m")
+        return ''.join(parts)
+
+    def update(self, board, cursor=None):
+        """(sequências, células alteradas) para levar board à tela"""
+        parts = []
+        changed = 0
+        at = None   # Onde o cursor do terminal está depois da última escrita
+        sgr = None  # Cor em vigor
+        for i in range(self.size):
+            row = board[i]
+            drawn = self.drawn[i]
+            for j in range(self.size):
+                content = row[j]
+                if content == 'S' and not self.show_ships:
+                    content = ' '
+                cell = (content, cursor == (i, j))
+                if cell == drawn[j]:
+                    continue
+                drawn[j] = cell
+                changed += 1
+                glyph, color = CELLS[content]
+                if cell[1]:
+                    color += ';7'  # Cursor: vídeo reverso
+                position = (self.top + 1 + i, self.left + 2 + 2 * j)
+                if position != at:
+                    parts.append(move(*position))
+                if color != sgr:
+                    parts.append(f"\x1b[0;{color}m")
+                    sgr = color
+                parts.append(glyph)
+                at = (position[0], position[1] + 2)
+        if parts:
+            parts.append("\x1b[0m")
+        return parts, changed
+
+
+class TerminalBattleship(ClientCore):
+    """Interface de terminal (ANSI) sobre o ClientCore.
+
+    Um só loop de select cuida do socket, do teclado e dos timers, sem
+    thread de rede nem tkinter. O join sai antes de a tela ser montada, e
+    cada quadro é uma única escrita com só as células, o status e o aviso
+    que mudaram.
+    """
+
+    def __init__(self, server_addr=('127.0.0.1', 12345), protocol=PROTOCOL_JSON,
+                 reliable=False, resume_token=None, ai_difficulty=None, frame_stats=False,
+                 rules=None, spectate=None, delay=0.0, ranked=None):
+        super().__init__(server_addr, protocol, reliable, resume_token, ai_difficulty,
+                         frame_stats, rules, spectate, delay, ranked)
+        self.timers = []  # (instante, ordem, callback)
+        self.order = count()
+        self.running = False
+        self.out = []     # Sequências do quadro em montagem
+        self.fd = sys.stdout.fileno()
+        self.cursor = (0, 0)
+        self.controls = {'place': False, 'restart': False}
+        self.status = "🔄 CONECTANDO AO SERVIDOR..."
+        self.notice = None  # (texto, cor)
+        self.notice_deadline = None
+        self.notice_count = 0
+        self.session_token = None
+        self.bytes_written = 0
+        self.writes = 0
+        self.boards_resized()
+        self.connect_to_server()
+
+    # Ganchos do ClientCore
+
+    def schedule(self, ms, callback):
+        heapq.heappush(self.timers, (time.monotonic() + ms / 1000, next(self.order), callback))
+
+    def start_listener(self):
+        pass  # O socket entra no select do run()
+
+    def draw_status(self, text):
+        self.status = text
+        self.out.append(f"{move(STATUS_ROW, 1)}\x1b[2K\x1b[{SGR['text']}m{text}\x1b[0m")
+
+    def draw_boards(self, waited=None):
+        started = time.perf_counter()
+        watching = self.spectate_match is not None
+        cursor = None if watching else self.cursor
+        mine, changed = self.player_view.update(self.my_board)
+        radar, radar_changed = self.opponent_view.update(self.opponent_board, cursor)
+        self.out += mine
+        self.out += radar
+        self.flush()
+        if self.frame_timer is not None:
+            self.frame_timer.record(time.perf_counter() - started, changed + radar_changed, waited)
+
+    def boards_resized(self):
+        size = self.ruleset.board_size
+        watching = self.spectate_match is not None
+        top = BOARD_TITLE_ROW + 1
+        self.player_view = TerminalBoard(top, 1, size, True,
+                                         "JOGADOR 1" if watching else "MEU TABULEIRO")
+        self.opponent_view = TerminalBoard(top, 2 * size + 3 + GAP, size, False,
+                                           "JOGADOR 2" if watching else "RADAR INIMIGO")
+        self.cursor = (min(self.cursor[0], size - 1), min(self.cursor[1], size - 1))
+        if self.running:
+            self.redraw()
+
+    def set_controls(self, place=None, restart=None):
+        if place is not None:
+            self.controls['place'] = place
+        if restart is not None:
+            self.controls['restart'] = restart
+        if self.running:
+            self.out.append(self.help_line())
+
+    def notify(self, text, color):
+        """Aviso na linha abaixo do status, que some sozinho; repetidos viram contagem"""
+        if self.notice is not None and text == self.notice[0]:
+            self.notice_count += 1
+        else:
+            self.notice_count = 1
+        self.notice = (text, color)
+        self.notice_deadline = time.monotonic() + NOTIFY_MS / 1000
+        self.schedule(NOTIFY_MS, self.hide_notice)
+        if self.running:
+            self.out.append(self.notice_line())
+
+    def hide_notice(self):
+        if self.notice is None or time.monotonic() < self.notice_deadline:
+            return  # Um aviso mais novo renovou o prazo
+        self.notice = None
+        self.out.append(self.notice_line())
+
+    def show_session(self, token):
+        self.session_token = token
+        self.notify(f"🔑 Sessão: {token}", 'accent')
+
+    # Tela
+
+    def notice_line(self):
+        text = ''
+        if self.notice is not None:
+            label, color = self.notice
+            if self.notice_count > 1:
+                label = f"{label} (x{self.notice_count})"
+            text = f"\x1b[{SGR[color]}m{label}\x1b[0m"
+        return f"{move(NOTICE_ROW, 1)}\x1b[2K{text}"
+
+    def help_line(self):
+        row = BOARD_TITLE_ROW + self.ruleset.board_size + 3
+        if self.spectate_match is not None:
+            keys = "q sair"
+        else:
+            keys = "setas/hjkl mirar  espaço atirar"
+            if self.controls['place']:
+                keys += "  a navios aleatórios"
+            if self.controls['restart']:
+                keys += "  r reiniciar"
+            keys += "  q sair"
+        return f"{move(row, 1)}\x1b[2K\x1b[{SGR['grid']}m{keys}\x1b[0m"
+
+    def redraw(self):
+        """Tela inteira de novo (início, Ctrl-L, terminal redimensionado)"""
+        self.out.append(f"\x1b[0m\x1b[2J{move(TITLE_ROW, 1)}"
+                        f"\x1b[{SGR['accent']}m🚢 BATTLESHI.PY 🚢\x1b[0m")
+        for board in (self.player_view, self.opponent_view):
+            board.invalidate()
+            self.out.append(board.static())
+        self.out.append(self.help_line())
+        self.out.append(self.notice_line())
+        self.pending_status = self.pending_status or self.status
+        self.request_redraw()
+
+    def flush(self):
+        """Escreve de uma vez tudo o que a volta do loop produziu"""
+        if not self.out:
+            return
+        data = ''.join(self.out).encode()
+        self.out = []
+        self.writes += 1
+        self.bytes_written += len(data)
+        while data:
+            data = data[os.write(self.fd, data):]
+
+    # Teclado
+
+    def handle_keys(self, data):
+        while data:
+            for prefix, action in KEYS.items():
+                if data.startswith(prefix):
+                    data = data[len(prefix):]
+                    self.handle_action(action)
+                    break
+            else:
+                data = data[1:]  # Tecla sem ação
+
+    def handle_action(self, action):
+        if action == 'quit':
+            self.running = False
+        elif action == 'redraw':
+            self.redraw()
+        elif action == 'place':
+            self.place_random_ships()
+        elif action == 'restart':
+            if self.controls['restart']:
+                self.restart_game()
+        elif self.spectate_match is not None:
+            return
+        elif action == 'fire':
+            self.fire(*self.cursor)
+        else:
+            dx, dy = MOVES[action]
+            size = self.ruleset.board_size
+            self.cursor = ((self.cursor[0] + dx) % size, (self.cursor[1] + dy) % size)
+            self.request_redraw()
+
+    # Loop
+
+    def run(self):
+        """Loop de select até 'q' ou Ctrl-C; devolve o terminal como estava"""
+        import signal
+        import termios
+        import tty
+        stdin = sys.stdin.fileno()
+        saved = termios.tcgetattr(stdin)
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_w, False)
+        previous_handler = signal.signal(signal.SIGWINCH, lambda *_: None)
+        previous_wakeup = signal.set_wakeup_fd(wakeup_w)
+        self.sock.setblocking(False)
+        try:
+            tty.setcbreak(stdin)
+            self.out.append("\x1b[?1049h\x1b[?25l")  # Tela alternativa, sem cursor
+            self.running = True
+            self.redraw()
+            self.loop(stdin, wakeup_r)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.running = False
+            self.out.append("\x1b[0m\x1b[?25h\x1b[?1049l")
+            self.flush()
+            termios.tcsetattr(stdin, termios.TCSADRAIN, saved)
+            signal.set_wakeup_fd(previous_wakeup)
+            signal.signal(signal.SIGWINCH, previous_handler)
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+        if self.session_token:
+            print(f"🔑 Sessão: {self.session_token} (use --resume para voltar à partida)")
+        if self.frame_timer is not None:
+            print(self.frame_timer.summary())
+            print(f"📟 {self.writes} escritas no terminal, "
+                  f"{self.bytes_written / max(1, self.writes):.0f} bytes em média")
+
+    def loop(self, stdin, wakeup):
+        sock = self.sock
+        timers = self.timers
+        while self.running:
+            timeout = None
+            if timers:
+                timeout = max(0.0, timers[0][0] - time.monotonic())
+            readable, _, _ = select.select([sock, stdin, wakeup], [], [], timeout)
+            if sock in readable:
+                self.read_socket()
+            if stdin in readable:
+                self.handle_keys(os.read(stdin, 64))
+            if wakeup in readable:
+                os.read(wakeup, 64)
+                self.redraw()  # SIGWINCH: o terminal mudou de tamanho
+            now = time.monotonic()
+            while timers and timers[0][0] <= now:
+                heapq.heappop(timers)[2]()
+            self.flush()
+
+    def read_socket(self):
+        """Esvazia o socket; a rajada inteira vira um quadro"""
+        for _ in range(MAX_DATAGRAMS):
+            try:
+                data = self.sock.recv(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self.show_error(f"Erro: {e}")
+                return
+            if self.oldest is None:
+                self.oldest = time.perf_counter()
+            try:
+                messages = self.receive(data)
+            except Exception as e:
+                self.show_error(f"Erro: {e}")
+                continue
+            for message in messages:
+                self.handle_server_message(message)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cliente BATTLESHI.PY de terminal")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--protocol', choices=SUPPORTED_PROTOCOLS, default=PROTOCOL_JSON,
+                        help="bin1: frames binários compactos negociados no join")
+    parser.add_argument('--reliable', action='store_true',
+                        help="entrega confiável (seq, acks e retransmissão) sobre UDP")
+    parser.add_argument('--resume', metavar='TOKEN',
+                        help="volta a uma partida em andamento com o token da sessão")
+    parser.add_argument('--ai', metavar='DIFICULDADE',
+                        help="joga sozinho contra a IA do servidor (easy, medium, hard)")
+    parser.add_argument('--frame-stats', action='store_true',
+                        help="mede quadros e bytes escritos no terminal e mostra ao sair")
+    # Só tabuleiros densos cabem na tela; os esparsos ficam para os bots
+    parser.add_argument('--rules', choices=[name for name, rs in RULESETS.items() if not rs.sparse],
+                        help="regras da partida (tamanho do tabuleiro e frota)")
+    parser.add_argument('--spectate', type=int, metavar='MATCH_ID',
+                        help="assiste a uma partida em andamento, sem navios intactos")
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help="atraso da transmissão para espectadores, em segundos")
+    parser.add_argument('--ranked', metavar='NOME',
+                        help="entra na fila ranqueada e é pareado com alguém de nota próxima")
+    args = parser.parse_args(argv)
+    if args.ai is not None:
+        # A IA (e as tabelas de frotas que ela usa) só é importada se for pedida
+        from ai_battleshipy import DIFFICULTIES
+        if args.ai not in DIFFICULTIES:
+            parser.error(f"--ai: escolha entre {', '.join(DIFFICULTIES)}")
+    if not sys.stdin.isatty() or not sys.stdout.isatty():
+        parser.error("precisa de um terminal interativo")
+
+    game = TerminalBattleship((args.host, args.port), args.protocol, args.reliable, args.resume,
+                              args.ai, args.frame_stats, args.rules, args.spectate, args.delay,
+                              args.ranked)
+    game.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import logging
+import random
+import time
+import unittest
+
+from fleet_battleshipy import random_fleet_positions
+from protocol_battleshipy import decode, encode, ERR_INVALID_TOKEN
+from rules_battleshipy import DEFAULT_RULESET
+from server_battleshipy import BattleShipServer, MATCH_FINISHED_TTL, PEER_TIMEOUT
+
+PLAYERS = [('127.0.0.1', 30001), ('127.0.0.1', 30002)]
+
+
+class MatchTeardownTest(unittest.TestCase):
+    """Partidas encerradas ou abandonadas saem do registro do servidor"""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.server = BattleShipServer(port=0)
+        self.sent = []  # (addr, mensagem) na ordem de envio
+        self.server._send_raw = lambda addr, data: self.sent.append((addr, decode(data)))
+        self.random = random.Random(7)
+
+    def tearDown(self):
+        self.server.sock.close()
+        logging.disable(logging.NOTSET)
+
+    def send(self, addr, message):
+        self.server._handle_message(encode(message), addr)
+        return [m for a, m in self.sent if a == addr][-1] if self.sent else None
+
+    def replies(self, addr, msg_type):
+        return [m for a, m in self.sent if a == addr and m.get('type') == msg_type]
+
+    def start_match(self):
+        first = self.send(PLAYERS[0], {'type': 'join', 'private': True})
+        self.send(PLAYERS[1], {'type': 'join', 'match_id': first['match_id']})
+        match = self.server.matches[first['match_id']]
+        for addr in PLAYERS:
+            self.send(addr, {'type': 'place_ships', 'match_id': match.id,
+                             'ships': random_fleet_positions(DEFAULT_RULESET, self.random)})
+        self.assertEqual(match.game_state, "playing")
+        return match
+
+    def play_to_end(self, match):
+        cells = {player_id: iter(self.random.sample(range(100), 100)) for player_id in (1, 2)}
+        while match.game_state == "playing":
+            x, y = divmod(next(cells[match.current_turn]), 10)
+            self.send(PLAYERS[match.current_turn - 1],
+                      {'type': 'shoot', 'x': x, 'y': y, 'match_id': match.id})
+
+    def assertReleased(self, match):
+        self.assertNotIn(match.id, self.server.matches)
+        for addr, player in match.players.items():
+            self.assertIsNot(self.server.addr_matches.get(addr), match)
+            self.assertNotIn(player.token, self.server.sessions)
+
+    def test_join_after_game_over_gets_fresh_match(self):
+        match = self.start_match()
+        self.play_to_end(match)
+        token = match.players[PLAYERS[0]].token
+
+        reply = self.send(PLAYERS[0], {'type': 'join', 'private': True})
+
+        self.assertEqual(reply['type'], 'join_success')
+        self.assertNotEqual(reply['match_id'], match.id)
+        self.assertEqual(reply['player_id'], 1)
+        self.assertReleased(match)
+        self.assertEqual(self.server.stats_report()['counters']['matches_closed'], 1)
+        self.send(('127.0.0.1', 30009), {'type': 'resume', 'token': token})
+        self.assertEqual(self.replies(('127.0.0.1', 30009), 'error')[-1]['code'],
+                         ERR_INVALID_TOKEN)
+
+    def test_join_during_game_keeps_match(self):
+        match = self.start_match()
+
+        reply = self.send(PLAYERS[0], {'type': 'join', 'private': True})
+
+        self.assertEqual(reply['type'], 'game_state')
+        self.assertEqual(reply['match_id'], match.id)
+        self.assertIn(match.id, self.server.matches)
+
+    def test_finished_match_reaped_after_ttl(self):
+        match = self.start_match()
+        self.play_to_end(match)
+        now = time.monotonic()
+
+        self.assertEqual(self.server._reap_matches(now), 0)
+        self.assertEqual(self.server._reap_matches(now + MATCH_FINISHED_TTL + 1), 1)
+        self.assertReleased(match)
+
+    def test_silent_peer_times_out(self):
+        match = self.start_match()
+        now = time.monotonic()
+        match.players[PLAYERS[0]].last_seen = now + PEER_TIMEOUT  # Só o jogador 2 sumiu
+
+        self.assertEqual(self.server._reap_matches(now + PEER_TIMEOUT - 1), 0)
+        self.assertEqual(self.server._reap_matches(now + PEER_TIMEOUT + 1), 1)
+        self.assertReleased(match)
+
+
+if __name__ == '__main__':
+    unittest.main()
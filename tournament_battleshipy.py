@@ -0,0 +1,361 @@
+import os
+import sys
+import json
+import time
+import math
+import random
+import argparse
+import itertools
+import multiprocessing
+from ai_battleshipy import AIPlayer, DIFFICULTIES, neighbor_masks, counter_add
+from board_battleshipy import cell_bit
+from fleet_battleshipy import fleet_sampler, fleet_positions, fleet_mask
+from rules_battleshipy import RULESETS, parse_rules
+from server_battleshipy import make_player
+
+# Torneios offline: partidas entre estratégias de tiro e estilos de frota,
+# jogadas com o Player do servidor (place_ships, take_shot, has_lost), sem
+# sockets. Os jogos são divididos em lotes entre processos e cada lote
+# devolve só estatísticas agregadas, nunca as partidas.
+STRATEGIES = ('random',) + DIFFICULTIES
+LAYOUTS = ('uniform', 'edges', 'apart')
+LAYOUT_SAMPLES = 16  # Frotas uniformes sorteadas para escolher a mais "no estilo"
+CHUNK_GAMES = 250
+PROGRESS_INTERVAL = 2.0
+
+
+class RandomShooter:
+    """Tiros uniformes entre as células ainda não atiradas: a linha de base"""
+    __slots__ = ('random', 'cells', 'order')
+
+    def __init__(self, seed=None, ruleset=None):
+        size = ruleset.board_size
+        self.random = random.Random(seed)
+        self.cells = [(x, y) for x in range(size) for y in range(size)]
+        self.reset()
+
+    def reset(self):
+        self.order = self.cells[:]
+        self.random.shuffle(self.order)
+
+    def observe(self, x, y, result, ship_size=None):
+        pass
+
+    def next_shot(self):
+        return self.order.pop()
+
+
+def make_strategy(name, seed, ruleset):
+    if name == 'random':
+        return RandomShooter(seed, ruleset)
+    return AIPlayer(name, seed, ruleset)
+
+
+class FleetLayout:
+    """Sorteia frotas de um estilo de posicionamento.
+
+    'uniform' é o gerador do servidor; os outros sorteiam LAYOUT_SAMPLES
+    frotas uniformes e ficam com a mais encostada nas bordas ('edges') ou
+    com menos navios se tocando ('apart').
+    """
+
+    def __init__(self, name, ruleset, rng):
+        if name not in LAYOUTS:
+            raise ValueError(f"estilo de frota desconhecido: {name}")
+        self.name = name
+        self.rng = rng
+        self.sampler = fleet_sampler(ruleset)
+        size = ruleset.board_size
+        self.border = 0
+        for i in range(size):
+            for x, y in ((i, 0), (i, size - 1), (0, i), (size - 1, i)):
+                self.border |= cell_bit(x, y, size)
+        self.neighbors = neighbor_masks(size)
+
+    def fleet(self):
+        if self.name == 'uniform':
+            return self.sampler.random_fleet(self.rng)
+        fleets = self.sampler.sample_fleets(LAYOUT_SAMPLES, self.rng)
+        if self.name == 'edges':
+            border = self.border
+            return max(fleets, key=lambda fleet: bin(fleet_mask(fleet) & border).count('1'))
+        return min(fleets, key=self._touching)
+
+    def _touching(self, fleet):
+        """Navios com alguma célula vizinha de outro navio"""
+        occupied = fleet_mask(fleet)
+        neighbors = self.neighbors
+        touching = 0
+        for ship in fleet:
+            halo = 0
+            cells = ship
+            while cells:
+                low = cells & -cells
+                halo |= neighbors[low.bit_length() - 1]
+                cells ^= low
+            if halo & occupied & ~ship:
+                touching += 1
+        return touching
+
+
+def parse_entrant(value):
+    """'estratégia[:estilo]' -> (estratégia, estilo)"""
+    strategy, _, layout = value.partition(':')
+    layout = layout or 'uniform'
+    if strategy not in STRATEGIES or layout not in LAYOUTS:
+        raise argparse.ArgumentTypeError(
+            f"participante inválido: {value} (estratégias {', '.join(STRATEGIES)}; "
+            f"estilos {', '.join(LAYOUTS)})")
+    return strategy, layout
+
+
+def entrant_name(entrant):
+    return ':'.join(entrant)
+
+
+def planes_counts(planes, cells):
+    """Contadores fatiados por bit (counter_add) -> lista de contagens por célula"""
+    counts = [0] * cells
+    for k, plane in enumerate(planes):
+        while plane:
+            low = plane & -plane
+            counts[low.bit_length() - 1] += 1 << k
+            plane ^= low
+    return counts
+
+
+class MatchupStats:
+    """Agregado de um confronto A x B; lotes se somam com merge()"""
+    __slots__ = ('cells', 'games', 'wins', 'first_wins', 'win_shots', 'win_shots_sq',
+                 'lengths', 'hits', 'shots', 'cpu')
+
+    def __init__(self, cells):
+        self.cells = cells
+        self.games = 0
+        self.wins = [0, 0]
+        self.first_wins = 0            # Vitórias de quem começou atirando
+        self.win_shots = [0, 0]        # Tiros do vencedor, somados por lado
+        self.win_shots_sq = [0, 0]
+        self.lengths = [[0] * (cells + 1), [0] * (cells + 1)]  # Tiros até vencer
+        self.hits = [[0] * cells, [0] * cells]   # Acertos recebidos pela frota de cada lado
+        self.shots = [[0] * cells, [0] * cells]  # Tiros disparados por cada lado
+        self.cpu = 0.0
+
+    def merge(self, other):
+        self.games += other.games
+        self.first_wins += other.first_wins
+        self.cpu += other.cpu
+        for side in (0, 1):
+            self.wins[side] += other.wins[side]
+            self.win_shots[side] += other.win_shots[side]
+            self.win_shots_sq[side] += other.win_shots_sq[side]
+            for name in ('lengths', 'hits', 'shots'):
+                mine, theirs = getattr(self, name)[side], getattr(other, name)[side]
+                for i, value in enumerate(theirs):
+                    mine[i] += value
+
+    def win_rate(self, side):
+        return self.wins[side] / self.games if self.games else 0.0
+
+    def mean_shots(self, side):
+        return self.win_shots[side] / self.wins[side] if self.wins[side] else 0.0
+
+    def median_shots(self, side):
+        target = (self.wins[side] + 1) // 2
+        seen = 0
+        for shots, count in enumerate(self.lengths[side]):
+            seen += count
+            if seen >= target and count:
+                return shots
+        return 0
+
+    def to_dict(self, names):
+        result = {'games': self.games, 'first_mover_win_rate': self.first_wins / max(1, self.games),
+                  'cpu_seconds': self.cpu}
+        for side, name in enumerate(names):
+            wins = self.wins[side]
+            mean = self.mean_shots(side)
+            variance = self.win_shots_sq[side] / wins - mean ** 2 if wins else 0.0
+            result[f"side{side + 1}"] = {
+                'entrant': name, 'wins': wins, 'win_rate': self.win_rate(side),
+                'mean_shots_to_win': mean, 'stdev_shots_to_win': math.sqrt(max(0.0, variance)),
+                'median_shots_to_win': self.median_shots(side),
+                'hits_received': self.hits[side], 'shots_fired': self.shots[side],
+            }
+        return result
+
+
+def play_chunk(task):
+    """Joga um lote de partidas de um confronto; devolve (índice, MatchupStats)"""
+    index, entrants, rules, games, seed, offset = task
+    started = time.process_time()
+    ruleset = parse_rules(rules)
+    cells = ruleset.board_size ** 2
+    rng = random.Random(seed)
+    sides = [(make_strategy(strategy, rng.random(), ruleset), FleetLayout(layout, ruleset, rng))
+             for strategy, layout in entrants]
+    players = [make_player(None, 1, ruleset=ruleset), make_player(None, 2, ruleset=ruleset)]
+    stats = MatchupStats(cells)
+    hit_planes = ([], [])
+    shot_planes = ([], [])
+    board_size = ruleset.board_size
+
+    for game in range(offset, offset + games):
+        for player, (shooter, layout) in zip(players, sides):
+            if not player.place_ships(fleet_positions(layout.fleet(), board_size)):
+                raise RuntimeError(f"frota {layout.name} recusada por place_ships")
+            shooter.reset()
+        # Quem começa alterna, para não misturar a vantagem do primeiro tiro
+        turn = first = game % 2
+        shots = [0, 0]
+        while True:
+            shooter = sides[turn][0]
+            target = players[1 - turn]
+            x, y = shooter.next_shot()
+            result, ship = target.take_shot(x, y)
+            shooter.observe(x, y, result, ship.size if ship else None)
+            shots[turn] += 1
+            if result == 'erro':
+                turn = 1 - turn
+            elif target.has_lost():
+                break
+
+        stats.games += 1
+        stats.wins[turn] += 1
+        stats.first_wins += turn == first
+        stats.win_shots[turn] += shots[turn]
+        stats.win_shots_sq[turn] += shots[turn] ** 2
+        stats.lengths[turn][shots[turn]] += 1
+        for side, player in enumerate(players):
+            counter_add(hit_planes[side], player.shot_mask & player.fleet_mask)
+            counter_add(shot_planes[1 - side], player.shot_mask)
+
+    for side in (0, 1):
+        stats.hits[side] = planes_counts(hit_planes[side], cells)
+        stats.shots[side] = planes_counts(shot_planes[side], cells)
+    stats.cpu = time.process_time() - started
+    return index, stats
+
+
+def tasks(matchups, rules, games, seed, chunk):
+    """Lotes de todos os confrontos, gerados sob demanda"""
+    for index, entrants in enumerate(matchups):
+        for offset in range(0, games, chunk):
+            yield (index, entrants, rules, min(chunk, games - offset),
+                   seed * 1000003 + index * 7919 + offset, offset)
+
+
+def run_tournament(matchups, rules='classic', games=1000, processes=None, seed=1,
+                   chunk=CHUNK_GAMES, progress=None):
+    """Joga todos os confrontos em paralelo; devolve ([MatchupStats], segundos)"""
+    ruleset = parse_rules(rules)
+    if ruleset.sparse:
+        raise ValueError("o simulador usa as estratégias da IA, só para tabuleiros densos")
+    processes = processes or os.cpu_count() or 1
+    results = [MatchupStats(ruleset.board_size ** 2) for _ in matchups]
+    total = games * len(matchups)
+    done = 0
+    started = time.perf_counter()
+    reported = started
+    work = tasks(matchups, rules, games, seed, chunk)
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        chunks = pool.imap_unordered(play_chunk, work) if pool else map(play_chunk, work)
+        for index, stats in chunks:
+            results[index].merge(stats)
+            done += stats.games
+            now = time.perf_counter()
+            if progress is not None and now - reported >= PROGRESS_INTERVAL:
+                reported = now
+                progress(done, total, now - started)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return results, time.perf_counter() - started
+
+
+def format_heatmap(counts, games, board_size):
+    """Grade com a porcentagem de partidas em que cada célula foi atingida"""
+    lines = ['    ' + ''.join(f"{y:>4}" for y in range(board_size))]
+    for x in range(board_size):
+        row = counts[x * board_size:(x + 1) * board_size]
+        lines.append(f"{x:>4}" + ''.join(f"{100 * c / max(1, games):4.0f}" for c in row))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Torneio offline entre estratégias de tiro e estilos de frota")
+    parser.add_argument('entrants', nargs='*', type=parse_entrant,
+                        default=[('hard', 'uniform'), ('medium', 'uniform')],
+                        help="estratégia[:estilo], ex.: hard:edges random medium:apart; "
+                             "todos jogam contra todos")
+    parser.add_argument('--games', type=int, default=10000, help="partidas por confronto")
+    parser.add_argument('--rules', choices=[name for name, rs in RULESETS.items() if not rs.sparse],
+                        default='classic')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk', type=int, default=CHUNK_GAMES, help="partidas por lote")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--heatmap', action='store_true',
+                        help="mostra onde cada participante foi atingido e onde atirou")
+    parser.add_argument('--json', metavar='FILE', help="grava todas as estatísticas em JSON")
+    args = parser.parse_args(argv)
+    if len(args.entrants) < 2:
+        parser.error("são precisos pelo menos dois participantes")
+
+    matchups = list(itertools.combinations(args.entrants, 2))
+    ruleset = parse_rules(args.rules)
+
+    def progress(done, total, elapsed):
+        print(f"⏳ {done}/{total} partidas, {done / elapsed:.0f}/s", file=sys.stderr)
+
+    results, elapsed = run_tournament(matchups, args.rules, args.games, args.processes,
+                                      args.seed, args.chunk, progress)
+
+    print(f"{'A':>14} {'B':>14} {'partidas':>9} {'vitórias A':>14} {'tiros A':>8} "
+          f"{'tiros B':>8} {'1º a atirar':>11}")
+    for (a, b), stats in zip(matchups, results):
+        rate = stats.win_rate(0)
+        margin = 1.96 * math.sqrt(rate * (1 - rate) / max(1, stats.games))
+        print(f"{entrant_name(a):>14} {entrant_name(b):>14} {stats.games:>9} "
+              f"{rate:7.1%} ±{margin:5.1%} {stats.mean_shots(0):8.1f} {stats.mean_shots(1):8.1f} "
+              f"{stats.first_wins / max(1, stats.games):11.1%}")
+
+    games = sum(stats.games for stats in results)
+    cpu = sum(stats.cpu for stats in results)
+    print(f"🏁 {games} partidas em {elapsed:.1f}s: {games / elapsed:.0f} partidas/s com "
+          f"{args.processes} processos, {games / max(cpu, 1e-9):.0f} partidas/s por núcleo")
+
+    if args.heatmap:
+        size = ruleset.board_size
+        for entrant in args.entrants:
+            hits = [0] * size * size
+            shots = [0] * size * size
+            played = 0
+            for (a, b), stats in zip(matchups, results):
+                for side, who in enumerate((a, b)):
+                    if who == entrant:
+                        played += stats.games
+                        hits = [h + c for h, c in zip(hits, stats.hits[side])]
+                        shots = [s + c for s, c in zip(shots, stats.shots[side])]
+            print(f"\n🎯 {entrant_name(entrant)}: % das partidas em que cada célula da "
+                  f"frota foi atingida")
+            print(format_heatmap(hits, played, size))
+            print(f"🔫 {entrant_name(entrant)}: % das partidas em que atirou em cada célula")
+            print(format_heatmap(shots, played, size))
+
+    if args.json:
+        report = {
+            'rules': args.rules, 'games_per_matchup': args.games, 'seconds': elapsed,
+            'processes': args.processes, 'games_per_second': games / elapsed,
+            'games_per_cpu_second': games / max(cpu, 1e-9),
+            'matchups': [stats.to_dict([entrant_name(a), entrant_name(b)])
+                         for (a, b), stats in zip(matchups, results)],
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f)
+
+
+if __name__ == "__main__":
+    main()